@@ -0,0 +1,742 @@
+# Benchmarks for the Flashcard Tester - run from the same directory as the CSV file
+#   python benchmark.py [rows ...]
+# Notes:
+#   Decks are generated in memory (or in a temporary directory for the Loader),
+#   flashcards.csv is never written to
+#   Uses SDL's dummy video driver so no window is needed
+#   The Session runs the real screens headless, fed with scripted events
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pandas as pd
+import pygame
+from pygame.locals import KEYDOWN, MOUSEBUTTONDOWN, K_1, K_2, K_3, K_4
+from pygame.locals import K_b, K_f, K_j, K_RETURN, K_SPACE
+import flashcards_pygame as fcp
+
+default_sizes = [1_000, 100_000, 1_000_000]
+
+
+# Generates a deck in the flashcards.csv layout with random scores and dates
+def make_deck(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    days_back = rng.integers(0, 30, rows)
+    dates = [(fcp.today - timedelta(days=int(d))).strftime(fcp.date_format)
+             for d in days_back]
+    return pd.DataFrame({
+        "side1": ["word" + str(i) for i in range(rows)],
+        "side2": ["side2"] * rows,
+        "correct": rng.integers(0, 10, rows),
+        "incorrect": rng.integers(0, 10, rows),
+        "prev_corr": rng.integers(0, 2, rows).astype(bool),
+        "last_date": dates,
+    })
+
+
+# Daily Review as it was before it was vectorized - kept as the reference result
+def legacy_daily_review(fc_set, today):
+    corr, incorr, last_date = fc_set.shape[1] - 4, fc_set.shape[1] - 3, fc_set.shape[1] - 1
+    daily_set = []
+    for index in range(fc_set.shape[0]):
+        fc = fc_set.iloc[index]
+        num_tested = fc.iloc[corr] + fc.iloc[incorr]
+        if num_tested == 0:
+            daily_set.append(index)
+        else:
+            perc_corr = fc.iloc[corr] / num_tested
+            last_date_obj = datetime.strptime(fc.iloc[last_date], fcp.date_format)
+            days_since = (today - last_date_obj).days
+            if perc_corr >= 0.90 and days_since >= 5:
+                daily_set.append(index)
+            elif perc_corr >= 0.75 and days_since >= 3:
+                daily_set.append(index)
+            elif perc_corr >= 0.50 and days_since >= 2:
+                daily_set.append(index)
+            elif perc_corr <= 0.50 and days_since >= 1:
+                daily_set.append(index)
+    return daily_set
+
+
+# Vectorized Daily Review - parse once (load time) then one pass over the columns
+def vector_daily_review(fc_set, today):
+    start = time.perf_counter()
+    dates = pd.to_datetime(fc_set["last_date"], format=fcp.date_format,
+                           errors='coerce').to_numpy(dtype='datetime64[D]')
+    parsed = time.perf_counter()
+    due = np.flatnonzero(fcp.due_mask(fc_set["correct"].to_numpy(),
+                                      fc_set["incorrect"].to_numpy(),
+                                      dates, np.datetime64(today.date(), 'D')))
+    return due, parsed - start, time.perf_counter() - parsed
+
+
+def bench_daily_review(sizes):
+    print("daily_review")
+    print(f"{'rows':>10} {'legacy (s)':>12} {'parse (s)':>12} {'review (s)':>12} {'speedup':>10}")
+    for rows in sizes:
+        fc_set = make_deck(rows)
+        start = time.perf_counter()
+        expected = legacy_daily_review(fc_set, fcp.today)
+        legacy_time = time.perf_counter() - start
+        due, parse_time, review_time = vector_daily_review(fc_set, fcp.today)
+        assert due.tolist() == expected, "vectorized daily_review differs from legacy"
+        print(f"{rows:>10} {legacy_time:>12.4f} {parse_time:>12.4f} "
+              f"{review_time:>12.4f} {legacy_time / review_time:>9.0f}x")
+
+
+# Per-card updates & reads - DataFrame.iloc (as before the Card Store) vs Card Store
+def bench_card_store(sizes, updates=10_000):
+    print("Card Store (per card, microseconds)")
+    print(f"{'rows':>10} {'iloc update':>12} {'store update':>13} {'iloc read':>10} "
+          f"{'store read':>11} {'frame MB':>9} {'store MB':>9}")
+    rng = np.random.default_rng(1)
+    for rows in sizes:
+        fc_set = make_deck(rows)
+        store = fcp.CardStore.from_frame(fc_set)
+        ids = rng.integers(0, rows, updates).tolist()
+        corr, prev_corr = fc_set.shape[1] - 4, fc_set.shape[1] - 2
+
+        start = time.perf_counter()
+        for ind in ids:
+            fc_set.iloc[ind, corr] += 1
+            fc_set.iloc[ind, prev_corr] = True
+        iloc_update = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for ind in ids:
+            store.correct[ind] += 1
+            store.prev_corr[ind] = True
+        store_update = time.perf_counter() - start
+        assert (fc_set["correct"].to_numpy() == store.correct[:rows]).all()
+
+        start = time.perf_counter()
+        for ind in ids:
+            fc_set.iloc[ind, 0]
+        iloc_read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for ind in ids:
+            store.side(ind, 0)
+        store_read = time.perf_counter() - start
+
+        frame_mb = fc_set.memory_usage(deep=True).sum() / 2**20
+        store_mb = store.nbytes() / 2**20
+        per_card = 1e6 / updates
+        print(f"{rows:>10} {iloc_update * per_card:>12.2f} {store_update * per_card:>13.2f} "
+              f"{iloc_read * per_card:>10.2f} {store_read * per_card:>11.2f} "
+              f"{frame_mb:>9.1f} {store_mb:>9.1f}")
+
+
+# Loads a deck written to a temporary CSV - all sides in memory vs sides left in the file
+def bench_loader(sizes, reads=1_000):
+    print("Loader")
+    print(f"{'rows':>10} {'mode':>8} {'load (s)':>10} {'resident MB':>12} {'side read (us)':>15}")
+    rng = np.random.default_rng(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.fc_csv_name = os.path.join(tmp, "flashcards.csv")
+        fcp.fc_journal_name = fcp.fc_csv_name + ".journal"
+        for rows in sizes:
+            make_deck(rows).to_csv(fcp.fc_csv_name, index=False)
+            ids = rng.integers(0, rows, reads).tolist()
+            for mode, lazy_side_bytes in (("memory", float("inf")), ("lazy", 0)):
+                fcp.lazy_side_bytes = lazy_side_bytes
+                start = time.perf_counter()
+                fcp.load_deck()
+                load_time = time.perf_counter() - start
+                start = time.perf_counter()
+                for ind in ids:
+                    fcp.cards.side(ind, 0)
+                read_time = time.perf_counter() - start
+                print(f"{rows:>10} {mode:>8} {load_time:>10.3f} "
+                      f"{fcp.cards.nbytes() / 2**20:>12.1f} {read_time * 1e6 / reads:>15.2f}")
+                if fcp.cards.text_source is not None:
+                    fcp.cards.text_source.close()
+
+
+# Cold start - pd.read_csv vs opening the Binary Deck, and saving one changed flashcard
+def bench_deck(sizes):
+    print("Binary Deck (seconds)")
+    print(f"{'rows':>10} {'read_csv':>10} {'load_csv':>10} {'import':>10} {'deck open':>10} "
+          f"{'CSV save':>10} {'deck save':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.fc_csv_name = os.path.join(tmp, "flashcards.csv")
+        fcp.fc_journal_name = fcp.fc_csv_name + ".journal"
+        fcp.fc_deck_name = os.path.join(tmp, "flashcards.deck")
+        fcp.lazy_side_bytes = float("inf")
+        for rows in sizes:
+            make_deck(rows).to_csv(fcp.fc_csv_name, index=False)
+            start = time.perf_counter()
+            pd.read_csv(fcp.fc_csv_name)
+            read_csv_time = time.perf_counter() - start
+            start = time.perf_counter()
+            store = fcp.load_csv()
+            load_csv_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fcp.DeckFile.create(fcp.fc_deck_name, store)
+            import_time = time.perf_counter() - start
+            start = time.perf_counter()
+            deck = fcp.DeckFile(fcp.fc_deck_name)
+            deck_store = deck.load_store()
+            open_time = time.perf_counter() - start
+            assert (deck_store.correct == store.correct[:rows]).all()
+            assert deck_store.side(rows - 1, 0) == store.side(rows - 1, 0)
+
+            # Before the journal, every save rewrote the whole CSV
+            store.correct[0] += 1
+            start = time.perf_counter()
+            store.to_frame().to_csv(fcp.fc_csv_name, index=False)
+            csv_save_time = time.perf_counter() - start
+            deck_store.correct[0] += 1
+            start = time.perf_counter()
+            deck.write_card(deck_store, 0)
+            deck.flush()
+            deck_save_time = time.perf_counter() - start
+            deck.close()
+            print(f"{rows:>10} {read_csv_time:>10.3f} {load_csv_time:>10.3f} {import_time:>10.3f} "
+                  f"{open_time:>10.4f} {csv_save_time:>10.3f} {deck_save_time:>10.5f}")
+
+
+# CSV (Card Store in memory) vs SQLite Deck - opening, answers written & committed,
+# the due flashcards and finding a side1
+def bench_sqlite(sizes, answers=1_000, finds=1_000):
+    print("SQLite Deck (seconds, us per answer / find)")
+    print(f"{'rows':>10} {'load_csv':>10} {'migrate':>10} {'db open':>10} {'CSV save':>10} "
+          f"{'db answer':>10} {'due scan':>10} {'due query':>10} {'find scan':>10} "
+          f"{'find query':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.fc_csv_name = os.path.join(tmp, "flashcards.csv")
+        fcp.fc_journal_name = fcp.fc_csv_name + ".journal"
+        fcp.fc_db_name = os.path.join(tmp, "flashcards.db")
+        fcp.lazy_side_bytes = float("inf")
+        for rows in sizes:
+            fc_set = make_deck(rows)
+            fc_set.to_csv(fcp.fc_csv_name, index=False)
+            start = time.perf_counter()
+            store = fcp.load_csv()
+            load_csv_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fcp.SqliteDeck.create(fcp.fc_db_name, store)
+            migrate_time = time.perf_counter() - start
+            start = time.perf_counter()
+            deck = fcp.SqliteDeck(fcp.fc_db_name)
+            db_store = deck.load_store()
+            open_time = time.perf_counter() - start
+            assert (db_store.correct == store.correct[:rows]).all()
+            assert db_store.side(rows - 1, 0) == store.side(rows - 1, 0)
+
+            # Without the journal, every save rewrote the whole CSV
+            start = time.perf_counter()
+            store.write_csv(fcp.fc_csv_name + ".tmp")
+            csv_save_time = time.perf_counter() - start
+            ids = np.arange(answers) % rows
+            start = time.perf_counter()
+            for fc_index in ids.tolist():
+                db_store.correct[fc_index] += 1
+                deck.write_card(db_store, fc_index)
+            deck.flush()
+            answer_time = (time.perf_counter() - start) / answers
+
+            day = np.datetime64(fcp.today.date(), "D")
+            start = time.perf_counter()
+            all_ids = db_store.ids()
+            scan_due = all_ids[fcp.due_mask(db_store.correct[all_ids], db_store.incorrect[all_ids],
+                                            db_store.dates(all_ids), day)]
+            due_scan_time = time.perf_counter() - start
+            start = time.perf_counter()
+            query_due = deck.due_ids(fcp.today_day)
+            due_query_time = time.perf_counter() - start
+            assert np.array_equal(np.sort(query_due), scan_due)
+
+            # Finding a side1 as the game did before the Side1 Index
+            count = min(finds, 100)
+            words = ["WORD" + str(ind) for ind in range(0, rows, max(rows // count, 1))]
+            side1 = fc_set["side1"].str.casefold()
+            start = time.perf_counter()
+            for word in words:
+                np.flatnonzero(side1 == word.casefold())[0]
+            find_scan_time = (time.perf_counter() - start) / len(words)
+            start = time.perf_counter()
+            for word in words:
+                assert deck.find_side1(fcp.side1_key(word)) is not None
+            find_query_time = (time.perf_counter() - start) / len(words)
+            deck.close()
+            print(f"{rows:>10} {load_csv_time:>10.3f} {migrate_time:>10.3f} {open_time:>10.3f} "
+                  f"{csv_save_time:>10.3f} {answer_time * 1e6:>10.1f} {due_scan_time:>10.4f} "
+                  f"{due_query_time:>10.4f} {find_scan_time * 1e6:>10.0f} "
+                  f"{find_query_time * 1e6:>10.1f}")
+
+
+# Time the game waits for a save - compacting on the game thread vs queuing a snapshot
+# for the Save Worker
+def bench_save(sizes):
+    print("Save (seconds the game waits)")
+    print(f"{'rows':>10} {'compact':>10} {'snapshot':>10} {'record':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.fc_csv_name = os.path.join(tmp, "flashcards.csv")
+        fcp.fc_journal_name = fcp.fc_csv_name + ".journal"
+        fcp.fc_deck_name = os.path.join(tmp, "flashcards.deck")
+        fcp.lazy_side_bytes = float("inf")
+        for rows in sizes:
+            make_deck(rows).to_csv(fcp.fc_csv_name, index=False)
+            fcp.cards = fcp.load_csv()
+            fcp.save_worker = fcp.SaveWorker()
+            start = time.perf_counter()
+            fcp.cards.write_csv(fcp.fc_csv_name + ".tmp")
+            compact_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fcp.save_worker.save(fcp.cards.snapshot())
+            snapshot_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for ind in range(fcp.journal_batch):
+                fcp.journal_card(ind)
+            fcp.save()
+            record_time = (time.perf_counter() - start) / fcp.journal_batch
+            fcp.save_worker.stop()
+            assert fcp.save_worker.error is None
+            print(f"{rows:>10} {compact_time:>10.3f} {snapshot_time:>10.4f} {record_time:>10.6f}")
+
+
+# Picking the next flashcard - rebuilding the Daily Review vs the SM-2 Scheduler's heap
+def bench_scheduler(sizes, answers=1_000):
+    print("SM-2 Scheduler")
+    print(f"{'rows':>10} {'heap build (s)':>15} {'review rebuild (us)':>20} {'heap next (us)':>15}")
+    for rows in sizes:
+        fcp.cards = fcp.CardStore.from_frame(make_deck(rows))
+        start = time.perf_counter()
+        fcp.build_due_cache()
+        rebuild_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scheduler = fcp.SM2Scheduler()
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for ind in range(answers):
+            fc_index = scheduler.peek_due()
+            if fc_index is None:
+                break
+            assert fcp.cards.due_date[fc_index] <= fcp.today_day
+            scheduler.answer(fc_index, ind % 4 != 0)
+        next_time = (time.perf_counter() - start) / (ind + 1)
+        print(f"{rows:>10} {build_time:>15.3f} {rebuild_time * 1e6:>20.0f} {next_time * 1e6:>15.2f}")
+
+
+# Peak resident memory of this process in MB (None where it can't be measured)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+# Scripted events - each frame is the list of events pygame.event.get() returns
+def key_frame(key, text=""):
+    return [pygame.event.Event(KEYDOWN, key=key, mod=0, unicode=text)]
+
+
+def click_frame(button):
+    return [pygame.event.Event(MOUSEBUTTONDOWN, button=1, pos=button.rect.center)]
+
+
+# Types text into a Textbox, one key per frame
+def type_frames(text):
+    return [key_frame(ord(char), char) for char in text]
+
+
+# Flips and answers flashcards with hot keys - every 4th is incorrect,
+# and every 10th answer is taken back and answered again
+def answer_frames(answers):
+    frames = []
+    for ind in range(answers):
+        frames.append(key_frame(K_SPACE))
+        frames.append(key_frame(K_f if ind % 4 == 0 else K_j))
+        if ind % 10 == 9:
+            frames += [key_frame(K_b), key_frame(K_j)]
+    return frames
+
+
+# Session - (first screen, frames) for each part of a scripted session
+#   Test All & Daily Review - from the Home Screen, answers flashcards with hot keys
+#   Round - answers 20 flashcards with the buttons, continues with the incorrect
+#   ones, then goes home (and saves)
+#   Add - types every side of new flashcards and confirms them
+#   Remove - types side1 of a flashcard, finds it, flips it and removes it
+def session_script(answers, edits, rng):
+    round_frames = []
+    for ind in range(20):
+        round_frames.append(click_frame(fcp.incorr_b if ind % 4 == 0 else fcp.corr_b))
+    round_frames.append(click_frame(fcp.cont_b))
+    round_frames += [click_frame(fcp.corr_b)] * 5 + [click_frame(fcp.home_b)]
+
+    add_frames = []
+    for ind in range(edits):
+        add_frames.append(key_frame(K_2))
+        for side in range(len(fcp.cards.side_names)):
+            add_frames += type_frames(f"new{ind}_{side}") + [key_frame(K_RETURN)]
+        add_frames.append(key_frame(K_RETURN))
+
+    remove_frames = []
+    for fc_index in rng.choice(fcp.cards.ids(), edits, replace=False).tolist():
+        remove_frames.append(key_frame(K_3))
+        remove_frames += type_frames(fcp.cards.side(fc_index, 0))
+        remove_frames += [key_frame(K_RETURN), key_frame(K_SPACE), key_frame(K_RETURN),
+                          click_frame(fcp.home_b)]
+
+    return [
+        ("Test All", fcp.HomeScreen, [key_frame(K_1)] + answer_frames(answers)),
+        ("Daily Review", fcp.HomeScreen, [key_frame(K_4)] + answer_frames(answers)),
+        ("Round", lambda: fcp.TestScreen(fcp.cards.ids()[:20]), round_frames),
+        ("Add", fcp.HomeScreen, add_frames),
+        ("Remove", fcp.HomeScreen, remove_frames),
+    ]
+
+
+# Runs the screens like run_screens(), posting each frame's events to pygame first
+#   Returns the time taken by each frame and the number of events posted
+def run_session(phases):
+    frame_times = []
+    events = 0
+    for name, first, frames in phases:
+        current = first()
+        for frame in frames:
+            for event in frame:
+                pygame.event.post(event)
+            start = time.perf_counter()
+            current = current.update(pygame.event.get())
+            current.draw()
+            frame_times.append(time.perf_counter() - start)
+            events += len(frame)
+    return np.array(frame_times), events
+
+
+# Scripted session over the real screens - no frame cap, so frames are as fast as
+# the game can handle them
+def bench_session(sizes, answers=1_000, edits=20):
+    print("Session (headless, scripted events)")
+    print(f"{'rows':>10} {'frames':>7} {'events/s':>9} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'p99 ms':>7} {'max ms':>7} {'save p50 ms':>12} {'save max ms':>12} "
+          f"{'exit (s)':>9} {'peak MB':>8}")
+    rng = np.random.default_rng(3)
+    fcp.fps_cap = fcp.menu_fps_cap = 0
+    # Generated decks only have side1 & side2
+    fcp.fc_front_ind, fcp.fc_back_ind = [0], [1]
+    fcp.init_fonts()
+    fcp.init_screen()
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.fc_csv_name = os.path.join(tmp, "flashcards.csv")
+        fcp.fc_journal_name = fcp.fc_csv_name + ".journal"
+        fcp.fc_deck_name = os.path.join(tmp, "flashcards.deck")
+        for rows in sizes:
+            make_deck(rows).to_csv(fcp.fc_csv_name, index=False)
+            fcp.load_deck()
+            frame_times, events = run_session(session_script(answers, edits, rng))
+            start = time.perf_counter()
+            fcp.close_deck()
+            exit_time = time.perf_counter() - start
+            assert fcp.save_worker.error is None
+            # The last save is the one made on exit
+            save_times = np.array(fcp.save_worker.save_latencies)[:-1] * 1000
+            frame_ms = np.percentile(frame_times * 1000, [50, 95, 99])
+            peak = peak_rss_mb()
+            print(f"{rows:>10} {len(frame_times):>7} {events / frame_times.sum():>9.0f} "
+                  f"{frame_ms[0]:>7.2f} {frame_ms[1]:>7.2f} {frame_ms[2]:>7.2f} "
+                  f"{frame_times.max() * 1000:>7.2f} {np.median(save_times):>12.2f} "
+                  f"{save_times.max():>12.2f} {exit_time:>9.3f} "
+                  f"{'-' if peak is None else f'{peak:.0f}':>8}")
+
+
+# Adding flashcards - one at a time (as the Add Screen does) vs a Bulk Import of a TSV
+def bench_bulk(sizes, singles=10_000):
+    print("Bulk Import (cards/sec)")
+    print(f"{'rows':>10} {'one at a time':>14} {'bulk':>10} {'bulk (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.fc_csv_name = os.path.join(tmp, "flashcards.csv")
+        fcp.fc_journal_name = fcp.fc_csv_name + ".journal"
+        fcp.fc_deck_name = os.path.join(tmp, "flashcards.deck")
+        tsv_name = os.path.join(tmp, "words.tsv")
+        for rows in sizes:
+            make_deck(1).to_csv(fcp.fc_csv_name, index=False)
+            with open(tsv_name, "w", encoding="utf-8") as tsv_file:
+                tsv_file.writelines(f"new{ind}\tside2 {ind}\n" for ind in range(rows))
+            fcp.load_deck()
+            count = min(rows, singles)
+            start = time.perf_counter()
+            for ind in range(count):
+                fcp.add_card([f"single{ind}", "side2", 0, 0, False, fcp.today_format])
+                fcp.save()
+            single_time = time.perf_counter() - start
+            added, duplicates, invalid, bulk_time = fcp.bulk_import(tsv_name)
+            assert added == rows and duplicates == invalid == 0
+            fcp.close_deck()
+            print(f"{rows:>10} {count / single_time:>14.0f} {rows / bulk_time:>10.0f} "
+                  f"{bulk_time:>10.3f}")
+
+
+# Text Layout - wrapping long sides (cold) vs the layout cache, and measuring the
+#   text typed so far on every keystroke with font.render vs the Text Width
+def bench_layout(sizes, length=500):
+    fcp.init_fonts()
+    words = ["flashcard", "spaced", "repetition", "review", "deck", "side", "word"]
+    print("Text Layout (us/card, us/keystroke)")
+    print(f"{'rows':>10} {'wrap':>10} {'cached':>10} {'render':>10} {'measure':>10}")
+    for rows in sizes:
+        count = min(rows, 2_000)
+        fc_set = make_deck(count)
+        fc_set["side1"] = [" ".join(words[(ind + num) % len(words)] for num in range(ind % 60))
+                           for ind in range(count)]
+        fcp.cards = fcp.CardStore.from_frame(fc_set)
+        fcp.layout_cache.clear()
+        start = time.perf_counter()
+        for ind in range(count):
+            fcp.card_layout(ind, [0])
+        wrap_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for ind in range(count):
+            fcp.card_layout(ind, [0])
+        cached_time = time.perf_counter() - start
+        text = (" ".join(words) * (length // 10))[:length]
+        start = time.perf_counter()
+        for end in range(1, length + 1):
+            fcp.font.render(text[:end], 1, fcp.text_color).get_size()
+        render_time = time.perf_counter() - start
+        text_width = fcp.TextWidth()
+        start = time.perf_counter()
+        for end in range(1, length + 1):
+            width = text_width.measure(text[:end])
+            text_width.texts.append(text[:end])
+            text_width.widths.append(width)
+        measure_time = time.perf_counter() - start
+        print(f"{rows:>10} {wrap_time / count * 1e6:>10.1f} {cached_time / count * 1e6:>10.1f} "
+              f"{render_time / length * 1e6:>10.1f} {measure_time / length * 1e6:>10.1f}")
+
+
+# Search Index - building the index on its thread, its memory, and a search with a typo
+#   compared with a scan of every side for what was typed
+def bench_search(sizes, queries=100):
+    print("Search Index")
+    print(f"{'rows':>10} {'build (s)':>10} {'index (MB)':>11} {'scan (ms)':>10} "
+          f"{'search (ms)':>12}")
+    syllables = ["ka", "shi", "tsu", "ne", "mo", "ri", "ha", "ya", "ku", "to", "mi", "so"]
+    rng = np.random.default_rng(0)
+    for rows in sizes:
+        fc_set = make_deck(rows)
+        picks = rng.integers(0, len(syllables), (rows, 4))
+        fc_set["side1"] = ["".join(syllables[num] for num in pick) + str(ind)
+                           for ind, pick in enumerate(picks)]
+        fc_set["side2"] = ["".join(syllables[num] for num in pick[::-1]) for pick in picks]
+        fcp.cards = fcp.CardStore.from_frame(fc_set)
+        index = fcp.SearchIndex(fcp.cards)
+        start = time.perf_counter()
+        index.start()
+        index.thread.join()
+        build_time = time.perf_counter() - start
+        index_size = (sum(keys.nbytes + starts.nbytes + postings.nbytes
+                          for keys, starts, postings in index.segments) + index.sizes.nbytes)
+        # A flashcard's side1 with its second & third letters swapped
+        targets = rng.integers(0, rows, queries)
+        typed = []
+        for target in targets:
+            side1 = fcp.cards.side(int(target), 0)
+            typed.append(side1[0] + side1[2] + side1[1] + side1[3:])
+        start = time.perf_counter()
+        for query in typed[:10]:
+            query = query.casefold()
+            [ind for ind, fc_sides in enumerate(fcp.cards.side_rows(fcp.cards.ids()))
+             if any(query in str(side).casefold() for side in fc_sides)]
+        scan_time = (time.perf_counter() - start) / 10
+        found = 0
+        start = time.perf_counter()
+        for target, query in zip(targets, typed):
+            found += int(target) in index.search(query)
+        search_time = (time.perf_counter() - start) / queries
+        assert found >= queries * 0.9
+        print(f"{rows:>10} {build_time:>10.2f} {index_size / 2**20:>11.1f} "
+              f"{scan_time * 1000:>10.1f} {search_time * 1000:>12.2f}")
+
+
+# Session Queue - starting a session and taking its first flashcards in each order,
+#   compared with the list of every row id Test All used to start with
+def bench_queue(sizes, taken=100):
+    print("Session Queue (ms to start & take the first flashcards)")
+    print(f"{'rows':>10} {'list':>10} {'file':>10} {'random':>10} {'weighted':>10} "
+          f"{'filtered':>10}")
+    for rows in sizes:
+        fc_set = make_deck(rows)
+        fc_set["side2"] = np.where(np.arange(rows) % 5 == 0, "verb", "noun")
+        fcp.cards = fcp.CardStore.from_frame(fc_set)
+        start = time.perf_counter()
+        fcp.cards.ids().tolist()[:taken]
+        times = [time.perf_counter() - start]
+        for filters, order in [([], "file"), ([], "random"), ([], "weighted"),
+                               (["side2 = verb", "accuracy < 50"], "random")]:
+            fcp.session_filters, fcp.session_order = filters, order
+            start = time.perf_counter()
+            queue = fcp.session_queue()
+            queue[:taken]
+            times.append(time.perf_counter() - start)
+            expected = np.flatnonzero(fcp.session_mask(filters, fcp.cards))
+            assert np.array_equal(np.sort(queue[:]), expected)
+        fcp.session_filters, fcp.session_order = [], "file"
+        print(f"{rows:>10} " + " ".join(f"{t * 1000:>10.2f}" for t in times))
+
+
+# Deck Stats - the full recompute, an answer updating the running totals compared
+#   with recomputing them, and drawing the charts compared with blitting the cached surface
+def bench_stats(sizes, answers=1_000):
+    fcp.init_fonts()
+    fcp.init_screen()
+    print("Deck Stats")
+    print(f"{'rows':>10} {'build (ms)':>11} {'update (us)':>12} {'recompute (ms)':>15} "
+          f"{'draw (ms)':>10} {'blit (ms)':>10}")
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            fc_set = make_deck(rows)
+            fc_set["side2"] = rng.choice(["noun", "verb", "adj", "adv"], rows)
+            fcp.cards = fcp.CardStore.from_frame(fc_set)
+            fcp.history = fcp.ReviewHistory(os.path.join(tmp, f"{rows}.history"))
+            fcp.stats_tag_side = 1
+            fcp.deck_stats = fcp.DeckStats()
+            start = time.perf_counter()
+            fcp.deck_stats.build()
+            build_time = time.perf_counter() - start
+            picks = rng.integers(0, rows, answers)
+            start = time.perf_counter()
+            for fc_index in picks.tolist():
+                fcp.cards.correct[fc_index] += 1
+                fcp.deck_stats.update(fc_index)
+            update_time = (time.perf_counter() - start) / answers
+            fresh = fcp.DeckStats()
+            start = time.perf_counter()
+            fresh.build()
+            recompute_time = time.perf_counter() - start
+            assert fresh.correct_sum == fcp.deck_stats.correct_sum
+            assert np.array_equal(fresh.accuracy, fcp.deck_stats.accuracy)
+            start = time.perf_counter()
+            fcp.draw_stats()
+            draw_time = time.perf_counter() - start
+            fcp.stats_chart()
+            start = time.perf_counter()
+            for _ in range(10):
+                fcp.screen.blit(fcp.stats_chart(), (0, 0))
+            blit_time = (time.perf_counter() - start) / 10
+            print(f"{rows:>10} {build_time * 1000:>11.1f} {update_time * 1e6:>12.1f} "
+                  f"{recompute_time * 1000:>15.1f} {draw_time * 1000:>10.2f} "
+                  f"{blit_time * 1000:>10.2f}")
+    fcp.stats_tag_side = 4
+
+
+# Media Sides - decoding an image on the game thread compared with queuing it for the
+#   thread pool, and taking a decoded image from the Media Cache, with generated images
+#   (the same for every deck size)
+def bench_media(images=32, image_size=(1600, 1200)):
+    fcp.init_fonts()
+    fcp.init_screen()
+    print("Media Sides (ms per image)")
+    print(f"{'images':>10} {'decode':>10} {'queue':>10} {'cached':>10} {'all ready':>10}")
+    media_dir = fcp.media_dir
+    with tempfile.TemporaryDirectory() as tmp:
+        fcp.media_dir = tmp
+        image = pygame.Surface(image_size)
+        for num in range(images):
+            image.fill((num * 7 % 256, 120, 80))
+            pygame.draw.circle(image, (20, 20, 120), (image_size[0] // 2, image_size[1] // 2),
+                               image_size[1] // 3)
+            pygame.image.save(image, os.path.join(tmp, f"{num}.png"))
+        box = fcp.image_box([("image", "0.png"), None])
+        keys = [("image", f"{num}.png", box) for num in range(images)]
+        start = time.perf_counter()
+        for key in keys:
+            fcp.decode_media(*key)
+        decode_time = time.perf_counter() - start
+        cache = fcp.MediaCache(fcp.media_cache_bytes)
+        start = time.perf_counter()
+        for key in keys:
+            cache.request(key)
+        queue_time = time.perf_counter() - start
+        while cache.pending:
+            cache.poll()
+            time.sleep(0.001)
+        ready_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for key in keys:
+            cache.get(key)
+        cached_time = time.perf_counter() - start
+        assert cache.nbytes <= fcp.media_cache_bytes and not cache.failed
+        cache.close()
+    fcp.media_dir = media_dir
+    print(f"{images:>10} {decode_time / images * 1000:>10.2f} {queue_time / images * 1000:>10.3f} "
+          f"{cached_time / images * 1000:>10.4f} {ready_time * 1000:>10.1f}")
+
+
+# Review History - recording answers, reading the file back and the queries, with as
+#   many events as rows (answers recorded from 10 rows per flashcard)
+def bench_history(sizes, records=100_000):
+    print("Review History")
+    print(f"{'events':>10} {'record (us)':>12} {'read (ms)':>10} {'percentiles (ms)':>17} "
+          f"{'accuracy (ms)':>14} {'file (MB)':>10}")
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"{rows}.history")
+            history = fcp.ReviewHistory(path)
+            count = min(rows, records)
+            cards = rng.integers(0, max(rows // 10, 1), count)
+            start = time.perf_counter()
+            for ind in range(count):
+                history.record(cards[ind], ind % 3 != 0, 0.5, 1.5)
+            history.flush()
+            record_time = time.perf_counter() - start
+            # The rest of the events are written as blocks
+            for block_start in range(count, rows, fcp.history_batch):
+                block_count = min(fcp.history_batch, rows - block_start)
+                with open(path, "ab") as history_file:
+                    fcp.write_history_block(history_file, {
+                        "card": rng.integers(0, max(rows // 10, 1), block_count),
+                        "time": time.time() - rng.random(block_count) * 86400 * 30,
+                        "outcome": rng.choice([-1, 0, 1], block_count, p=[0.01, 0.3, 0.69]),
+                        "flip": rng.random(block_count) * 5,
+                        "answer": rng.random(block_count) * 10})
+            start = time.perf_counter()
+            events = fcp.read_history(path)
+            read_time = time.perf_counter() - start
+            assert len(events["card"]) == rows
+            start = time.perf_counter()
+            fcp.latency_percentiles(events)
+            percentile_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fcp.accuracy_over_time(events)
+            accuracy_time = time.perf_counter() - start
+            print(f"{rows:>10} {record_time / count * 1e6:>12.2f} {read_time * 1000:>10.1f} "
+                  f"{percentile_time * 1000:>17.1f} {accuracy_time * 1000:>14.1f} "
+                  f"{os.path.getsize(path) / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or default_sizes
+    bench_daily_review(sizes)
+    bench_card_store(sizes)
+    bench_loader(sizes)
+    bench_deck(sizes)
+    bench_save(sizes)
+    bench_sqlite(sizes)
+    bench_scheduler(sizes)
+    bench_session(sizes)
+    bench_bulk(sizes)
+    bench_layout(sizes)
+    bench_history(sizes)
+    bench_search(sizes)
+    bench_queue(sizes)
+    bench_stats(sizes)
+    bench_media()
@@ -22,27 +22,1070 @@
 #   Support for Adding Flashcards
 #   Support for Removing Flashcards
 
+# Performance Updates starting 2026.10.18:
+#   Daily Review is vectorized - last_date is parsed once at load time
+#   Due Cache - Home Screen no longer rescans the deck for every event
+#   Review Journal - changes are appended to a log instead of rewriting the CSV
+#   Text Surface Cache - text is only rendered once, not once per event
+#   Renderer - Test and Home Screens draw once per frame, only when something changed
+#   Side1 Index - Remove finds flashcards without a scan, shows suggestions while typing
+#   Card Store - flashcards are kept in typed arrays instead of a DataFrame
+#   Lazy Startup - window opens first, flashcards load in the background
+#   Streaming Loader - very large CSVs only keep the scores in memory
+#   Binary Deck - optional memory-mapped deck file, scores are changed in place
+#   Save Worker - journal & CSV writes happen on a background thread
+#   Screens - one screen object at a time instead of recursive screen functions
+#   SM-2 Scheduler - optional spaced repetition, next flashcard comes from a heap of due dates
+#   Profiling Overlay - F3 shows FPS & phase timings, F4 traces frames, F5 runs cProfile
+#   Deck Library - lists every deck in a directory from a manifest, loads decks when opened
+#   Bulk Import - CSV/TSV/Anki files normalized in a process pool, added & saved in one go
+#   Prefetcher - next flashcards are rendered during idle frames, kept in a ring buffer
+#   Text Layout - long sides wrap & shrink to fit the flashcard, typing measures without rendering
+#   Review History - every answer & how long it took, appended to a columnar file
+#   SQLite Deck - optional database in WAL mode, due flashcards come from an indexed query
+#   Search Index - Remove finds flashcards by any side, typos included, from trigrams
+#   Session Queue - Test All filters by sides & scores, in file, random or weighted order
+#   Deck Stats - Stats Screen charts from running totals, redrawn only when they change
+#   Media Sides - image & sound sides decoded on a thread pool into an LRU cache
+
 # Import Packages
+import time
+import_start = time.perf_counter()     # Start of the Startup Report
+import io
+import os
+import sys
+import re
+import csv
+import copy
+import html
+import json
+import sqlite3
+import heapq
+import bisect
+import struct
+import itertools
+import threading
+import unicodedata
+import multiprocessing
+import cProfile
+import pstats
 import pygame
+import numpy as np
 import pandas as pd
 from pygame.locals import *
-from datetime import datetime
+from datetime import datetime, timedelta
 # Using pygame_textinput from github/nearoo
 import pygame_textinput as pyti
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Schedule Columns - optional, after the 4 score columns, used by the SM-2 Scheduler
+#   ease - ease factor, interval - days between reviews, repetitions - correct in a row
+#   due_date - next review, first_date - first review (both MM/DD/YYYY)
+schedule_names = ['ease', 'interval', 'repetitions', 'due_date', 'first_date']
+
+# Card Store Class - flashcards held in typed arrays
+#   Each flashcard has a row id which never changes while the program runs,
+#   removed flashcards are only marked as not alive
+#   Sides are stored as ids into a table of unique strings, or left in the CSV
+#   file (text_source) for very large decks
+#   Only converted to/from a DataFrame when the CSV is loaded or saved
+#   scheduled - the Schedule Columns are saved with the flashcards
+class CardStore:
+    array_names = ('correct', 'incorrect', 'prev_corr', 'last_date', 'alive', 'ease',
+                   'interval', 'repetitions', 'due_date', 'first_date', 'sides')
+
+    def __init__(self, side_names, score_names, text_source=None, scheduled=False):
+        self.side_names = list(side_names)
+        self.score_names = list(score_names)
+        self.scheduled = scheduled
+        self.strings = ['']             # '' is id 0 (also used for empty sides)
+        self.string_ids = {'': 0}
+        self.size = 0                   # Row ids used (including removed flashcards)
+        self.count = 0                  # Flashcards which have not been removed
+        self.correct = np.zeros(0, dtype=np.int32)
+        self.incorrect = np.zeros(0, dtype=np.int32)
+        self.prev_corr = np.zeros(0, dtype=bool)
+        self.last_date = np.zeros(0, dtype=np.int32)    # Days since 1970.01.01
+        self.alive = np.zeros(0, dtype=bool)
+        self.ease = np.zeros(0, dtype=np.float32)
+        self.interval = np.zeros(0, dtype=np.int32)
+        self.repetitions = np.zeros(0, dtype=np.int32)
+        self.due_date = np.zeros(0, dtype=np.int32)
+        self.first_date = np.zeros(0, dtype=np.int32)
+        # Sides left in the CSV - only flashcards added since loading are kept here
+        self.text_source = text_source
+        self.added_sides = {}
+        side_count = len(self.side_names) if text_source is None else 0
+        self.sides = np.zeros((0, side_count), dtype=np.int32)
+
+    # Builds a Card Store from a DataFrame in the CSV layout
+    #   The DataFrame index is used as the row ids, size is the first unused row id
+    #   With a text_source, the DataFrame only needs the score (& schedule) columns
+    @classmethod
+    def from_frame(cls, fc_set, size=None, text_source=None):
+        scheduled = list(fc_set.columns[-5:]) == schedule_names
+        first_score = -9 if scheduled else -4
+        score_names = fc_set.columns[first_score:][:4]
+        if text_source is None:
+            store = cls(fc_set.columns[:first_score], score_names, scheduled=scheduled)
+        else:
+            store = cls(text_source.side_names, score_names, text_source, scheduled)
+        ids = fc_set.index.to_numpy(dtype=np.intp)
+        if size is None:
+            size = int(ids.max()) + 1 if len(ids) else 0
+        store.resize(size)
+        store.size = size
+        store.count = len(ids)
+        store.alive[ids] = True
+        store.correct[ids] = fc_set.iloc[:, first_score].to_numpy()
+        store.incorrect[ids] = fc_set.iloc[:, first_score + 1].to_numpy()
+        store.prev_corr[ids] = fc_set.iloc[:, first_score + 2].to_numpy() == True
+        store.last_date[ids] = parse_days(fc_set.iloc[:, first_score + 3])
+        if scheduled:
+            store.ease[ids] = fc_set.iloc[:, -5].fillna(sm2_start_ease).to_numpy()
+            store.interval[ids] = fc_set.iloc[:, -4].fillna(0).to_numpy()
+            store.repetitions[ids] = fc_set.iloc[:, -3].fillna(0).to_numpy()
+            store.due_date[ids] = parse_days(fc_set.iloc[:, -2])
+            store.first_date[ids] = parse_days(fc_set.iloc[:, -1])
+        # Each unique side is only interned once
+        for col in range(store.sides.shape[1]):
+            codes, uniques = pd.factorize(fc_set.iloc[:, col])
+            string_ids = np.array([store.intern(text) for text in uniques] + [0],
+                                  dtype=np.int32)
+            store.sides[ids, col] = string_ids[codes]
+        return store
+
+    # Converts the flashcards which have not been removed back into a DataFrame
+    def to_frame(self):
+        ids = self.ids()
+        data = {}
+        for col, name in enumerate(self.side_names):
+            data[name] = self.side_column(col, ids)
+        data[self.score_names[0]] = self.correct[ids]
+        data[self.score_names[1]] = self.incorrect[ids]
+        data[self.score_names[2]] = self.prev_corr[ids]
+        data[self.score_names[3]] = format_days(self.last_date[ids])
+        if self.scheduled:
+            data['ease'] = self.ease[ids].round(2)
+            data['interval'] = self.interval[ids]
+            data['repetitions'] = self.repetitions[ids]
+            data['due_date'] = format_days(self.due_date[ids])
+            data['first_date'] = format_days(self.first_date[ids])
+        return pd.DataFrame(data)
+
+    # Column names in the CSV layout
+    def column_names(self):
+        return self.side_names + self.score_names + (schedule_names if self.scheduled else [])
+
+    # Writes the flashcards which have not been removed to a CSV file
+    #   Sides left in the CSV are copied over in chunks, never all at once
+    def write_csv(self, path):
+        if self.text_source is None:
+            self.to_frame().to_csv(path, index=False)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file, lineterminator='\n')
+            writer.writerow(self.column_names())
+            for start in range(0, self.size, load_chunk_rows):
+                ids = np.arange(start, min(start + load_chunk_rows, self.size))
+                ids = ids[self.alive[ids]]
+                columns = [self.correct[ids].tolist(), self.incorrect[ids].tolist(),
+                           self.prev_corr[ids].tolist(), format_days(self.last_date[ids])]
+                if self.scheduled:
+                    columns += [self.ease[ids].round(2).tolist(), self.interval[ids].tolist(),
+                                self.repetitions[ids].tolist(),
+                                format_days(self.due_date[ids]),
+                                format_days(self.first_date[ids])]
+                for fc_sides, *scores in zip(self.side_rows(ids), *columns):
+                    writer.writerow(fc_sides + scores)
+
+    # Copy of the flashcards for the Save Worker - the game can keep changing this one
+    def snapshot(self):
+        store = copy.copy(self)
+        for name in self.array_names:
+            setattr(store, name, getattr(self, name)[:self.size].copy())
+        store.strings = list(self.strings)
+        store.added_sides = dict(self.added_sides)
+        if isinstance(self.text_source, CsvSides):
+            store.text_source = self.text_source.copy()
+        return store
+
+    # Copy which reads the sides left in the CSV through its own CsvSides - background
+    # threads read the whole file through it, so the game never waits for them
+    #   The arrays are shared, so it is only used to read sides - close_reader() it
+    #   afterwards
+    #   Sides in memory or a Binary Deck have no lock to wait on, so it is this store
+    def reader(self):
+        if not isinstance(self.text_source, CsvSides):
+            return self
+        store = copy.copy(self)
+        store.text_source = self.text_source.copy()
+        return store
+
+    # Closes the CsvSides of a reader()
+    def close_reader(self, reader):
+        if reader is not self:
+            reader.text_source.close()
+
+    # Grows (or shrinks) the arrays, keeping the flashcards already stored
+    def resize(self, capacity):
+        keep = min(self.size, capacity)
+        for name in self.array_names:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:keep] = old[:keep]
+            setattr(self, name, new)
+
+    # String table id of text
+    def intern(self, text):
+        if pd.isna(text):
+            return 0
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self.string_ids[text] = string_id
+        return string_id
+
+    # Row ids of the flashcards which have not been removed
+    def ids(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    # Text on one side of a flashcard
+    def side(self, fc_index, col):
+        if self.text_source is None:
+            return self.strings[self.sides[fc_index, col]]
+        if fc_index in self.added_sides:
+            return self.strings[self.added_sides[fc_index][col]]
+        return self.text_source.side(fc_index, col)
+
+    # Text on one side of many flashcards
+    def side_column(self, col, ids):
+        if self.text_source is None:
+            return np.array(self.strings, dtype=object)[self.sides[ids, col]]
+        # Flashcards added since loading always have the largest row ids
+        in_file = ids < self.text_source.end()
+        column = np.empty(len(ids), dtype=object)
+        column[in_file] = self.text_source.column(col, ids[in_file])
+        for i in np.flatnonzero(~in_file).tolist():
+            column[i] = self.strings[self.added_sides[int(ids[i])][col]]
+        return column
+
+    # All sides of many flashcards (ids in order) as lists of text
+    def side_rows(self, ids):
+        if self.text_source is None:
+            strings = np.array(self.strings, dtype=object)
+            return strings[self.sides[ids]].tolist()
+        in_file = ids < self.text_source.end()
+        fc_rows = self.text_source.rows(ids[in_file])
+        for fc_index in ids[~in_file].tolist():
+            fc_rows.append([self.strings[string_id] for string_id in self.added_sides[fc_index]])
+        return fc_rows
+
+    # last_date of flashcards as datetime64 (NaT if there is no date)
+    def dates(self, ids):
+        days = self.last_date[ids]
+        return np.where(days == no_date, np.datetime64('NaT'),
+                        days.astype('datetime64[D]'))
+
+    # Sets the 4 scores of a flashcard from text or values
+    def set_scores(self, fc_index, scores):
+        self.correct[fc_index] = int(scores[0])
+        self.incorrect[fc_index] = int(scores[1])
+        self.prev_corr[fc_index] = scores[2] in (True, 'True')
+        self.last_date[fc_index] = parse_day(scores[3])
+
+    # Sets the 5 Schedule Columns of a flashcard from text or values
+    #   None - a new flashcard which has never been tested
+    def set_schedule(self, fc_index, schedule=None):
+        if schedule is None:
+            schedule = [sm2_start_ease, 0, 0, '', '']
+        self.ease[fc_index] = float(schedule[0])
+        self.interval[fc_index] = int(schedule[1])
+        self.repetitions[fc_index] = int(schedule[2])
+        self.due_date[fc_index] = parse_day(schedule[3])
+        self.first_date[fc_index] = parse_day(schedule[4])
+
+    # Schedule Columns of a flashcard as they are saved
+    def schedule(self, fc_index):
+        return [round(float(self.ease[fc_index]), 2), self.interval[fc_index],
+                self.repetitions[fc_index], format_day(self.due_date[fc_index]),
+                format_day(self.first_date[fc_index])]
+
+    # Fills in the Schedule Columns of a deck which did not have them
+    #   Flashcards tested before are due the day after their last_date
+    def init_schedule(self):
+        tested = (self.correct + self.incorrect > 0) & (self.last_date != no_date)
+        self.ease[:] = sm2_start_ease
+        self.interval[:] = tested
+        self.repetitions[:] = tested & self.prev_corr
+        self.due_date[:] = np.where(tested, self.last_date + 1, no_date)
+        self.first_date[:] = np.where(tested, self.last_date, no_date)
+        self.scheduled = True
+
+    # Adds a flashcard in the CSV layout - returns its row id
+    #   Sides, then the 4 scores, then (optionally) the 5 Schedule Columns
+    def append(self, new_fc):
+        if self.size == len(self.alive):
+            self.resize(max(16, 2 * self.size))
+        fc_index = self.size
+        side_ids = [self.intern(new_fc[col]) for col in range(len(self.side_names))]
+        if self.text_source is None:
+            self.sides[fc_index] = side_ids
+        else:
+            self.added_sides[fc_index] = side_ids
+        values = new_fc[len(self.side_names):]
+        self.set_scores(fc_index, values[:4])
+        self.set_schedule(fc_index, values[4:] or None)
+        self.alive[fc_index] = True
+        self.size += 1
+        self.count += 1
+        return fc_index
+
+    # Adds many new flashcards at once (never tested) - returns their row ids
+    #   side_rows - sides of each flashcard as lists of text
+    def extend(self, side_rows, last_date=''):
+        added = len(side_rows)
+        if added == 0:
+            return np.zeros(0, dtype=np.intp)
+        if self.size + added > len(self.alive):
+            self.resize(max(16, 2 * self.size, self.size + added))
+        ids = np.arange(self.size, self.size + added)
+        # Sides are always text, so intern() is inlined without its NaN check
+        strings, string_ids = self.strings, self.string_ids
+        side_ids = []
+        for sides in side_rows:
+            row_ids = []
+            for text in sides:
+                string_id = string_ids.get(text)
+                if string_id is None:
+                    string_id = string_ids[text] = len(strings)
+                    strings.append(text)
+                row_ids.append(string_id)
+            side_ids.append(row_ids)
+        if self.text_source is None:
+            self.sides[ids] = np.array(side_ids, dtype=np.int32).reshape(added, -1)
+        else:
+            self.added_sides.update(zip(ids.tolist(), side_ids))
+        self.correct[ids] = 0
+        self.incorrect[ids] = 0
+        self.prev_corr[ids] = False
+        self.last_date[ids] = parse_day(last_date)
+        self.ease[ids] = sm2_start_ease
+        self.interval[ids] = 0
+        self.repetitions[ids] = 0
+        self.due_date[ids] = no_date
+        self.first_date[ids] = no_date
+        self.alive[ids] = True
+        self.size += added
+        self.count += added
+        return ids
+
+    # Flashcards with one of texts on a side (ignoring case), as a mask over the row ids
+    #   Interned sides only compare each different text once
+    def side_mask(self, col, texts):
+        keys = {text.strip().casefold() for text in texts}
+        if self.text_source is None:
+            string_ids = self.sides[:self.size, col]
+            matches = [string_id for string_id in pd.unique(string_ids).tolist()
+                       if self.strings[string_id].casefold() in keys]
+            return np.isin(string_ids, matches)
+        ids = self.ids()
+        column = pd.Series(self.side_column(col, ids), dtype=object).fillna('')
+        mask = np.zeros(self.size, dtype=bool)
+        mask[ids] = column.astype(str).str.casefold().isin(keys).to_numpy()
+        return mask
+
+    # Marks a flashcard as removed
+    def remove(self, fc_index):
+        self.alive[fc_index] = False
+        self.count -= 1
+
+    # Memory used by the arrays and string table
+    def nbytes(self):
+        arrays = sum(getattr(self, name).nbytes for name in self.array_names)
+        strings = sum(sys.getsizeof(text) for text in self.strings)
+        if self.text_source is not None:
+            arrays += self.text_source.nbytes()
+        return arrays + strings + sys.getsizeof(self.strings) + sys.getsizeof(self.string_ids)
+
+
+# CSV Sides Class - sides of flashcards left in the CSV file, read when they are shown
+#   offsets - byte offset where each CSV row starts, plus the end of the file
+#   ids - row id of each CSV row (None if they are the same as the CSV row number)
+class CsvSides:
+    def __init__(self, path, side_names, offsets, ids=None):
+        self.path = path
+        self.side_names = list(side_names)
+        self.offsets = offsets
+        self.ids = ids
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        self.row_cache = OrderedDict()
+        self.row_cache_size = 256
+        # Held while reading, so the Save Worker can swap in a compacted file
+        self.lock = threading.RLock()
+
+    # Second reader of the same file - the Save Worker and background indexes read
+    # from their own copy
+    def copy(self):
+        with self.lock:
+            return CsvSides(self.path, self.side_names, self.offsets, self.ids)
+
+    # Renames a compacted CSV over this file and reads from it instead
+    #   ids - row id of each row in the compacted CSV
+    def replace(self, temp_name, path, ids):
+        offsets = scan_rows(temp_name)
+        with self.lock:
+            self.close()
+            os.replace(temp_name, path)
+            self.path = path
+            self.offsets = offsets
+            self.ids = ids
+            self.data = np.memmap(path, dtype=np.uint8, mode='r')
+
+    # First row id after the rows in the file
+    def end(self):
+        if self.ids is None:
+            return len(self.offsets) - 1
+        return int(self.ids[-1]) + 1 if len(self.ids) else 0
+
+    # CSV row numbers of row ids
+    def positions(self, ids):
+        if self.ids is None:
+            return np.asarray(ids)
+        return np.searchsorted(self.ids, ids)
+
+    # Parses the CSV rows from first up to (not including) last
+    def parse(self, first, last):
+        text = bytes(self.data[self.offsets[first]:self.offsets[last]]).decode('utf-8')
+        # Blank lines are skipped, the same as pd.read_csv
+        return [fc_row for fc_row in csv.reader(io.StringIO(text)) if fc_row]
+
+    # Text on one side of a flashcard
+    def side(self, fc_index, col):
+        with self.lock:
+            fc_row = self.row_cache.get(fc_index)
+            if fc_row is None:
+                position = int(self.positions(fc_index))
+                fc_row = self.parse(position, position + 1)[0]
+                self.row_cache[fc_index] = fc_row
+                if len(self.row_cache) > self.row_cache_size:
+                    self.row_cache.popitem(last=False)
+        return fc_row[col] if col < len(fc_row) else ''
+
+    # Sides of many flashcards (ids in order) - reads the span of rows once
+    def rows(self, ids):
+        if len(ids) == 0:
+            return []
+        with self.lock:
+            positions = self.positions(ids)
+            first = int(positions[0])
+            parsed = self.parse(first, int(positions[-1]) + 1)
+        side_count = len(self.side_names)
+        return [(parsed[position - first] + [''] * side_count)[:side_count]
+                for position in positions.tolist()]
+
+    # Text on one side of many flashcards (ids in order)
+    #   Parses the whole file from this reader's own mapping (not self.path, which a
+    #   compacted CSV may have been renamed over)
+    def column(self, col, ids):
+        if len(ids) == 0:
+            return np.empty(0, dtype=object)
+        with self.lock:
+            column = np.empty(len(self.offsets) - 1, dtype=object)
+            start = 0
+            mapped = self.data._mmap
+            mapped.seek(0)
+            for chunk in pd.read_csv(mapped, usecols=[col], dtype=str,
+                                     keep_default_na=False, chunksize=load_chunk_rows):
+                column_chunk = chunk.iloc[:, 0].to_numpy(dtype=object)
+                stop = start + len(column_chunk)
+                column[start:stop] = column_chunk
+                start = stop
+            return column[self.positions(ids)]
+
+    # Memory used by the offsets
+    def nbytes(self):
+        return self.offsets.nbytes + (0 if self.ids is None else self.ids.nbytes)
+
+    def close(self):
+        self.data._mmap.close()
+        self.row_cache.clear()
+
+
+# Finds the byte offset where each row of a CSV file starts (not including the
+# header), plus the end of the file
+#   Newlines inside quotes are part of a row, so quotes are counted as well
+def scan_rows(path, chunk_bytes=1 << 24):
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    breaks = []
+    in_quotes = 0
+    for start in range(0, len(data), chunk_bytes):
+        chunk = data[start:start + chunk_bytes]
+        quotes = np.flatnonzero(chunk == ord('"'))
+        newlines = np.flatnonzero(chunk == ord('\n'))
+        outside = (np.searchsorted(quotes, newlines) + in_quotes) % 2 == 0
+        breaks.append(newlines[outside] + start + 1)
+        in_quotes = (in_quotes + len(quotes)) % 2
+    starts = np.concatenate(breaks) if breaks else np.zeros(0, dtype=np.int64)
+    starts = starts[starts < len(data)]
+    # Blank lines are not rows
+    starts = starts[~np.isin(data[starts], (ord('\n'), ord('\r')))]
+    offsets = np.append(starts, len(data)).astype(np.int64)
+    data._mmap.close()
+    return offsets
+
+
+# Binary Deck Class - optional replacement for the CSV (flashcards.deck), opened with mmap
+#   header - magic, number of sides, size of the names, number of records,
+#   record capacity, where the records start and where the text ends
+#   names - column names in the CSV layout (always with the Schedule Columns),
+#   separated by '\0'
+#   records - fixed width scores & schedule of each flashcard (deck_record), changed in place
+#   text - UTF-8 sides of each flashcard separated by '\0', found from text_start
+#   & text_length in its record - new flashcards are appended to the end
+#   Once the records are full, they are moved to the end of the file with twice the
+#   capacity - the text stays where it is, the old records are left unused
+#   Records use Card Store row ids - removed flashcards are kept with alive False
+deck_magic = b'FCDECK02'
+deck_header = struct.Struct('<8sIIQQQQ')
+deck_record = np.dtype([('correct', '<i4'), ('incorrect', '<i4'), ('last_date', '<i4'),
+                        ('prev_corr', '?'), ('alive', '?'), ('ease', '<f4'),
+                        ('interval', '<i4'), ('repetitions', '<i4'), ('due_date', '<i4'),
+                        ('first_date', '<i4'), ('text_start', '<u8'), ('text_length', '<u4')],
+                       align=True)
+# Card Store arrays kept in each record
+deck_fields = ('correct', 'incorrect', 'last_date', 'prev_corr', 'alive', 'ease', 'interval',
+               'repetitions', 'due_date', 'first_date')
+
+class DeckFile:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'r+b')
+        (magic, side_count, self.names_bytes, self.size, self.capacity, self.records_start,
+         self.text_end) = deck_header.unpack(self.file.read(deck_header.size))
+        if magic != deck_magic:
+            self.file.close()
+            raise ValueError(path + " is not a binary deck")
+        names = self.file.read(self.names_bytes).decode('utf-8').split('\0')
+        self.side_names = names[:side_count]
+        self.score_names = names[side_count:side_count + 4]
+        self.map()
+
+    # Maps the whole file - records are views into the map, so writes go to the file
+    def map(self):
+        self.data = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        end = self.records_start + self.capacity * deck_record.itemsize
+        self.records = self.data[self.records_start:end].view(deck_record)
+
+    # Writes a new deck with the flashcards in a Card Store
+    #   Written to a temporary file first, then renamed over path
+    @staticmethod
+    def create(path, store, capacity=0):
+        if not store.scheduled:
+            store.init_schedule()
+        names = '\0'.join(store.column_names()).encode('utf-8')
+        capacity = max(capacity, store.size, 16)
+        records_start = -(-(deck_header.size + len(names)) // 16) * 16
+        records = np.zeros(capacity, dtype=deck_record)
+        size = store.size
+        for name in deck_fields:
+            records[name][:size] = getattr(store, name)[:size]
+        text_end = records_start + capacity * deck_record.itemsize
+        temp_name = path + ".tmp"
+        with open(temp_name, 'wb') as deck_file:
+            deck_file.seek(text_end)
+            # Sides are copied over in chunks - removed flashcards have no text
+            for start in range(0, size, load_chunk_rows):
+                ids = np.arange(start, min(start + load_chunk_rows, size))
+                ids = ids[store.alive[ids]]
+                texts = ['\0'.join(map(str, fc_sides)).encode('utf-8')
+                         for fc_sides in store.side_rows(ids)]
+                lengths = np.array([len(text) for text in texts], dtype=np.int64)
+                records['text_length'][ids] = lengths
+                records['text_start'][ids] = text_end + np.cumsum(lengths) - lengths
+                deck_file.write(b''.join(texts))
+                text_end += int(lengths.sum())
+            deck_file.seek(0)
+            deck_file.write(deck_header.pack(deck_magic, len(store.side_names), len(names),
+                                             size, capacity, records_start, text_end))
+            deck_file.write(names)
+            deck_file.seek(records_start)
+            deck_file.write(records.tobytes())
+            deck_file.flush()
+            os.fsync(deck_file.fileno())
+        os.replace(temp_name, path)
+
+    # Builds a Card Store from the records - no parsing, sides stay in the file
+    def load_store(self):
+        store = CardStore(self.side_names, self.score_names, self, scheduled=True)
+        records = self.records[:self.size]
+        store.resize(self.size)
+        store.size = self.size
+        for name in deck_fields:
+            getattr(store, name)[:] = records[name]
+        store.count = int(store.alive.sum())
+        return store
+
+    # Writes the scores & schedule of a single flashcard into its record
+    def write_card(self, store, fc_index):
+        for name in deck_fields:
+            self.records[name][fc_index] = getattr(store, name)[fc_index]
+
+    # Moves the records past the end of the text, with room for capacity records
+    #   The file is grown and the records copied before the header points to them, so
+    #   the deck is never left half moved
+    def grow(self, capacity):
+        records = self.records[:self.size].tobytes()
+        self.flush()
+        records_start = -(-self.text_end // 16) * 16
+        text_end = records_start + capacity * deck_record.itemsize
+        self.file.truncate(text_end)
+        self.file.seek(records_start)
+        self.file.write(records)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.capacity = capacity
+        self.records_start = records_start
+        self.text_end = text_end
+        self.write_header()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.map()
+
+    # Writes the header from size, capacity, records_start & text_end
+    def write_header(self):
+        self.file.seek(0)
+        self.file.write(deck_header.pack(deck_magic, len(self.side_names), self.names_bytes,
+                                         self.size, self.capacity, self.records_start,
+                                         self.text_end))
+
+    # Adds the flashcards from the Card Store after the last record - text is
+    # appended, then their records
+    #   If there are no free records, they are moved with room for as many again
+    def extend(self, store):
+        ids = np.arange(self.size, store.size)
+        if len(ids) == 0:
+            return
+        if store.size > self.capacity:
+            self.grow(max(2 * self.capacity, 2 * store.size))
+        texts = ['\0'.join(map(str, fc_sides)).encode('utf-8')
+                 for fc_sides in store.side_rows(ids)]
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        self.file.seek(self.text_end)
+        self.file.write(b''.join(texts))
+        self.records['text_start'][ids] = self.text_end + np.cumsum(lengths) - lengths
+        self.records['text_length'][ids] = lengths
+        for name in deck_fields:
+            self.records[name][ids] = getattr(store, name)[ids]
+        self.size = store.size
+        self.text_end += int(lengths.sum())
+        self.write_header()
+        self.file.flush()
+        # Text was written past the end of the map
+        self.map()
+
+    # Adds a flashcard from the Card Store
+    def append(self, store, fc_index):
+        self.extend(store)
+
+    # First row id without a record
+    def end(self):
+        return self.size
+
+    # All sides of a single flashcard
+    def row(self, fc_index):
+        start = int(self.records['text_start'][fc_index])
+        length = int(self.records['text_length'][fc_index])
+        return bytes(self.data[start:start + length]).decode('utf-8').split('\0')
+
+    # Text on one side of a flashcard
+    def side(self, fc_index, col):
+        fc_row = self.row(fc_index)
+        return fc_row[col] if col < len(fc_row) else ''
+
+    # Sides of many flashcards
+    def rows(self, ids):
+        return [self.row(fc_index) for fc_index in np.asarray(ids).tolist()]
+
+    # Text on one side of many flashcards
+    def column(self, col, ids):
+        column = np.empty(len(ids), dtype=object)
+        for i, fc_row in enumerate(self.rows(ids)):
+            column[i] = fc_row[col] if col < len(fc_row) else ''
+        return column
+
+    # Records & text are mapped, not held in memory
+    def nbytes(self):
+        return 0
+
+    # Makes sure all changed records are on disk
+    def flush(self):
+        self.data.flush()
+
+    def close(self):
+        self.flush()
+        self.data._mmap.close()
+        self.file.close()
+
+
+# SQLite Deck Class - optional replacement for the CSV (flashcards.db)
+#   Has the same methods as the Binary Deck, so the game uses either one as deck
+#   cards - one row per Card Store row id (removed flashcards are kept with alive 0):
+#   sides separated by '\0' like the Binary Deck, side1_key, the deck_fields and next_due
+#   next_due - first day the flashcard is due with scheduler_name (NULL if it is never
+#   due by date, or removed) - recomputed for every flashcard if the scheduler changes
+#   side1_key & next_due are indexed, so finding a flashcard or the due flashcards is
+#   a single indexed query instead of a scan
+#   Runs in WAL mode - each score change is an UPDATE of one row, committed every
+#   journal_batch changes and whenever the game saves
+#   Changes are queued on the Save Worker, which runs them - the game only reads
+#   Used from the game, loading & Save Worker threads - every query holds the lock
+sqlite_schema = ['CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+                 'CREATE TABLE cards (id INTEGER PRIMARY KEY, sides TEXT, side1_key TEXT, ' +
+                 ', '.join(deck_fields) + ', next_due INTEGER)']
+sqlite_indexes = ['CREATE INDEX cards_side1_key ON cards (side1_key)',
+                  'CREATE INDEX cards_next_due ON cards (next_due)']
+sqlite_insert = ('INSERT INTO cards (id, sides, side1_key, ' + ', '.join(deck_fields) +
+                 ', next_due) VALUES (' + ', '.join(['?'] * (len(deck_fields) + 4)) + ')')
+sqlite_update = ('UPDATE cards SET ' + ', '.join(name + ' = ?' for name in deck_fields) +
+                 ', next_due = ? WHERE id = ?')
+
+class SqliteDeck:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        self.side_names = json.loads(meta['side_names'])
+        self.score_names = json.loads(meta['score_names'])
+        self.size = self.db.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM cards').fetchone()[0]
+        self.added = self.size          # Row ids below this have been queued to be inserted
+        self.pending = 0                # Changes since the last commit
+        self.save_worker = None         # Runs the changes (None - run straight away)
+        if meta['scheduler'] != scheduler_name:
+            self.write_next_due(self.load_store())
+
+    # Values of the cards table for flashcards in a Card Store
+    @staticmethod
+    def card_rows(store, ids):
+        due = due_cache_days(store, ids)
+        due[~store.alive[ids]] = never_due
+        columns = [ids.tolist()]
+        fc_rows = store.side_rows(ids)
+        columns.append(['\0'.join(map(str, fc_sides)) for fc_sides in fc_rows])
+        columns.append([side1_key(fc_sides[0]) for fc_sides in fc_rows])
+        columns += [getattr(store, name)[ids].tolist() for name in deck_fields]
+        columns.append([None if day == never_due else day for day in due.tolist()])
+        return zip(*columns)
+
+    # Writes a new database with the flashcards in a Card Store
+    #   Written to a temporary file first, then renamed over path
+    @staticmethod
+    def create(path, store):
+        if not store.scheduled:
+            store.init_schedule()
+        temp_name = path + ".tmp"
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        db = sqlite3.connect(temp_name, isolation_level=None)
+        db.execute('BEGIN')
+        for statement in sqlite_schema:
+            db.execute(statement)
+        db.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('side_names', json.dumps(store.side_names)),
+            ('score_names', json.dumps(store.score_names)),
+            ('scheduler', scheduler_name)])
+        # Removed flashcards keep their row ids, with no sides
+        for start in range(0, store.size, load_chunk_rows):
+            ids = np.arange(start, min(start + load_chunk_rows, store.size))
+            alive = store.alive[ids]
+            db.executemany(sqlite_insert, SqliteDeck.card_rows(store, ids[alive]))
+            db.executemany('INSERT INTO cards (id, alive) VALUES (?, 0)',
+                           [(fc_index,) for fc_index in ids[~alive].tolist()])
+        # Indexes are built once all the rows are in
+        for statement in sqlite_indexes:
+            db.execute(statement)
+        db.execute('COMMIT')
+        db.close()
+        # WAL files of an old database would be applied to the new one
+        for ext in ("-wal", "-shm"):
+            if os.path.exists(path + ext):
+                os.remove(path + ext)
+        os.replace(temp_name, path)
+
+    # Builds a Card Store from the cards table - sides stay in the database
+    #   Removed flashcards were inserted with only their id & alive, so their other
+    #   columns are NULL
+    def load_store(self):
+        store = CardStore(self.side_names, self.score_names, self, scheduled=True)
+        store.resize(self.size)
+        store.size = self.size
+        columns = ', '.join('COALESCE(' + name + ', 0)' for name in deck_fields)
+        with self.lock:
+            query = self.db.execute('SELECT id, ' + columns + ' FROM cards')
+            while True:
+                fc_rows = query.fetchmany(load_chunk_rows)
+                if not fc_rows:
+                    break
+                columns = list(zip(*fc_rows))
+                ids = np.array(columns[0], dtype=np.intp)
+                for name, column in zip(deck_fields, columns[1:]):
+                    values = getattr(store, name)
+                    values[ids] = np.array(column, dtype=values.dtype)
+        store.count = int(store.alive.sum())
+        return store
+
+    # Recomputes next_due of every flashcard (scheduler_name has changed)
+    def write_next_due(self, store):
+        ids = np.arange(store.size)
+        due = due_cache_days(store, ids)
+        due[~store.alive[:store.size]] = never_due
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.executemany('UPDATE cards SET next_due = ? WHERE id = ?', (
+                (None if day == never_due else day, fc_index)
+                for fc_index, day in zip(ids.tolist(), due.tolist())))
+            self.db.execute("UPDATE meta SET value = ? WHERE key = 'scheduler'",
+                            (scheduler_name,))
+            self.db.execute('COMMIT')
+
+    # Queues a change for the Save Worker
+    #   size - rows below it are in the database once it has run
+    def change(self, statement, params, size=None):
+        if self.save_worker is None:
+            self.apply(statement, params, size)
+        else:
+            self.save_worker.write_deck([statement, params, size])
+
+    # Runs a change inside the open transaction - committed every journal_batch changes,
+    # and straight away once rows are inserted
+    def apply(self, statement, params, size=None):
+        with self.lock:
+            if self.pending == 0:
+                self.db.execute('BEGIN')
+            self.db.executemany(statement, params)
+            self.pending += 1
+            if size is not None:
+                self.size = size
+            if self.pending >= journal_batch or size is not None:
+                self.flush()
+
+    # Writes the scores & schedule of a single flashcard into its row
+    def write_card(self, store, fc_index):
+        due = int(due_cache_days(store, [fc_index])[0])
+        if due == never_due or not store.alive[fc_index]:
+            due = None
+        values = [getattr(store, name)[fc_index].item() for name in deck_fields]
+        self.change(sqlite_update, [values + [due, int(fc_index)]])
+
+    # Adds the flashcards from the Card Store which are not in the database yet
+    #   Until they are inserted, the Card Store reads their sides from added_sides
+    def extend(self, store):
+        ids = np.arange(self.added, store.size)
+        self.added = store.size
+        self.change(sqlite_insert, list(self.card_rows(store, ids)), store.size)
+
+    # Adds a flashcard from the Card Store
+    def append(self, store, fc_index):
+        self.extend(store)
+
+    # First row id without a row
+    def end(self):
+        return self.size
+
+    # Sides of many flashcards - row ids are never reused, so each query reads a
+    # range of row ids and keeps the ones asked for
+    def rows(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return []
+        low, high = int(ids.min()), int(ids.max())
+        with self.lock:
+            found = dict(self.db.execute('SELECT id, sides FROM cards WHERE id BETWEEN ? AND ?',
+                                         (low, high)))
+        return [(found.get(fc_index) or '').split('\0') for fc_index in ids.tolist()]
+
+    def row(self, fc_index):
+        with self.lock:
+            found = self.db.execute('SELECT sides FROM cards WHERE id = ?',
+                                    (int(fc_index),)).fetchone()
+        return (found[0] or '').split('\0') if found else ['']
+
+    def side(self, fc_index, col):
+        fc_row = self.row(fc_index)
+        return fc_row[col] if col < len(fc_row) else ''
+
+    def column(self, col, ids):
+        column = np.empty(len(ids), dtype=object)
+        for i, fc_row in enumerate(self.rows(ids)):
+            column[i] = fc_row[col] if col < len(fc_row) else ''
+        return column
+
+    # Row id of the first flashcard with a side1_key (None if there is none)
+    def find_side1(self, key):
+        with self.lock:
+            found = self.db.execute('SELECT MIN(id) FROM cards WHERE side1_key = ? AND alive',
+                                    (key,)).fetchone()
+        return found[0]
+
+    # Up to limit side1 values whose side1_key starts with key, in order
+    def side1_prefix(self, key, limit):
+        with self.lock:
+            found = self.db.execute(
+                'SELECT MIN(id) FROM cards WHERE side1_key >= ? AND side1_key < ? AND alive '
+                'GROUP BY side1_key ORDER BY side1_key LIMIT ?',
+                (key, key + '\U0010ffff', limit)).fetchall()
+        return [self.side(fc_index, 0) for fc_index, in found]
+
+    # Row ids of the flashcards due on day - removed flashcards have no next_due
+    def due_ids(self, day):
+        with self.lock:
+            found = self.db.execute('SELECT id FROM cards WHERE next_due <= ?', (int(day),))
+            return np.fromiter(itertools.chain.from_iterable(found), dtype=np.intp)
+
+    # Rows are read from the database when needed, not held in memory
+    def nbytes(self):
+        return 0
+
+    # Commits the open transaction
+    def flush(self):
+        with self.lock:
+            if self.pending > 0:
+                self.db.execute('COMMIT')
+                self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+# Dates are stored as days since 1970.01.01, no_date if a flashcard has no last_date
+no_date = np.iinfo(np.int32).min
+epoch = datetime(1970, 1, 1)
+
+# Parses date text (MM/DD/YYYY) into days
+def parse_days(dates):
+    dates = pd.to_datetime(pd.Series(dates, dtype=object), format=date_format,
+                           errors='coerce').to_numpy(dtype='datetime64[D]')
+    return np.where(np.isnat(dates), no_date, dates.astype(np.int64)).astype(np.int32)
+
+# Formats days back into date text ('' if there is no date)
+def format_days(days):
+    dates = np.where(days == no_date, np.datetime64('NaT'), days.astype('datetime64[D]'))
+    dates = pd.Series(dates).dt.strftime(date_format)
+    return dates.where(days != no_date, '').to_numpy(dtype=object)
+
+# parse_days & format_days for a single date
+def parse_day(text):
+    try:
+        return (datetime.strptime(text, date_format) - epoch).days
+    except (TypeError, ValueError):
+        return no_date
+
+def format_day(day):
+    if day == no_date:
+        return ''
+    return (epoch + timedelta(days=int(day))).strftime(date_format)
 
-# initialize pygame
-pygame.init()
 
 # Global Variables
 fc_csv_name = "flashcards.csv"
-fc_set = pd.read_csv(fc_csv_name)
-rows = fc_set.shape[0]      # Number of flashcards
-columns = fc_set.shape[1]
+fc_deck_name = "flashcards.deck"   # Binary Deck - used instead of the CSV if it exists
+fc_db_name = "flashcards.db"       # SQLite Deck - used instead of both if it exists
+date_format = '%m/%d/%Y'    # MM/DD/YYYY
+
+# Review Journal - every score change, add and remove is appended to this file
+#   Replayed on top of the CSV at startup
+#   Compacted back into the CSV on exit or once it is larger than journal_max_bytes
+#   The first record stores the size & modified time of the CSV it applies to,
+#   so a journal which has already been compacted is never replayed twice
+#   Records use Card Store row ids - if flashcards had been removed when the
+#   journal was started, a gaps record lists the row ids missing from the CSV
+fc_journal_name = fc_csv_name + ".journal"
+fc_history_name = fc_csv_name + ".history"
+journal_batch = 20              # Records written between each fsync
+journal_max_bytes = 1 << 20     # 1 MB
+save_latency_count = 1000       # Latest save latencies kept by the Save Worker
+
+# Size & modified time of the CSV - stored as the first journal record
+def csv_stamp(csv_name=None):
+    stat = os.stat(fc_csv_name if csv_name is None else csv_name)
+    return [str(stat.st_size), str(stat.st_mtime_ns)]
+
+# Records in the journal after the first record ([] if there is no journal)
+#   A last record which was only partly written before a crash is cut off the file,
+#   so the records appended after it start on a line of their own
+def read_journal():
+    if not os.path.exists(fc_journal_name):
+        return []
+    with open(fc_journal_name, 'rb') as journal:
+        data = journal.read()
+    # Records end at a newline outside quotes (sides may have newlines in them)
+    chars = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(chars == ord('\n'))
+    quotes = np.cumsum(chars == ord('"'))
+    complete = newlines[quotes[newlines] % 2 == 0]
+    end = int(complete[-1]) + 1 if len(complete) else 0
+    if end < len(data):
+        with open(fc_journal_name, 'rb+') as journal:
+            journal.truncate(end)
+    records = csv.reader(io.StringIO(data[:end].decode('utf-8'), newline=''))
+    if next(records, None) == ['base'] + csv_stamp():
+        return list(records)
+    # Journal was already compacted into the CSV - start a new one
+    os.remove(fc_journal_name)
+    return []
+
+# Applies the journal records to the Card Store in order
+#   set - row id, correct, incorrect, prev_corr, last_date, (Schedule Columns)
+#   add - sides..., correct, incorrect, prev_corr, last_date, (Schedule Columns)
+#   del - row id
+#   The first set record with Schedule Columns fills them in for the whole deck,
+#   the same as when the SM-2 Scheduler was started
+def apply_journal(store, records):
+    for record in records:
+        try:
+            if record[0] == 'set' and len(record) in (6, 11) and int(record[1]) < store.size:
+                store.set_scores(int(record[1]), record[2:6])
+                if len(record) == 11:
+                    if not store.scheduled:
+                        store.init_schedule()
+                    store.set_schedule(int(record[1]), record[6:])
+            elif (record[0] == 'add' and
+                    len(record) - len(store.side_names) - 1 in (4, 9)):
+                store.append(record[1:])
+            elif record[0] == 'del' and len(record) == 2 and store.alive[int(record[1])]:
+                store.remove(int(record[1]))
+            else:
+                break
+        # Last record was only partly written before a crash
+        except (ValueError, IndexError):
+            break
+
+# Flashcards - loaded by load_deck() once the window is open
+cards = None
+deck = None                 # DeckFile / SqliteDeck when flashcards.deck / .db is used
+rows = 0                    # Number of flashcards
+columns = 0
+load_chunk_rows = 50000     # Rows read from the CSV between progress updates
+lazy_side_bytes = 100 << 20 # CSVs this large (100 MB) leave the sides in the file
+load_progress = 0.0         # 0 to 1 - shown on the Loading Screen
+load_error = None           # Exception raised while loading in the background
+deck_loaded = threading.Event()
+
+# Startup Report - seconds taken by each startup phase
+startup_times = {}
 
 today = datetime.today()
-date_format = '%m/%d/%Y'    # MM/DD/YYYY
 today_format = today.strftime(date_format)
+today_day = parse_day(today_format)
 clock = pygame.time.Clock()
+fps_cap = 60                # Max frames per second
+menu_fps_cap = 30           # Max frames per second on the Add & Remove Screens
 
 fc_front_ind = [0, 2, 4]
 fc_back_ind = [1, 3]
@@ -72,12 +1115,13 @@ y3_pos = (s_height + spacing / 4) / 2               # Top 3 Position
 y1_pos = y2_pos - b_height - spacing / 4            # Top 1 Position
 y4_pos = y3_pos + b_height + spacing / 4            # Top 4 Position
 
-# Font
-pygame.font.init()
+# Font - found once by init_fonts() and shared by everything
 font_size_large = 40
 font_size_small = 20
 font_name = 'yugothicuisemibold'                    # Supports Japanese Characters
-font = pygame.font.SysFont(font_name, font_size_large)
+font = None
+small_font = None
+font_path = None
 
 # Colors for Light Mode
 # https://coolors.co/e8e4da-c4b7a4-606c38-283618-a53f2b
@@ -87,6 +1131,48 @@ text_color = (40, 54, 24)       # Dark Green
 comp_1 = (96, 108, 56)          # Green
 comp_2 = (165, 63, 43)          # Red
 
+# Text Surface Cache - rendered text surfaces, least recently used is removed first
+#   Keyed on (font, text, color), limited to text_cache_max_bytes of surfaces
+text_cache = OrderedDict()
+text_cache_bytes = 0
+text_cache_max_bytes = 16 << 20     # 16 MB
+text_cache_hits = 0
+text_cache_misses = 0
+
+# Renders text through the Text Surface Cache
+def render_text(text, color, text_font=None):
+    global text_cache_bytes, text_cache_hits, text_cache_misses
+    if text_font is None:
+        text_font = font
+    key = (text_font, text, color)
+    text_surf = text_cache.get(key)
+    if text_surf is not None:
+        text_cache.move_to_end(key)
+        text_cache_hits += 1
+        return text_surf
+    text_cache_misses += 1
+    with profiler.phase('text'):
+        text_surf = text_font.render(text, 1, color)
+    text_cache[key] = text_surf
+    text_cache_bytes += surface_bytes(text_surf)
+    # Removes least recently used surfaces (always keeps the newest)
+    while text_cache_bytes > text_cache_max_bytes and len(text_cache) > 1:
+        old_key, old_surf = text_cache.popitem(last=False)
+        text_cache_bytes -= surface_bytes(old_surf)
+    return text_surf
+
+# Memory used by a surface
+def surface_bytes(surf):
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+# Hit rate of the Text Surface Cache as text
+def text_cache_stats():
+    lookups = text_cache_hits + text_cache_misses
+    hit_rate = text_cache_hits / lookups if lookups else 0
+    return (f"Text cache: {hit_rate:.1%} hit rate ({text_cache_hits} hits, "
+            f"{text_cache_misses} misses, {len(text_cache)} surfaces, "
+            f"{text_cache_bytes / 1024:.0f} KB)")
+
 # Flashcard Variables
 fc_width = s_width - (2 * spacing)
 fc_height = s_height - b_height - spacing * 3 / 2
@@ -101,28 +1187,168 @@ fc_bg_color = light_color
 
 fc_rect = pygame.Rect(fc_x_pos, fc_y_pos, fc_width, fc_height)
 
-# Flashcards - Last 4 columns must always be correct, incorrect, and prev_corr, date
-corr = columns - 4
-incorr = columns - 3
-prev_corr = columns - 2
-last_date = columns - 1
+# Text Layout - wraps the sides of a flashcard so they fit inside fc_rect
+#   Text is measured with font.size() (nothing is rendered), wrapped between words,
+#   or between characters for CJK text which has no spaces
+#   The font shrinks by layout_size_step until every side fits, down to layout_min_size
+#   Layouts are cached per (flashcard, sides shown, font) - ids are never reused
+#   within a deck, so a layout only goes stale when its flashcard is removed
+layout_padding = 16                 # Space kept between the text and the flashcard edge
+layout_min_size = 16
+layout_size_step = 4
+layout_cache = OrderedDict()
+layout_cache_max = 4096             # Layouts, least recently used is removed first
+layout_fonts = {}                   # Smaller fonts, made the first time they are needed
+cjk_chars = '\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef'
+layout_token = re.compile(f'[{cjk_chars}]\\s*|[^\\s{cjk_chars}]+\\s*|\\s+')
+
+# Font of the given size (font itself for font_size_large)
+def layout_font(size):
+    if size == font_size_large:
+        return font
+    size_font = layout_fonts.get(size)
+    if size_font is None:
+        size_font = pygame.font.Font(font_path, size)
+        layout_fonts[size] = size_font
+    return size_font
+
+# Splits text into lines no wider than width
+def wrap_text(text, text_font, width):
+    if text_font.size(text)[0] <= width:
+        return [text]
+    lines = []
+    line = ''
+    for token in layout_token.findall(text):
+        if text_font.size((line + token).rstrip())[0] <= width:
+            line += token
+            continue
+        if line:
+            lines.append(line.rstrip())
+            line = ''
+        if token.isspace():
+            continue
+        # Word wider than a whole line - broken between characters
+        if text_font.size(token.rstrip())[0] > width:
+            for char in token:
+                if line and text_font.size(line + char)[0] > width:
+                    lines.append(line.rstrip())
+                    line = ''
+                line += char
+        else:
+            line = token
+    if line.strip() or not lines:
+        lines.append(line.rstrip())
+    return lines
+
+# Largest font which fits every side inside fc_rect
+#   Returns (font, lines of each side) - an image side is (file, box) instead of lines,
+#   and the text only gets the height the image boxes leave
+def fit_text(texts):
+    refs = [media_ref(text) for text in texts]
+    box = image_box(refs)
+    images = sum(ref is not None and ref[0] == 'image' for ref in refs)
+    width = fc_width - 2 * layout_padding
+    height = fc_height - 2 * layout_padding - images * box[1]
+    texts = [text if ref is None else sound_label(ref[1]) for text, ref in zip(texts, refs)]
+    size = font_size_large
+    while True:
+        text_font = layout_font(size)
+        side_lines = [(ref[1], box) if ref is not None and ref[0] == 'image'
+                      else wrap_text(text, text_font, width) for text, ref in zip(texts, refs)]
+        line_count = sum(len(lines) for lines in side_lines if isinstance(lines, list))
+        if line_count * text_font.get_linesize() <= height or size <= layout_min_size:
+            return text_font, side_lines
+        size = max(size - layout_size_step, layout_min_size)
+
+# Layout of the sides of a flashcard which are shown together
+#   card_sides - list of sides to lay out instead of a flashcard in the Card Store
+def card_layout(fc_index, side_ind, card_sides=None):
+    if card_sides is None:
+        key = (fc_index, tuple(side_ind), font)
+    else:
+        key = (tuple(card_sides[i] for i in side_ind), font)
+    layout = layout_cache.get(key)
+    if layout is not None:
+        layout_cache.move_to_end(key)
+        return layout
+    if card_sides is None:
+        layout = fit_text([cards.side(fc_index, i) for i in side_ind])
+    else:
+        layout = fit_text(key[0])
+    layout_cache[key] = layout
+    if len(layout_cache) > layout_cache_max:
+        layout_cache.popitem(last=False)
+    return layout
+
+# Rendered lines (and images) of the sides of a flashcard, top to bottom
+#   Images still being decoded are drawn as a placeholder the size of their box
+def layout_surfaces(fc_index, side_ind, card_sides=None):
+    text_font, side_lines = card_layout(fc_index, side_ind, card_sides)
+    surfaces = []
+    for lines in side_lines:
+        if isinstance(lines, tuple):
+            surfaces.append(media_cache.image(*lines))
+        else:
+            surfaces.extend(render_text(line, text_color, text_font) for line in lines)
+    return surfaces
+
+# Frees the layouts of a removed flashcard
+def drop_layout(fc_index):
+    for side_ind in (fc_front_ind, fc_back_ind):
+        layout_cache.pop((fc_index, tuple(side_ind), font), None)
 
-# Enable key repeat:
-pygame.key.set_repeat(200, 25)
 
 # Textbox Varibles
 tb_width = s_width - (2*spacing)
 tb_height = b_height
 tb_x_pos = (s_width - tb_width)/2
-font_height = font.get_height()
-tb_spacing = (tb_height - font.get_height()) / 2
-tb_font_x_pos = tb_x_pos + tb_spacing
+font_height = 0                 # font_height, tb_spacing & tb_font_x_pos
+tb_spacing = 0                  # depend on the font - set by init_fonts()
+tb_font_x_pos = tb_x_pos
 cursor_width = 4
-tb_manager = pyti.TextInputManager(validator=lambda input: 
-                                   (font.render(input, 1, text_color).get_size()[0] +
-                                    cursor_width < (tb_width - 2*tb_spacing)))
+
+# Text Width - width of the text being typed, checked on every keystroke
+#   Keeps the width of each accepted input, so typing at the end only measures
+#   the new characters and deleting goes back to an earlier width
+class TextWidth:
+    def __init__(self):
+        self.texts = ['']
+        self.widths = [0]
+
+    def measure(self, text):
+        # Forgets inputs which are no longer the start of the text
+        while not text.startswith(self.texts[-1]):
+            self.texts.pop()
+            self.widths.pop()
+        return self.widths[-1] + font.size(text[len(self.texts[-1]):])[0]
+
+    def fits(self, text):
+        width = self.measure(text)
+        if width + cursor_width >= tb_width - 2*tb_spacing:
+            return False
+        if text != self.texts[-1]:
+            self.texts.append(text)
+            self.widths.append(width)
+        return True
+
+tb_width_check = TextWidth()
+tb_manager = pyti.TextInputManager(validator=tb_width_check.fits)
 stop_type = pyti.TextInputManager(validator=lambda input: False)
 
+# Finds the font once - SysFont searches the system fonts every time it is called
+def init_fonts():
+    global font, small_font, font_height, tb_spacing, tb_font_x_pos
+    start = time.perf_counter()
+    pygame.font.init()
+    global font_path
+    font_path = pygame.font.match_font(font_name)
+    font = pygame.font.Font(font_path, font_size_large)
+    small_font = pygame.font.Font(font_path, font_size_small)
+    font_height = font.get_height()
+    tb_spacing = (tb_height - font.get_height()) / 2
+    tb_font_x_pos = tb_x_pos + tb_spacing
+    startup_times['font'] = time.perf_counter() - start
+
 # Text Input Class
 class Textbox:
     def __init__(self, name, y_pos):
@@ -146,7 +1372,7 @@ class Textbox:
 
     def empty_draw(self):
         pygame.draw.rect(screen, self.bg_color, self.rect, border_radius=fc_radius)
-        screen.blit(font.render(self.name, 1, bg_color), 
+        screen.blit(render_text(self.name, bg_color), 
                     (tb_font_x_pos, self.font_y_pos))
         
     def tb_box_show(self):
@@ -159,7 +1385,7 @@ class Textbox:
         if self.on:
             screen.blit(self.textinput.surface, (tb_font_x_pos, self.font_y_pos))
         else:
-            screen.blit(font.render(self.value, 1, text_color), 
+            screen.blit(render_text(self.value, text_color), 
                         (tb_font_x_pos, self.font_y_pos))
             
     def clear(self):
@@ -192,58 +1418,525 @@ class Button:
         self.x_pos = x_pos
         self.y_pos = y_pos
         self.rect = pygame.Rect(self.x_pos, self.y_pos, b_width, b_height)
-        self.font = pygame.font.SysFont(font_name, font_size_small)
+        self.font = small_font
+        # Labels are rendered once - normal and hover
+        self.surf = render_text(self.name, self.t_color, self.font)
+        if self.bg_color == light_color:
+            self.hover_surf = self.surf
+        else:
+            self.hover_surf = render_text(self.name, self.bg_color, self.font)
+        self.text_pos = self.center(self.surf)
+        self.hover_text_pos = self.center(self.hover_surf)
 
-    def draw(self):
-        pygame.draw.rect(screen, self.bg_color, self.rect, border_radius=fc_radius)
-        button_surf = self.font.render(self.name, 1, self.t_color)
+    # Position of a label centered on the button
+    def center(self, button_surf):
         text_width, text_height = button_surf.get_size()
         x_center = self.x_pos + (b_width - text_width) / 2
         y_center = self.y_pos + (b_height - text_height) / 2
-        screen.blit(button_surf, (x_center, y_center))
+        return (x_center, y_center)
+
+    def draw(self):
+        pygame.draw.rect(screen, self.bg_color, self.rect, border_radius=fc_radius)
+        screen.blit(self.surf, self.text_pos)
 
     def hover_draw(self):
-        if self.bg_color == light_color:
-            pygame.draw.rect(screen, self.bg_color, self.rect, 2, border_radius=fc_radius)
-            button_surf = self.font.render(self.name, 1, self.t_color)
-        else:
-            pygame.draw.rect(screen, self.bg_color, self.rect, 2, border_radius=fc_radius)
-            button_surf = self.font.render(self.name, 1, self.bg_color)
-        text_width, text_height = button_surf.get_size()
-        x_center = self.x_pos + (b_width - text_width) / 2
-        y_center = self.y_pos + (b_height - text_height) / 2
-        screen.blit(button_surf, (x_center, y_center))
+        pygame.draw.rect(screen, self.bg_color, self.rect, 2, border_radius=fc_radius)
+        screen.blit(self.hover_surf, self.hover_text_pos)
 
-    def interact(self, mouse_pos=pygame.mouse.get_pos()):
+    def interact(self, mouse_pos=None):
+        if mouse_pos is None:
+            mouse_pos = pygame.mouse.get_pos()
         if self.rect.collidepoint(mouse_pos):
             self.hover_draw()
         else:
             self.draw()
 
 
+# Profiling Overlay - where each frame's time goes
+#   F3 - shows FPS, a histogram of frame times & the time taken by each phase
+#   F4 - writes every frame to trace_name as a line of JSON (toggles on & off)
+#   F5 - runs cProfile until pressed again, then writes profile_name & prints a summary
+# Phases can be nested - each one is timed from start to end, including nested ones
+#   events - pygame.event.get(), update - screen.update(), draw - screen.draw()
+#   review - building the Daily Review, save - save(), text - font.render on a cache miss
+#   flip - showing the frame, wait - waiting for the next frame (fps_cap)
+trace_name = "flashcards_trace.jsonl"
+profile_name = "flashcards.prof"
+profile_frames = 120                            # Frames shown on the overlay
+profile_buckets = [2, 4, 8, 17, 33, 67]         # Histogram - frame time upper bounds (ms)
+profile_phases = ['events', 'update', 'review', 'save', 'draw', 'text', 'flip', 'wait']
+profile_keys = (K_F3, K_F4, K_F5)
+
+class Profiler:
+    def __init__(self):
+        self.visible = False
+        self.frames = deque(maxlen=profile_frames)     # (frame seconds, phase seconds)
+        self.phases = {}
+        self.stack = []
+        self.frame_start = None
+        self.trace = None
+        self.profile = None
+
+    # Times a phase - used as "with profiler.phase('draw'):"
+    def phase(self, name):
+        self.stack.append(name)
+        return self
+
+    def __enter__(self):
+        self.stack[-1] = (self.stack[-1], time.perf_counter())
+
+    def __exit__(self, *exc):
+        name, start = self.stack.pop()
+        self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def start_frame(self):
+        self.frame_start = time.perf_counter()
+        self.phases = {}
+
+    def end_frame(self, current, event_count):
+        frame_time = time.perf_counter() - self.frame_start
+        self.frames.append((frame_time, self.phases))
+        if self.trace is not None:
+            record = {'time': round(time.time(), 6), 'screen': type(current).__name__,
+                      'events': event_count, 'frame_ms': round(frame_time * 1000, 3)}
+            for name, seconds in self.phases.items():
+                record[name + '_ms'] = round(seconds * 1000, 3)
+            self.trace.write(json.dumps(record) + '\n')
+
+    # Handles the profiling hot keys - returns the events meant for the screen
+    def handle(self, events):
+        kept = []
+        for event in events:
+            if event.type == KEYDOWN and event.key in profile_keys:
+                if event.key == K_F3:
+                    self.visible = not self.visible
+                elif event.key == K_F4:
+                    self.toggle_trace()
+                else:
+                    self.toggle_profile()
+            else:
+                kept.append(event)
+        return kept
+
+    def toggle_trace(self):
+        if self.trace is None:
+            self.trace = open(trace_name, 'a', encoding='utf-8')
+            print(f"Trace: writing frames to {trace_name}")
+        else:
+            self.trace.close()
+            self.trace = None
+            print("Trace: stopped")
+
+    def toggle_profile(self):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            print("Profile: started")
+        else:
+            self.profile.disable()
+            self.profile.dump_stats(profile_name)
+            print(f"Profile: written to {profile_name}")
+            pstats.Stats(self.profile).sort_stats('cumulative').print_stats(15)
+            self.profile = None
+
+    # Stops the trace & profile (if running) when the game closes
+    def close(self):
+        if self.trace is not None:
+            self.toggle_trace()
+        if self.profile is not None:
+            self.toggle_profile()
+
+    # Overlay lines - FPS, average / max time of each phase & the caches' hit rates
+    def lines(self):
+        frame_times = [frame[0] for frame in self.frames]
+        mean = sum(frame_times) / len(frame_times)
+        lines = [f"FPS {1 / mean:.0f}   frame {mean * 1000:.1f} ms   "
+                 f"max {max(frame_times) * 1000:.1f} ms"]
+        for name in profile_phases:
+            times = [frame[1].get(name, 0) for frame in self.frames]
+            lines.append(f"{name} {sum(times) / len(times) * 1000:.2f} ms   "
+                         f"max {max(times) * 1000:.2f} ms")
+        lines += [text_cache_stats(), prefetcher.stats(), media_cache.stats()]
+        lines.append("Frame times (ms)")
+        return lines
+
+    # Draws the overlay in the top left corner
+    #   Text is rendered directly, not through the Text Surface Cache, as it changes
+    #   every frame and would push out the flashcards
+    def draw(self, surface):
+        if not self.frames:
+            return
+        line_surfs = [small_font.render(line, 1, bg_color) for line in self.lines()]
+        line_height = small_font.get_linesize()
+        bar_width, bar_height = 40, 60
+        width = max(max(line.get_width() for line in line_surfs),
+                    bar_width * (len(profile_buckets) + 1)) + 16
+        height = line_height * (len(line_surfs) + 1) + bar_height + 24
+        panel = pygame.Surface((width, height), SRCALPHA)
+        panel.fill(text_color + (220,))
+        for num, line in enumerate(line_surfs):
+            panel.blit(line, (8, 8 + num * line_height))
+        # Histogram - one bar per bucket, the last one is every slower frame
+        counts = [0] * (len(profile_buckets) + 1)
+        for frame_time, phases in self.frames:
+            counts[bisect.bisect_left(profile_buckets, frame_time * 1000)] += 1
+        bar_bottom = 16 + line_height * len(line_surfs) + bar_height
+        for num, count in enumerate(counts):
+            bar = pygame.Rect(8 + num * bar_width, 0, bar_width - 4,
+                              max(1, bar_height * count // len(self.frames)))
+            bar.bottom = bar_bottom
+            pygame.draw.rect(panel, comp_1 if num < 4 else comp_2, bar)
+            labels = ["<" + str(bound) for bound in profile_buckets] + ["more"]
+            panel.blit(small_font.render(labels[num], 1, light_color),
+                       (8 + num * bar_width, bar_bottom))
+        surface.blit(panel, (0, 0))
+
+profiler = Profiler()
+
+# Shows the frame - with the Profiling Overlay drawn on top when it is shown
+#   rects - only these areas are updated (None for the whole screen)
+def show_frame(rects=None):
+    if profiler.visible:
+        profiler.draw(screen)
+        rects = None
+    with profiler.phase('flip'):
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+# Waits for the next frame
+def wait_frame(cap):
+    with profiler.phase('wait'):
+        clock.tick(cap)
+
+
+# Renderer Class - draws a screen at most once per frame
+#   Whole screen is redrawn after redraw() is called (i.e. flashcard flipped)
+#   Only the old & new hover areas are redrawn when the mouse moves on/off something
+class Renderer:
+    def __init__(self):
+        self.full = True
+        self.dirty_rects = []
+        self.hover = None
+
+    def redraw(self):
+        self.full = True
+
+    def handle(self, event):
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            self.full = True
+
+    # Checks which of the rects the mouse is over
+    def hover_check(self, rects, mouse_pos):
+        hover = None
+        for rect in rects:
+            if rect.collidepoint(mouse_pos):
+                hover = rect
+                break
+        if hover != self.hover:
+            # Slightly larger to cover hover outlines
+            for rect in (self.hover, hover):
+                if rect is not None:
+                    self.dirty_rects.append(rect.inflate(4, 4))
+            self.hover = hover
+
+    # Draws what has changed and waits for the next frame
+    #   draw - function which draws the whole screen, called with args
+    #   The Profiling Overlay changes every frame, so it is redrawn in full while shown
+    def present(self, draw, *args):
+        if self.full or profiler.visible:
+            draw(*args)
+            show_frame()
+        elif self.dirty_rects:
+            for rect in self.dirty_rects:
+                screen.set_clip(rect)
+                draw(*args)
+            screen.set_clip(None)
+            show_frame(self.dirty_rects)
+        self.full = False
+        self.dirty_rects = []
+        wait_frame(fps_cap)
+
+
+# Prefetcher - front & back of the flashcards about to be tested, rendered ahead of time
+#   Rendered during idle frames (nothing to redraw), one flashcard per frame - SDL's
+#   font rendering is not safe to run on another thread
+#   Kept in a ring buffer of prefetch_count flashcards (plus the one being shown),
+#   oldest dropped first, and a flashcard is dropped as soon as it has been answered
+prefetch_count = 8
+
+class Prefetcher:
+    def __init__(self):
+        self.ring = deque()         # Row ids, oldest first
+        self.surfaces = {}          # Row id to (front surfaces, back surfaces)
+        self.hits = 0
+        self.misses = 0
+
+    # Surfaces of one side of a flashcard (None if it has not been prefetched)
+    def get(self, fc_index, front):
+        surfaces = self.surfaces.get(fc_index)
+        if surfaces is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return surfaces[0] if front else surfaces[1]
+
+    # Renders the first of upcoming (row ids, next first) which is not prefetched yet
+    #   Images & sounds of all of them are decoded in the background first - a
+    #   flashcard is only rendered once its images are ready, so no placeholder is kept
+    def fill(self, upcoming):
+        rendered = False
+        for fc_index in upcoming[:prefetch_count]:
+            ready = media_cache.prefetch(fc_index)
+            if ready and not rendered and fc_index not in self.surfaces:
+                self.render(fc_index)
+                rendered = True
+
+    def render(self, fc_index):
+        self.surfaces[fc_index] = tuple(
+            layout_surfaces(fc_index, side_ind) for side_ind in (fc_front_ind, fc_back_ind))
+        self.ring.append(fc_index)
+        while len(self.ring) > prefetch_count + 1:
+            self.surfaces.pop(self.ring.popleft(), None)
+
+    # Frees the surfaces of a flashcard (answered or removed)
+    def drop(self, fc_index):
+        if self.surfaces.pop(fc_index, None) is not None:
+            self.ring.remove(fc_index)
+
+    # Row ids now belong to another deck
+    def clear(self):
+        self.ring.clear()
+        self.surfaces.clear()
+
+    def stats(self):
+        shown = self.hits + self.misses
+        return (f"Prefetcher: {self.hits / shown if shown else 0:.1%} hit rate "
+                f"({self.hits} hits, {self.misses} misses)")
+
+prefetcher = Prefetcher()
+
+# Media Sides - a side can be an image or a sound instead of text
+#   [image:file] - drawn on the flashcard, scaled down to fit its box (images share
+#   media_image_share of the height when there are text sides too)
+#   [sound:file] - played when its side is shown, '(sound) name' is shown as text
+#   Files are in media_dir (like Anki's collection.media)
+#   Decoded on a pool of media_workers threads with pygame.image.load & pygame.mixer.Sound,
+#   so a frame never waits on a file - until an image is ready, a placeholder is drawn
+#   Decoded images & sounds are kept in an LRU cache of at most media_cache_bytes
+#   (decoded size), least recently used removed first
+media_dir = 'media'
+media_workers = 2
+media_cache_bytes = 64 << 20
+media_image_share = 2 / 3
+media_card_keys = 256           # Flashcards whose media are remembered for the Prefetcher
+media_ref_pattern = re.compile(r'\s*\[(image|sound):\s*([^\]]+?)\s*\]\s*$', re.IGNORECASE)
+media_audio = None              # True once the mixer is ready, False if there is no audio
+
+# (kind, file) of a media side - None for a text side
+def media_ref(text):
+    if not isinstance(text, str):
+        return None
+    match = media_ref_pattern.match(text)
+    if match is None:
+        return None
+    return match.group(1).lower(), match.group(2)
+
+# Size each image of the sides shown together is scaled to fit (width, height)
+def image_box(refs):
+    images = sum(ref is not None and ref[0] == 'image' for ref in refs)
+    height = fc_height - 2 * layout_padding
+    if images < len(refs):
+        height *= media_image_share
+    return int(fc_width - 2 * layout_padding), int(height / max(images, 1))
+
+def sound_label(file):
+    return "(sound) " + os.path.splitext(os.path.basename(file))[0]
+
+# Starts the mixer the first time a sound is needed
+def init_mixer():
+    global media_audio
+    if media_audio is None:
+        try:
+            pygame.mixer.init()
+            media_audio = True
+        except pygame.error:
+            media_audio = False
+    return media_audio
+
+# Decodes an image or sound - run in the thread pool
+#   Returns (asset, decoded bytes)
+def decode_media(kind, file, box):
+    path = os.path.join(media_dir, file)
+    if kind == 'sound':
+        sound = pygame.mixer.Sound(path)
+        frequency, sample_size, channels = pygame.mixer.get_init()
+        return sound, int(sound.get_length() * frequency * channels * abs(sample_size) // 8)
+    image = pygame.image.load(path)
+    width, height = image.get_size()
+    scale = min(box[0] / width, box[1] / height, 1)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # smoothscale only takes 24 & 32 bit images
+        if image.get_bitsize() >= 24:
+            image = pygame.transform.smoothscale(image, size)
+        else:
+            image = pygame.transform.scale(image, size)
+    return image, image.get_pitch() * image.get_height()
+
+# Media keys of the sides of a flashcard - ('image', file, box) or ('sound', file, None)
+def card_media(fc_index):
+    keys = []
+    for side_ind in (fc_front_ind, fc_back_ind):
+        refs = [media_ref(cards.side(fc_index, i)) for i in side_ind]
+        box = image_box(refs)
+        keys += [(kind, file, box if kind == 'image' else None)
+                 for kind, file in filter(None, refs)]
+    return keys
+
+# Media Cache Class - decoded images & sounds, and the ones still being decoded
+#   Only used from the game thread - the pool only runs decode_media()
+class MediaCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.assets = OrderedDict()     # Key to (asset, bytes), least recently used first
+        self.nbytes = 0
+        self.pending = {}               # Key to Future
+        self.failed = {}                # Key to error text
+        # Row id to media keys, for the Prefetcher - cleared when the deck changes
+        self.card_keys = OrderedDict()
+        self.placeholders = {}
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+
+    # Starts decoding (nothing to do if it is cached, being decoded or failed)
+    def request(self, key):
+        if key in self.assets or key in self.pending or key in self.failed:
+            return
+        if key[0] == 'sound' and not init_mixer():
+            self.failed[key] = "no audio device"
+            return
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(media_workers, thread_name_prefix='media')
+        self.pending[key] = self.pool.submit(decode_media, *key)
+
+    # Moves decoded media into the cache - True if any have finished
+    def poll(self):
+        done = [key for key, future in self.pending.items() if future.done()]
+        for key in done:
+            self.finish(key)
+        return len(done) > 0
+
+    def finish(self, key):
+        future = self.pending.pop(key)
+        try:
+            asset, nbytes = future.result()
+        except (OSError, pygame.error) as error:
+            self.failed[key] = str(error)
+            return
+        # Converted to the screen's format on the game thread, so blits are fast
+        if key[0] == 'image' and pygame.display.get_surface() is not None:
+            asset = asset.convert_alpha() if asset.get_alpha() is not None else asset.convert()
+        self.assets[key] = (asset, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self.assets) > 1:
+            _, (_, old_bytes) = self.assets.popitem(last=False)
+            self.nbytes -= old_bytes
+
+    # Decoded image or sound (None if it is still being decoded or failed)
+    def get(self, key):
+        future = self.pending.get(key)
+        if future is not None and future.done():
+            self.finish(key)
+        entry = self.assets.get(key)
+        if entry is None:
+            self.misses += 1
+            self.request(key)
+            return None
+        self.hits += 1
+        self.assets.move_to_end(key)
+        return entry[0]
+
+    def ready(self, key):
+        return key in self.assets or key in self.failed
+
+    # Image of a side, or its placeholder
+    def image(self, file, box):
+        key = ('image', file, box)
+        image = self.get(key)
+        if image is not None:
+            return image
+        text = ("Missing " if key in self.failed else "Loading ") + file
+        surface = self.placeholders.get((text, box))
+        if surface is None:
+            surface = pygame.Surface(box, pygame.SRCALPHA)
+            pygame.draw.rect(surface, text_color, surface.get_rect(), 2,
+                             border_radius=fc_radius)
+            label = render_text(text, text_color, small_font)
+            surface.blit(label, ((box[0] - label.get_width()) / 2,
+                                 (box[1] - label.get_height()) / 2))
+            self.placeholders[(text, box)] = surface
+        return surface
+
+    # Starts decoding the media of a flashcard - True once they are all ready
+    def prefetch(self, fc_index):
+        keys = self.card_keys.get(fc_index)
+        if keys is None:
+            keys = self.card_keys[fc_index] = card_media(fc_index)
+            if len(self.card_keys) > media_card_keys:
+                self.card_keys.popitem(last=False)
+        for key in keys:
+            self.request(key)
+        self.poll()
+        return all(self.ready(key) for key in keys)
+
+    # Plays the sounds of the sides shown - False while they are still being decoded
+    def play(self, fc_index, side_ind):
+        refs = [media_ref(cards.side(fc_index, i)) for i in side_ind]
+        keys = [('sound', ref[1], None) for ref in refs if ref is not None and ref[0] == 'sound']
+        sounds = [self.get(key) for key in keys]
+        if not all(self.ready(key) for key in keys):
+            return False
+        for sound in sounds:
+            if sound is not None:
+                sound.play()
+        return True
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        shown = self.hits + self.misses
+        return (f"Media cache: {self.hits / shown if shown else 0:.1%} hit rate "
+                f"({len(self.assets)} assets, {self.nbytes / 2**20:.1f} MB, "
+                f"{len(self.failed)} failed)")
+
+media_cache = MediaCache(media_cache_bytes)
+
 # Prints the text of a single Flashcard
-# Assumes text on each side fits in one line
-def blit_text(surface, fc_index, fc_set=fc_set):
-    global show_front, font
-    line_num = 0
+# Long sides are wrapped (and the font shrunk) by the Text Layout
+#   card_sides - list of sides to show instead of a flashcard in the Card Store
+def blit_text(surface, fc_index, card_sides=None):
+    global show_front
     # Defaults to back side
     fc_side_ind = fc_back_ind
-    line_total = len(fc_back_ind)
     # If front side needs to be shown
     if show_front:
         fc_side_ind = fc_front_ind
-        line_total = len(fc_front_ind)
-    for i in fc_side_ind:
-        if pd.isna(fc_set.iloc[fc_index, i]):
-            line_surf = font.render("", 1, text_color)
-        else:
-            line_surf = font.render(fc_set.iloc[fc_index, i], 1, text_color)
+    line_surfs = None
+    if card_sides is None:
+        line_surfs = prefetcher.get(fc_index, show_front)
+    if line_surfs is None:
+        line_surfs = layout_surfaces(fc_index, fc_side_ind, card_sides)
+    line_y = fc_y_mid - sum(line_surf.get_height() for line_surf in line_surfs) / 2
+    for line_surf in line_surfs:
         line_width, line_height = line_surf.get_size()
         line_x = (s_width - line_width) / 2
-        line_y = fc_y_mid - (line_total * line_height) / 2
-        line_y += line_num * line_height
         surface.blit(line_surf, (line_x, line_y))
-        line_num += 1
+        line_y += line_height
 
 # Flips Flashcard
 def flip():
@@ -258,17 +1951,27 @@ def show_fc():
         pygame.draw.rect(screen, fc_bg_color, fc_rect, border_radius=fc_radius)
 
 # User gets Flashcard Correct
-def correct(fc_index):
+#   reviewed - tested in the Daily Review, so last_date becomes today too (one
+#   journal record for both)
+def correct(fc_index, reviewed=False):
     global show_front
-    fc_set.iloc[fc_index, corr] += 1
-    fc_set.iloc[fc_index, prev_corr] = True
+    cards.correct[fc_index] += 1
+    cards.prev_corr[fc_index] = True
+    if reviewed:
+        cards.last_date[fc_index] = today_day
+    update_due(fc_index)
+    deck_stats.update(fc_index)
+    journal_card(fc_index)
     show_front = True
 
 # User gets Flashcard Incorrect
 def incorrect(fc_index):
     global show_front
-    fc_set.iloc[fc_index, incorr] += 1
-    fc_set.iloc[fc_index, prev_corr] = False
+    cards.incorrect[fc_index] += 1
+    cards.prev_corr[fc_index] = False
+    update_due(fc_index)
+    deck_stats.update(fc_index)
+    journal_card(fc_index)
     show_front = True
 
 # User goes back to Previous Flashcard
@@ -276,17 +1979,590 @@ def previous(fc_index, test_more):
     global show_front
     show_front = True
     # If previously correct
-    if fc_set.iloc[fc_index, prev_corr]:
-        fc_set.iloc[fc_index, corr] -= 1
+    if cards.prev_corr[fc_index]:
+        cards.correct[fc_index] -= 1
+        update_due(fc_index)
+        deck_stats.update(fc_index)
+        journal_card(fc_index)
         return test_more
     else:
-        fc_set.iloc[fc_index, incorr] -= 1
+        cards.incorrect[fc_index] -= 1
+        update_due(fc_index)
+        deck_stats.update(fc_index)
+        journal_card(fc_index)
         test_more.pop()
         return test_more
 
+# Save Worker Class - all journal & CSV writes happen on a background thread
+#   The game only queues journal records and snapshots, it never waits on the disk
+#   SQLite Deck - the queued records are changes to the database, run straight away
+#   Records are written in order, synced every journal_batch records or when asked
+#   Compactions are coalesced - only the newest queued snapshot is written
+#   Keeps the file names & flashcards of the deck it was started for, so it can
+#   finish writing a deck after the Deck Library has moved on to another one
+class SaveWorker:
+    def __init__(self):
+        self.csv_name = fc_csv_name
+        self.journal_name = fc_journal_name
+        self.deck = deck
+        self.cards = cards
+        self.history = history
+        history.save_worker = self
+        if isinstance(deck, SqliteDeck):
+            deck.save_worker = self
+        # Journal records, Review Histories with a block to append & (snapshot, final)
+        # compactions
+        self.queue = []
+        self.wake = threading.Condition()
+        self.sync_wanted = False
+        self.apply_wanted = False       # SQLite Deck changes are queued
+        self.compact_wanted = False     # Journal is larger than journal_max_bytes
+        self.stopping = False
+        self.records = 0                # Records queued since the program started
+        self.journal = None
+        self.pending = 0                # Records written since the last fsync
+        self.error = None               # Exception raised while saving
+        self.save_started = None        # When the oldest save() not yet synced was asked for
+        self.save_latencies = deque(maxlen=save_latency_count)     # save() until synced
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Queues a journal record
+    def write(self, record):
+        with self.wake:
+            self.queue.append(record)
+            self.records += 1
+            if len(self.queue) >= journal_batch:
+                self.wake.notify()
+
+    # Queues a change to the SQLite Deck - the worker runs it straight away
+    def write_deck(self, change):
+        with self.wake:
+            self.queue.append(change)
+            self.apply_wanted = True
+            self.wake.notify()
+
+    # Queues a block of the Review History to be appended (written with the next batch)
+    def write_history(self, history):
+        with self.wake:
+            self.queue.append(history)
+
+    # Asks for everything queued to be synced, and compacted if a snapshot is given
+    def save(self, snapshot=None, final=False):
+        with self.wake:
+            if snapshot is not None:
+                # An older snapshot is replaced - its own CsvSides is closed with it
+                for item in self.queue:
+                    if isinstance(item, tuple) and isinstance(item[0].text_source, CsvSides):
+                        item[0].text_source.close()
+                self.queue = [item for item in self.queue if not isinstance(item, tuple)]
+                self.queue.append((snapshot, final))
+                self.compact_wanted = False
+            if self.save_started is None:
+                self.save_started = time.perf_counter()
+            self.sync_wanted = True
+            self.wake.notify()
+
+    # Writes everything still queued, then waits for the thread to finish
+    def stop(self, snapshot=None):
+        self.save(snapshot, final=True)
+        with self.wake:
+            self.stopping = True
+            self.wake.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.wake:
+                self.wake.wait_for(lambda: self.sync_wanted or self.stopping or
+                                   self.apply_wanted or len(self.queue) >= journal_batch)
+                items, self.queue = self.queue, []
+                self.apply_wanted = False
+                sync, self.sync_wanted = self.sync_wanted, False
+                started = None
+                if sync:
+                    started, self.save_started = self.save_started, None
+                stopping = self.stopping
+            try:
+                for item in items:
+                    if isinstance(item, tuple):
+                        self.compact(*item)
+                    elif isinstance(item, ReviewHistory):
+                        item.write_block()
+                    elif self.deck is not None:
+                        self.deck.apply(*item)
+                    else:
+                        self.journal_write(item)
+                if sync:
+                    self.sync()
+                    if started is not None:
+                        self.save_latencies.append(time.perf_counter() - started)
+            except Exception as error:
+                self.error = error
+                return
+            if stopping:
+                if self.journal is not None:
+                    self.journal.close()
+                return
+
+    # Appends a record to the Review Journal - fsync once every journal_batch records
+    def journal_write(self, record):
+        if self.journal is None:
+            self.journal = open(self.journal_name, 'a', newline='', encoding='utf-8')
+            # New journal - starts with the CSV it applies to
+            if self.journal.tell() == 0:
+                csv.writer(self.journal).writerow(['base'] + csv_stamp(self.csv_name))
+        csv.writer(self.journal).writerow(record)
+        self.pending += 1
+        if self.pending >= journal_batch:
+            self.sync()
+
+    # Makes sure all journal records (or Binary Deck records) are on disk
+    def sync(self):
+        if self.deck is not None:
+            self.deck.flush()
+        if self.journal is not None:
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            if self.journal.tell() > journal_max_bytes:
+                self.compact_wanted = True
+        self.pending = 0
+
+    # Compacts the Review Journal - Overrides current CSV and deletes the journal
+    #   The CSV is written to a temporary file first, then renamed over the old one
+    #   If this is interrupted before the journal is deleted, the journal no longer
+    #   matches the CSV and is ignored at the next startup
+    #   final - the program is exiting, so row ids no longer need to be kept
+    def compact(self, store, final):
+        temp_name = self.csv_name + ".tmp"
+        store.write_csv(temp_name)
+        if store.text_source is None:
+            os.replace(temp_name, self.csv_name)
+        else:
+            # Sides left in the CSV are now at new byte offsets - the game's reader
+            # switches over to the compacted CSV
+            store.text_source.close()
+            ids = store.ids() if store.count < store.size else None
+            self.cards.text_source.replace(temp_name, self.csv_name, ids)
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.pending = 0
+        if os.path.exists(self.journal_name):
+            os.remove(self.journal_name)
+        # Row ids of removed flashcards are not in the CSV - new journal starts with them
+        if not final and store.count < store.size:
+            self.journal_write(['gaps'] + np.flatnonzero(~store.alive[:store.size]).tolist())
+            self.sync()
+
+    # Stops the worker & closes the deck - all changes are written back into the CSV first
+    def close(self):
+        if self.deck is not None:
+            self.stop()
+            self.history.close()
+            self.deck.close()
+        else:
+            if self.records > 0 or os.path.exists(self.journal_name):
+                self.stop(self.cards.snapshot())
+            else:
+                self.stop()
+            # Removed flashcards are left out of the CSV, so the row ids after them change
+            if self.cards.count < self.cards.size:
+                self.history.close(self.cards.alive[:self.cards.size])
+            else:
+                self.history.close()
+            if self.cards.text_source is not None:
+                self.cards.text_source.close()
+        if self.error is not None:
+            raise self.error
+
+save_worker = None
+
+# Queues a record for the Review Journal
+def journal_write(record):
+    save_worker.write(record)
+
+# Journals the current scores of a single flashcard
+#   With a Binary Deck, its record is changed in place instead
+def journal_card(fc_index):
+    if deck is not None:
+        deck.write_card(cards, fc_index)
+        return
+    record = ['set', fc_index, cards.correct[fc_index], cards.incorrect[fc_index],
+              cards.prev_corr[fc_index], format_day(cards.last_date[fc_index])]
+    if cards.scheduled:
+        record += cards.schedule(fc_index)
+    journal_write(record)
+
+# Review History - every answer given on the Test & Review Screens, kept to tune the
+# schedulers with (flashcards.csv.history)
+#   Answers are buffered in arrays and appended to the file history_batch at a time,
+#   or when the game saves - the Save Worker appends each block, so the game never
+#   waits for the file
+#   Each block - magic & number of events, then each column in history_columns
+#   card - row id (-1 once the flashcard has been removed from the CSV)
+#   time - when it was answered, in seconds since 1970
+#   outcome - 1 correct, 0 incorrect, -1 the card's last answer was taken back (Go Back)
+#   flip & answer - seconds from the flashcard being shown until it was first flipped
+#   (NaN if it was not) and until it was answered
+history_magic = b'FCHB'
+history_block = struct.Struct('<4sI')
+history_columns = [('card', np.dtype('<i4')), ('time', np.dtype('<f8')),
+                   ('outcome', np.dtype('i1')), ('flip', np.dtype('<f4')),
+                   ('answer', np.dtype('<f4'))]
+history_batch = 4096
+
+class ReviewHistory:
+    def __init__(self, path):
+        self.path = path
+        self.buffer = {name: np.empty(history_batch, dtype) for name, dtype in history_columns}
+        self.count = 0
+        self.save_worker = None     # Appends the blocks (None - appended straight away)
+        self.queued = []            # Blocks given to the Save Worker, not yet in the file
+        self.lock = threading.Lock()
+
+    def record(self, fc_index, outcome, flip_time=np.nan, answer_time=np.nan):
+        ind = self.count
+        self.buffer['card'][ind] = fc_index
+        self.buffer['time'][ind] = time.time()
+        self.buffer['outcome'][ind] = outcome
+        self.buffer['flip'][ind] = flip_time
+        self.buffer['answer'][ind] = answer_time
+        self.count += 1
+        if self.count == history_batch:
+            self.flush()
+
+    # Queues the buffered events on the Save Worker as one block
+    def flush(self):
+        if self.count == 0:
+            return
+        block = {name: column[:self.count].copy() for name, column in self.buffer.items()}
+        self.count = 0
+        with self.lock:
+            self.queued.append(block)
+        if self.save_worker is None:
+            self.write_block()
+        else:
+            self.save_worker.write_history(self)
+
+    # Appends the oldest queued block to the file - called by the Save Worker
+    def write_block(self):
+        with self.lock:
+            with open(self.path, 'ab') as history_file:
+                write_history_block(history_file, self.queued[0])
+            del self.queued[0]
+
+    # Every event, from the file, the queued blocks then the buffer
+    def events(self):
+        with self.lock:
+            events = read_history(self.path)
+            blocks = list(self.queued)
+        return {name: np.concatenate([events[name]] + [block[name] for block in blocks] +
+                                     [self.buffer[name][:self.count]])
+                for name in events}
+
+    # Writes the buffer - alive is given when the row ids are about to change (removed
+    # flashcards are left out of the CSV), so every event is rewritten with the new ids
+    #   Called once the Save Worker has stopped, so the blocks are appended straight away
+    def close(self, alive=None):
+        self.save_worker = None
+        while self.queued:
+            self.write_block()
+        self.flush()
+        if alive is None or not os.path.exists(self.path):
+            return
+        events = read_history(self.path)
+        new_ids = np.cumsum(alive) - 1
+        card = events['card']
+        known = (card >= 0) & (card < len(alive))
+        card[known] = np.where(alive[card[known]], new_ids[card[known]], -1)
+        with open(self.path + ".tmp", 'wb') as history_file:
+            write_history_block(history_file, events)
+        os.replace(self.path + ".tmp", self.path)
+
+def write_history_block(history_file, events):
+    history_file.write(history_block.pack(history_magic, len(events['card'])))
+    for name, dtype in history_columns:
+        history_file.write(events[name].astype(dtype, copy=False).tobytes())
+
+# Reads every block of a history file into one array per column
+def read_history(path):
+    blocks = {name: [] for name, dtype in history_columns}
+    if os.path.exists(path):
+        with open(path, 'rb') as history_file:
+            while True:
+                header = history_file.read(history_block.size)
+                if len(header) < history_block.size:
+                    break
+                magic, count = history_block.unpack(header)
+                if magic != history_magic:
+                    raise ValueError(path + " is not a review history")
+                for name, dtype in history_columns:
+                    blocks[name].append(np.fromfile(history_file, dtype, count))
+    return {name: np.concatenate(blocks[name]) if blocks[name] else np.empty(0, dtype)
+            for name, dtype in history_columns}
+
+# Answers which were not taken back - an undo event cancels the event before it for
+# the same flashcard
+def history_answers(events):
+    outcome = events['outcome']
+    keep = outcome >= 0
+    undone = np.flatnonzero(outcome < 0)
+    if len(undone):
+        # Events of the flashcards with an answer taken back, grouped by flashcard in
+        # the order they happened
+        card = events['card']
+        order = np.flatnonzero(np.isin(card, card[undone]))
+        order = order[np.argsort(card[order], kind='stable')]
+        position = np.zeros(len(outcome), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        before = order[np.maximum(position[undone] - 1, 0)]
+        same_card = (position[undone] > 0) & (card[before] == card[undone])
+        keep[before[same_card]] = False
+    return {name: column[keep] for name, column in events.items()}
+
+# Percentiles of a time column (answer or flip) for each flashcard
+#   Returns (row ids, array of shape (flashcards, percentiles)) - linear interpolation,
+#   like np.percentile, without a loop over flashcards
+def latency_percentiles(events, percentiles=(50, 90), column='answer'):
+    answers = history_answers(events)
+    card = answers['card']
+    seconds = answers[column]
+    timed = ~np.isnan(seconds)
+    card = card[timed]
+    seconds = seconds[timed]
+    order = np.argsort(seconds)
+    order = order[np.argsort(card[order], kind='stable')]
+    card = card[order]
+    seconds = seconds[order].astype(np.float64)
+    ids, starts, counts = np.unique(card, return_index=True, return_counts=True)
+    result = np.empty((len(ids), len(percentiles)))
+    for num, percentile in enumerate(percentiles):
+        rank = (counts - 1) * percentile / 100
+        low = np.floor(rank).astype(np.int64)
+        high = np.ceil(rank).astype(np.int64)
+        fraction = rank - low
+        result[:, num] = (seconds[starts + low] * (1 - fraction) +
+                          seconds[starts + high] * fraction)
+    return ids, result
+
+# Accuracy of the answers in each bucket of time (days by default, local time)
+#   Returns (bucket numbers - days since 1970 by default, answers, accuracy)
+def accuracy_over_time(events, bucket_seconds=86400):
+    answers = history_answers(events)
+    if len(answers['time']) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    local_time = answers['time'] + time.localtime().tm_gmtoff
+    buckets = (local_time // bucket_seconds).astype(np.int64)
+    first = buckets.min()
+    totals = np.bincount(buckets - first)
+    correct_counts = np.bincount(buckets - first, weights=answers['outcome'])
+    used = np.flatnonzero(totals)
+    return used + first, totals[used], correct_counts[used] / totals[used]
+
+# Summary of the Review History as text - accuracy of the last days and slowest flashcards
+def history_report(events, days=7, slowest=5):
+    answers = history_answers(events)
+    lines = [f"Review History: {len(events['card'])} events, {len(answers['card'])} answers"]
+    if len(answers['card']) == 0:
+        return "\n".join(lines)
+    lines.append(f"  Accuracy {answers['outcome'].mean():.1%}, median answer time "
+                 f"{np.nanmedian(answers['answer']):.2f} s")
+    buckets, totals, accuracy = accuracy_over_time(events)
+    for day, total, day_accuracy in zip(buckets[-days:], totals[-days:], accuracy[-days:]):
+        lines.append(f"  {format_day(day)}: {total} answers, {day_accuracy:.1%} correct")
+    ids, result = latency_percentiles(events)
+    for num in np.argsort(-result[:, 1])[:slowest]:
+        fc_index = ids[num]
+        alive = 0 <= fc_index < cards.size and cards.alive[fc_index]
+        name = cards.side(fc_index, 0) if alive else '(removed)'
+        lines.append(f"  Slow: {name} - median {result[num, 0]:.2f} s, "
+                     f"90th percentile {result[num, 1]:.2f} s")
+    return "\n".join(lines)
+
+history = None
+
+# Deck Stats - running totals behind the Stats Screen
+#   Built from the whole deck at once (vectorized) the first time the Stats Screen is
+#   opened after a deck loads, then every answer, Go Back, add & remove only takes the
+#   flashcard's old values out of the totals and puts its new values in
+#   Each flashcard's correct, incorrect & next due day are kept, so its old values are
+#   known without going back through the deck
+#   accuracy - tested flashcards in stats_buckets buckets of correct percentage
+#   tags - flashcards by side stats_tag_side (side5 - part of speech in the example deck)
+#   due_days - tested flashcards by the day they are next due (see next_due_days())
+#   trend - answers & correct answers each day, from the Review History when built
+stats_buckets = 10
+stats_tag_side = 4
+stats_tag_count = 6         # Most common tags shown, the rest are counted as other
+stats_trend_days = 14
+
+class DeckStats:
+    def __init__(self):
+        self.built = False
+        self.lock = threading.Lock()
+        self.version = 0            # Changes whenever the totals do
+        self.chart = None           # Chart surface & the (version, day) it shows
+        self.chart_key = None
+
+    # Full recompute from the Card Store & Review History
+    def build(self):
+        ids = cards.ids()
+        with self.lock:
+            self.counted = cards.alive.copy()
+            self.card_correct = cards.correct.copy()
+            self.card_incorrect = cards.incorrect.copy()
+            self.card_due = np.full(len(cards.alive), never_due)
+            self.card_due[ids] = next_due_days(cards, ids)
+            correct, incorrect = self.card_correct[ids], self.card_incorrect[ids]
+            tested = correct + incorrect > 0
+            self.correct_sum = int(correct.sum())
+            self.incorrect_sum = int(incorrect.sum())
+            self.tested = int(np.count_nonzero(tested))
+            self.accuracy = np.bincount(
+                accuracy_buckets(correct[tested], incorrect[tested]),
+                minlength=stats_buckets)
+            self.tags = Counter()
+            if stats_tag_side < len(cards.side_names):
+                tags = pd.Series(cards.side_column(stats_tag_side, ids), dtype=object)
+                self.tags.update(tags.fillna('').astype(str).value_counts().to_dict())
+            due = self.card_due[ids[tested]]
+            days, counts = np.unique(due[due != never_due], return_counts=True)
+            self.due_days = Counter(dict(zip(days.tolist(), counts.tolist())))
+            days, totals, day_accuracy = accuracy_over_time(history.events())
+            self.trend = {day: [total, round(total * rate)] for day, total, rate
+                          in zip(days.tolist(), totals.tolist(), day_accuracy.tolist())}
+            self.built = True
+            self.version += 1
+
+    # Takes a flashcard's kept values out of the totals (sign -1) or puts them in (1)
+    def count(self, fc_index, sign):
+        correct = int(self.card_correct[fc_index])
+        incorrect = int(self.card_incorrect[fc_index])
+        self.correct_sum += sign * correct
+        self.incorrect_sum += sign * incorrect
+        if correct + incorrect > 0:
+            self.tested += sign
+            self.accuracy[accuracy_buckets(correct, incorrect)] += sign
+            if self.card_due[fc_index] != never_due:
+                self.due_days[int(self.card_due[fc_index])] += sign
+
+    # Makes room for flashcards added since the totals were built
+    def grow(self):
+        capacity = len(cards.alive)
+        if len(self.counted) < capacity:
+            extra = capacity - len(self.counted)
+            self.counted = np.append(self.counted, np.zeros(extra, dtype=bool))
+            self.card_correct = np.append(self.card_correct, np.zeros(extra, np.int32))
+            self.card_incorrect = np.append(self.card_incorrect, np.zeros(extra, np.int32))
+            self.card_due = np.append(self.card_due, np.full(extra, never_due))
+
+    # A flashcard was answered, taken back, reviewed or added
+    #   Changes to its correct & incorrect count as today's answers in the trend
+    def update(self, fc_index):
+        if not self.built:
+            return
+        with self.lock:
+            self.grow()
+            if self.counted[fc_index]:
+                self.count(fc_index, -1)
+                added_correct = int(cards.correct[fc_index] - self.card_correct[fc_index])
+                added_incorrect = int(cards.incorrect[fc_index] - self.card_incorrect[fc_index])
+                day = self.trend.setdefault(int(today_day), [0, 0])
+                day[0] += added_correct + added_incorrect
+                day[1] += added_correct
+            else:
+                self.counted[fc_index] = True
+                self.tags[self.tag(fc_index)] += 1
+            self.card_correct[fc_index] = cards.correct[fc_index]
+            self.card_incorrect[fc_index] = cards.incorrect[fc_index]
+            self.card_due[fc_index] = next_due_day(cards, fc_index)
+            self.count(fc_index, 1)
+            self.version += 1
+
+    # Many new flashcards at once (Bulk Import) - they have never been tested
+    def add(self, ids):
+        if not self.built or len(ids) == 0:
+            return
+        with self.lock:
+            self.grow()
+            self.counted[ids] = True
+            self.card_correct[ids] = 0
+            self.card_incorrect[ids] = 0
+            self.card_due[ids] = next_due_days(cards, ids)
+            if stats_tag_side < len(cards.side_names):
+                tags = pd.Series(cards.side_column(stats_tag_side, ids), dtype=object)
+                self.tags.update(tags.fillna('').astype(str).value_counts().to_dict())
+            self.version += 1
+
+    def remove(self, fc_index):
+        if not self.built:
+            return
+        with self.lock:
+            if fc_index < len(self.counted) and self.counted[fc_index]:
+                self.count(fc_index, -1)
+                self.counted[fc_index] = False
+                self.tags[self.tag(fc_index)] -= 1
+                self.version += 1
+
+    def tag(self, fc_index):
+        if stats_tag_side >= len(cards.side_names):
+            return ''
+        side = cards.side(fc_index, stats_tag_side)
+        return '' if pd.isna(side) else str(side)
+
+    # Tested flashcards due before today (by days overdue), due today & due soon
+    def backlog(self):
+        ranges = [('30+', -np.inf, -30), ('7-29', -29, -7), ('1-6', -6, -1),
+                  ('Today', 0, 0), ('Week', 1, 7)]
+        counts = [0] * len(ranges)
+        for day, count in self.due_days.items():
+            offset = day - today_day
+            for num, (_, first, last) in enumerate(ranges):
+                if first <= offset <= last:
+                    counts[num] += count
+        return [name for name, _, _ in ranges], counts
+
+# Bucket of the correct percentage of tested flashcards (100% is in the last bucket)
+def accuracy_buckets(correct, incorrect):
+    return np.minimum(np.asarray(correct) * stats_buckets // (np.asarray(correct) +
+                      np.asarray(incorrect)), stats_buckets - 1)
+
+deck_stats = None
+
+# Adds a new Flashcard (sides followed by the 4 score columns) to the Card Store
+def add_card(new_fc):
+    global rows
+    fc_index = cards.append(new_fc)
+    rows = cards.count
+    update_due(fc_index)
+    deck_stats.update(fc_index)
+    scheduler.added(fc_index)
+    index_side1(new_fc[0], fc_index)
+    search_index.add([fc_index])
+    if deck is not None:
+        deck.append(cards, fc_index)
+    else:
+        journal_write(['add'] + list(new_fc))
+
+# Removes a Flashcard - other flashcards keep their row ids
+def remove_card(fc_index):
+    global rows
+    prefetcher.drop(fc_index)
+    drop_layout(fc_index)
+    unindex_side1(cards.side(fc_index, 0), fc_index)
+    deck_stats.remove(fc_index)
+    cards.remove(fc_index)
+    rows = cards.count
+    due_set.discard(fc_index)
+    if deck is not None:
+        deck.write_card(cards, fc_index)
+    else:
+        journal_write(['del', fc_index])
+
 # End Screen - Flashcard Background with static text
 def end_screen(text="Flashcards Completed"):
-    line_surf = font.render(text, 1, text_color)
+    line_surf = render_text(text, text_color)
     line_width, line_height = line_surf.get_size()
     line_x = (s_width - line_width) / 2
     line_y = fc_y_mid - line_height / 2
@@ -294,154 +2570,1047 @@ def end_screen(text="Flashcards Completed"):
 
 # Prints Text at Top of Screen
 def top_text(text):
-    top_text_surf = font.render(text, 1, text_color)
+    top_text_surf = render_text(text, text_color)
     screen.blit(top_text_surf, ((s_width - top_text_surf.get_size()[0]) / 2, 
                                 y1_pos))
 
-# Daily Review - returns list of indexes to test
-def daily_review():
-    daily_set = []
-    for index in range(rows):
-        fc = fc_set.iloc[index]
-        # Number of times a FC has been tested
-        num_tested = fc.iloc[corr] + fc.iloc[incorr]
-        # FC has never been tested, add to daily_set list
-        if num_tested == 0:
-            daily_set.append(index)
-        # Dependent on % correct and time since last 
-        else:
-            # Percentage that a FC has been guessed correctly
-            perc_corr = fc.iloc[corr] / num_tested
-            # Days since last time FC was tested
-            last_date_str = fc.iloc[last_date]
-            last_date_obj = datetime.strptime(last_date_str, date_format)
-            days_since = (today - last_date_obj).days
-            if perc_corr >= 0.90 and days_since >= 5:
-                daily_set.append(index)
-            elif perc_corr >= 0.75 and days_since >= 3:
-                daily_set.append(index)
-            elif perc_corr >= 0.50 and days_since >= 2:
-                daily_set.append(index)
-            elif perc_corr <= 0.50 and days_since >= 1:
-                daily_set.append(index)
-    # Returns list of indexes to test from full list
-    return daily_set
-
-# Test Flashcards - given list of indexes to test
-def test_all(to_test = range(rows), daily=False):
-    global gameOn, screen
-    test_ind = 0
-    test_more = []
-    if len(to_test) == 0:
-        screen.fill(bg_color)
-        return 0
-    while gameOn:
-        # for loop through the event queue
-        for event in pygame.event.get():
-            screen.fill(bg_color)
-            # Check to Quit Game      
-            if event.type == QUIT:
-                gameOn = False
+# Due Mask - Daily Review rules applied to whole columns at once
+#   num_corr, num_incorr - arrays of correct / incorrect counts
+#   dates - datetime64[D] array of last_date, day - datetime64[D] of today
+def due_mask(num_corr, num_incorr, dates, day):
+    num_corr = np.asarray(num_corr, dtype=np.float64)
+    num_tested = num_corr + np.asarray(num_incorr, dtype=np.float64)
+    # Percentage that a FC has been guessed correctly (0 if never tested)
+    perc_corr = np.divide(num_corr, num_tested, out=np.zeros_like(num_corr),
+                          where=num_tested != 0)
+    # Days since last time FC was tested (NaT never counts as due)
+    days_since = (day - dates).astype(np.float64)
+    days_since[np.isnat(dates)] = np.nan
+    return ((num_tested == 0) |
+            ((perc_corr >= 0.90) & (days_since >= 5)) |
+            ((perc_corr >= 0.75) & (days_since >= 3)) |
+            ((perc_corr >= 0.50) & (days_since >= 2)) |
+            ((perc_corr <= 0.50) & (days_since >= 1)))
 
-            # Hot Key Options
-            if event.type == KEYDOWN:
-                # There are still Flashcards to test
-                if test_ind < len(to_test):
-                    if event.key == K_SPACE:
-                        flip()
-                    elif event.key == K_f:
-                        incorrect(to_test[test_ind])
-                        test_more.append(to_test[test_ind])
-                        test_ind += 1
-                    elif event.key == K_j:
-                        correct(to_test[test_ind])
-                        if daily:
-                            fc_set.iloc[to_test[test_ind], last_date] = today_format
-                        test_ind += 1
-                # There are no more Flashcards to test
-                else:
-                    if event.key == K_f:
-                        save()
-                        screen.fill(bg_color)
-                        return 1
-                    elif event.key == K_j:
-                        save()
-                        return test_all(to_test=test_more, daily=daily)
-                # If there are flashcards to go back to
-                if test_ind > 0:
-                    if event.key == K_b:
-                        test_ind -= 1
-                        test_more = previous(to_test[test_ind], test_more)
-            # Mouse Click Options
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                # There are still Flashcards to test
-                if test_ind < len(to_test):
-                    if fc_rect.collidepoint(event.pos):
-                        flip()
-                    elif incorr_b.rect.collidepoint(event.pos):
-                        incorrect(to_test[test_ind])
-                        test_more.append(to_test[test_ind])
-                        test_ind += 1
-                    elif corr_b.rect.collidepoint(event.pos):
-                        correct(to_test[test_ind])
-                        if daily:
-                            fc_set.iloc[to_test[test_ind], last_date] = today_format
-                        test_ind += 1
-                # Complete testing flashcards & save data
-                else:
-                    if home_b.rect.collidepoint(event.pos):
-                        save()
-                        screen.fill(bg_color)
-                        return 1
-                    if cont_b.rect.collidepoint(event.pos) and len(test_more) != 0:
-                        save()
-                        return test_all(to_test=test_more, daily=daily)
-                # If there are flashcards to go back to
-                if test_ind > 0:
-                    if back_b.rect.collidepoint(event.pos):
-                        test_ind -= 1
-                        test_more = previous(to_test[test_ind], test_more)
-            # Displays Flashcard and appropriate buttons
-            show_fc()
-            if test_ind < len(to_test):
-                blit_text(screen, to_test[test_ind])
-                corr_b.interact(pygame.mouse.get_pos())
-                incorr_b.interact(pygame.mouse.get_pos())
+# First day each flashcard is due with scheduler_name (never_due if it never is by date)
+#   Threshold - last_date plus the fewest days due_mask() needs for the scores
+#   (flashcards never tested or without a last_date are never_due - due_cache_days()
+#   counts the untested ones as always due)
+#   SM-2 - due_date, new flashcards are never due by date
+never_due = np.iinfo(np.int64).max
+
+def next_due_days(store, ids):
+    if scheduler_name == 'sm2':
+        if not store.scheduled:
+            store.init_schedule()
+        due = store.due_date[ids].astype(np.int64)
+        return np.where(due == no_date, never_due, due)
+    dates = store.dates(ids)
+    correct, incorrect = store.correct[ids], store.incorrect[ids]
+    due = np.full(len(dates), never_due)
+    for days in range(5, -1, -1):
+        mask = due_mask(correct, incorrect, dates, dates + days)
+        due[mask] = (dates[mask] + days).astype(np.int64)
+    due[(correct + incorrect == 0) | np.isnat(dates)] = never_due
+    return due
+
+# next_due_days() of one flashcard with plain Python numbers - the same rules as
+# due_mask(), tried for each number of days since last_date
+def next_due_day(store, fc_index):
+    if scheduler_name == 'sm2':
+        due = int(store.due_date[fc_index])
+        return never_due if due == no_date else due
+    correct, incorrect = int(store.correct[fc_index]), int(store.incorrect[fc_index])
+    last = int(store.last_date[fc_index])
+    if correct + incorrect == 0 or last == no_date:
+        return never_due
+    perc_corr = correct / (correct + incorrect)
+    for days in range(6):
+        if ((perc_corr >= 0.90 and days >= 5) or (perc_corr >= 0.75 and days >= 3) or
+                (perc_corr >= 0.50 and days >= 2) or (perc_corr <= 0.50 and days >= 1)):
+            return last + days
+    return never_due
+
+# next_due_days() as the Due Cache sees it (the SQLite Deck's next_due & the Deck
+# Library's due counts) - flashcards never tested are always due with the threshold
+def due_cache_days(store, ids):
+    due = next_due_days(store, ids)
+    if scheduler_name != 'sm2':
+        ids = np.asarray(ids)
+        due[store.correct[ids] + store.incorrect[ids] == 0] = no_date
+    return due
+
+# Due Cache - set of flashcard row ids due for the Daily Review
+#   Built once at startup, then only the changed flashcard is re-checked
+#   Rebuilt when the date rolls over
+due_set = set()
+due_day = None
+
+# Rebuilds the whole Due Cache
+def build_due_cache():
+    global due_set, due_day
+    due_day = np.datetime64(today.date(), 'D')
+    # SQLite Deck - next_due is already the threshold's due day
+    if isinstance(deck, SqliteDeck) and scheduler_name == 'threshold':
+        due_set = set(deck.due_ids(today_day).tolist())
+        return
+    ids = cards.ids()
+    mask = due_mask(cards.correct[ids], cards.incorrect[ids], cards.dates(ids), due_day)
+    due_set = set(ids[mask].tolist())
+
+# Re-checks a single flashcard after its scores or last_date change
+def update_due(fc_index):
+    is_due = due_mask(cards.correct[[fc_index]], cards.incorrect[[fc_index]],
+                      cards.dates([fc_index]), due_day)[0]
+    if is_due:
+        due_set.add(fc_index)
+    else:
+        due_set.discard(fc_index)
+
+# Moves today forward if the date has changed since the Due Cache was built
+def check_today():
+    global today, today_format, today_day
+    if datetime.today().date() != today.date():
+        today = datetime.today()
+        today_format = today.strftime(date_format)
+        today_day = parse_day(today_format)
+        with profiler.phase('review'):
+            build_due_cache()
+            scheduler.new_day()
+
+# Side1 Index - side1 (casefolded) to list of flashcard row ids
+#   side1_keys is kept sorted for prefix searches
+#   Sides left in the CSV - built on a background thread once the deck has loaded, as
+#   reading side1 means reading the whole file
+#   Every side1 is kept in memory, even for sides left in the CSV - the SQLite Deck
+#   keeps its side1 index on disk instead
+#   Changes are made holding side1_lock, so flashcards added or removed while it is
+#   being built are put in (or taken out) before it is used
+side1_index = {}
+side1_keys = []
+side1_built = False
+side1_thread = None
+side1_lock = threading.Lock()
+suggestion_count = 5        # Suggestions shown on the Remove Screen
+
+# Key used for side1 in the Side1 Index
+def side1_key(side1):
+    if pd.isna(side1):
+        return ''
+    return str(side1).casefold()
+
+# Rebuilds the whole Side1 Index
+#   If the Deck Library has opened another deck by the time it is built, it is dropped
+def build_side1_index():
+    global side1_index, side1_keys, side1_built
+    store = cards
+    size = store.size
+    ids = store.ids()
+    index = {}
+    reader = store.reader()
+    try:
+        for ind, side1 in zip(ids.tolist(), reader.side_column(0, ids)):
+            index.setdefault(side1_key(side1), []).append(ind)
+    finally:
+        store.close_reader(reader)
+    with side1_lock:
+        if store is not cards:
+            return
+        # Flashcards added or removed while it was being built
+        for fc_index in range(size, store.size):
+            if store.alive[fc_index]:
+                index.setdefault(side1_key(store.side(fc_index, 0)), []).append(fc_index)
+        for fc_index in ids[~store.alive[ids]].tolist():
+            key = side1_key(store.side(fc_index, 0))
+            index[key].remove(fc_index)
+            if not index[key]:
+                del index[key]
+        side1_index = index
+        side1_keys = sorted(index)
+        side1_built = True
+
+# Starts building the Side1 Index on a background thread
+def start_side1_index():
+    global side1_thread
+    side1_thread = threading.Thread(target=build_side1_index, daemon=True)
+    side1_thread.start()
+
+# True once the Side1 Index is built
+#   wait - waits for it (or builds it) instead of returning False while it is built,
+#   for searches the user asked for - screens drawing every frame never wait
+def side1_ready(wait=True):
+    if side1_built:
+        return True
+    if side1_thread is None or not side1_thread.is_alive():
+        if not wait:
+            start_side1_index()
+            return False
+        build_side1_index()
+    elif wait:
+        side1_thread.join()
+    return side1_built
+
+# Adds a flashcard index to the Side1 Index
+def index_side1(side1, fc_index):
+    with side1_lock:
+        if not side1_built:
+            return
+        key = side1_key(side1)
+        if key not in side1_index:
+            side1_index[key] = []
+            bisect.insort(side1_keys, key)
+        side1_index[key].append(fc_index)
+
+# Adds many new side1 keys to the Side1 Index - sorted once instead of one at a time
+#   keys - side1_key() of each flashcard, none of them already in the index
+def index_side1_keys(keys, ids):
+    global side1_keys
+    with side1_lock:
+        if not side1_built:
+            return
+        for key, fc_index in zip(keys, ids):
+            side1_index[key] = [fc_index]
+        side1_keys = sorted(side1_keys + keys)
+
+# Removes a flashcard from the Side1 Index
+def unindex_side1(side1, fc_index):
+    with side1_lock:
+        if not side1_built:
+            return
+        key = side1_key(side1)
+        side1_index[key].remove(fc_index)
+        if not side1_index[key]:
+            del side1_index[key]
+            del side1_keys[bisect.bisect_left(side1_keys, key)]
+
+# Row id of the first flashcard with a matching side1 (None if there is none, or
+# the Side1 Index is still being built and wait is False)
+def find_side1(side1, wait=True):
+    if isinstance(deck, SqliteDeck):
+        return deck.find_side1(side1_key(side1))
+    if not side1_ready(wait):
+        return None
+    return side1_index.get(side1_key(side1), [None])[0]
+
+# Up to limit side1 values which start with prefix, in alphabetical order
+#   (none while the Side1 Index is still being built and wait is False)
+def side1_prefix(prefix, limit=suggestion_count, wait=True):
+    if isinstance(deck, SqliteDeck):
+        return deck.side1_prefix(side1_key(prefix), limit)
+    if not side1_ready(wait):
+        return []
+    key = side1_key(prefix)
+    found = []
+    start = bisect.bisect_left(side1_keys, key)
+    for match in side1_keys[start:start + limit]:
+        if not match.startswith(key):
+            break
+        found.append(cards.side(side1_index[match][0], 0))
+    return found
+
+# Search Index - character trigrams of every side, for the fuzzy search on the Remove Screen
+#   Sides are casefolded and each word is padded ('  word '), so the start of a word
+#   matches what has been typed so far
+#   Built on a background thread once the deck has loaded, search_segment_rows
+#   flashcards at a time - each segment is sorted arrays: trigrams, where their
+#   postings start, and postings (sides with that trigram, as row id * sides + column)
+#   Flashcards added later become new segments - the smallest are merged once there
+#   are more than search_max_segments
+#   Removed flashcards stay in the segments and are skipped when searching
+#   Sides are matched on their own - a match shares at least search_min_shared of the
+#   trigrams typed, and matches are ranked by how many they share, then by how few
+#   trigrams the side has (closest to what was typed)
+search_segment_rows = 200000
+search_max_segments = 16
+search_min_shared = 1 / 3
+search_word = re.compile(r'\S+')
+
+# Casefolded text with each word padded for its trigrams
+def trigram_text(text):
+    if pd.isna(text):
+        return ''
+    return ''.join('  ' + word + ' ' for word in search_word.findall(str(text).casefold()))
+
+# Trigrams of many texts as integers (21 bits per character), and which text each
+# came from - texts are joined with '\0', which no trigram crosses
+def trigram_pairs(texts):
+    joined = '\0'.join(texts) + '\0'
+    chars = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    owner = np.repeat(np.arange(len(texts)), [len(text) + 1 for text in texts])
+    grams = (chars[:-2] << 42) | (chars[1:-1] << 21) | chars[2:]
+    valid = (chars[:-2] != 0) & (chars[1:-1] != 0) & (chars[2:] != 0)
+    return grams[valid], owner[:-2][valid]
+
+# Segment of (trigram, side) pairs - each pair is only kept once
+def trigram_segment(grams, ids):
+    order = np.lexsort((ids, grams))
+    grams = grams[order]
+    ids = ids[order]
+    keep = np.ones(len(grams), dtype=bool)
+    keep[1:] = (grams[1:] != grams[:-1]) | (ids[1:] != ids[:-1])
+    grams = grams[keep]
+    starts = np.flatnonzero(np.append(True, grams[1:] != grams[:-1]))
+    return grams[starts], np.append(starts, len(grams)), ids[keep].astype(np.int32)
+
+class SearchIndex:
+    def __init__(self, store):
+        self.cards = store
+        self.side_count = len(store.side_names)
+        self.segments = []                  # (trigrams, starts, postings)
+        self.sizes = np.zeros(0, dtype=np.int32)    # Trigrams of each side
+        self.lock = threading.Lock()
+        self.thread = None
+        self.built = threading.Event()
+
+    # Starts building the index (only the first time)
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.build, args=(self.cards.size,),
+                                           daemon=True)
+            self.thread.start()
+
+    # Indexes the flashcards there were when it was started - later ones are added
+    #   Sides are read through its own reader(), so the game can keep reading them
+    def build(self, size):
+        reader = self.cards.reader()
+        try:
+            for start in range(0, size, search_segment_rows):
+                ids = np.arange(start, min(start + search_segment_rows, size))
+                self.add_segment(ids[self.cards.alive[ids]], reader)
+        finally:
+            self.cards.close_reader(reader)
+        self.built.set()
+
+    # Indexes new flashcards - nothing to do before the index has been started
+    def add(self, ids):
+        if self.thread is not None:
+            self.add_segment(np.asarray(ids, dtype=np.intp), self.cards)
+
+    def add_segment(self, ids, store):
+        if len(ids) == 0:
+            return
+        side_count = self.side_count
+        texts = [trigram_text(fc_sides[col]) if col < len(fc_sides) else ''
+                 for fc_sides in store.side_rows(ids) for col in range(side_count)]
+        sides = (ids[:, None] * side_count + np.arange(side_count)).ravel()
+        grams, owner = trigram_pairs(texts)
+        segment = trigram_segment(grams, sides[owner])
+        counted, counts = np.unique(segment[2], return_counts=True)
+        with self.lock:
+            if len(self.sizes) < self.cards.size * side_count:
+                self.sizes = np.append(self.sizes, np.zeros(
+                    len(self.cards.alive) * side_count - len(self.sizes), dtype=np.int32))
+            self.sizes[counted] = counts
+            self.segments.append(segment)
+            if len(self.segments) > search_max_segments:
+                self.merge()
+
+    # Merges the two smallest segments
+    def merge(self):
+        self.segments.sort(key=lambda segment: len(segment[2]), reverse=True)
+        small = self.segments[-2:]
+        del self.segments[-2:]
+        grams = np.concatenate([np.repeat(keys, np.diff(starts)) for keys, starts, _ in small])
+        ids = np.concatenate([postings for _, _, postings in small])
+        self.segments.append(trigram_segment(grams, ids))
+
+    # Row ids of up to limit flashcards most like query, best first
+    #   The last word may still be being typed - the trigram ending it only counts
+    #   towards the ranking, so a whole word comes before longer words it starts
+    def search(self, query, limit=suggestion_count):
+        words = search_word.findall(query.casefold())
+        if not words:
+            return []
+        text = ''.join('  ' + word + ' ' for word in words)
+        grams = np.unique(trigram_pairs([text])[0])
+        typed = len(trigram_pairs([text[:-1]])[0])
+        with self.lock:
+            segments = list(self.segments)
+            sizes = self.sizes
+        found = []
+        for keys, starts, postings in segments:
+            if len(keys) == 0:
+                continue
+            ind = np.minimum(np.searchsorted(keys, grams), len(keys) - 1)
+            for num in ind[keys[ind] == grams].tolist():
+                found.append(postings[starts[num]:starts[num + 1]])
+        if not found:
+            return []
+        shared = np.bincount(np.concatenate(found))
+        sides = np.flatnonzero(shared >= max(1, search_min_shared * typed))
+        sides = sides[self.cards.alive[sides // self.side_count]]
+        # Ranked by trigrams shared, then fewest trigrams - only the best are sorted
+        score = shared[sides].astype(np.int64) * (1 << 32) - sizes[sides]
+        best_count = limit * self.side_count
+        if len(sides) > best_count:
+            best = np.argpartition(-score, best_count - 1)[:best_count]
+            sides, score = sides[best], score[best]
+        ids = sides[np.lexsort((sides, -score))] // self.side_count
+        # Best side of each flashcard
+        ids, first = np.unique(ids, return_index=True)
+        return ids[np.argsort(first)][:limit].tolist()
+
+search_index = None
+
+# Daily Review - returns array of indexes to test
+def daily_review():
+    check_today()
+    # Returns array of indexes to test from full list
+    with profiler.phase('review'):
+        return np.array(sorted(due_set), dtype=np.intp)
+
+# Schedulers - decide which flashcards the Daily Review tests, and in what order
+#   has_due() - True if the Daily Review button should be shown
+#   review_screen() - screen which runs the Daily Review
+#   added(fc_index) - a flashcard has been added, new_day() - the date has changed
+#   scheduler_name - 'threshold' (the original Daily Review) or 'sm2'
+scheduler_name = 'threshold'
+scheduler = None
+sm2_start_ease = 2.5
+sm2_min_ease = 1.3
+sm2_relearn_gap = 3     # Flashcards shown before a failed flashcard is shown again
+sm2_new_per_day = 20    # New flashcards introduced each day
+
+# Threshold Scheduler - correct percentage & days since last_date (Due Cache)
+#   All due flashcards are tested in row order, misses again in the next round
+class ThresholdScheduler:
+    def has_due(self):
+        return len(due_set) > 0
+
+    def review_screen(self):
+        return TestScreen(session_queue(daily_review()), daily=True)
+
+    def added(self, fc_index):
+        pass
+
+    def new_day(self):
+        pass
+
+# SM-2 Scheduler - each flashcard has an ease factor and an interval in days
+#   Due flashcards are kept in a heap of (due_date, row id), so finding the next
+#   flashcard is O(log n) - entries are never updated, a flashcard answered again
+#   gets a new entry and the old one is dropped once it reaches the top
+#   New flashcards (no due_date) are introduced in row order, sm2_new_per_day a day
+class SM2Scheduler:
+    def __init__(self):
+        if not cards.scheduled:
+            cards.init_schedule()
+        ids = cards.ids()
+        due = cards.due_date[ids]
+        new = due == no_date
+        self.due_heap = list(zip(due[~new].tolist(), ids[~new].tolist()))
+        heapq.heapify(self.due_heap)
+        self.new_queue = deque(ids[new].tolist())
+        self.new_day()
+
+    # New flashcards already introduced today
+    def new_day(self):
+        self.new_today = int(np.count_nonzero(cards.first_date[:cards.size] == today_day))
+
+    def added(self, fc_index):
+        self.new_queue.append(fc_index)
+
+    # Row id of the first flashcard due today (None if there are none)
+    def peek_due(self):
+        while self.due_heap:
+            day, fc_index = self.due_heap[0]
+            if cards.alive[fc_index] and cards.due_date[fc_index] == day:
+                return fc_index if day <= today_day else None
+            heapq.heappop(self.due_heap)
+        return None
+
+    # Row id of the next new flashcard (None if there are none, or enough for today)
+    def peek_new(self):
+        if self.new_today >= sm2_new_per_day:
+            return None
+        while self.new_queue:
+            fc_index = self.new_queue[0]
+            if cards.alive[fc_index] and cards.due_date[fc_index] == no_date:
+                return fc_index
+            self.new_queue.popleft()
+        return None
+
+    def has_due(self):
+        return self.peek_due() is not None or self.peek_new() is not None
+
+    # Flashcards likely to be asked for soon - near the top of the heap (which
+    # is only partly sorted), then the next new flashcards
+    def upcoming(self):
+        due = [fc_index for day, fc_index in sorted(self.due_heap[:prefetch_count])
+               if day <= today_day]
+        return due + list(itertools.islice(self.new_queue, prefetch_count))
+
+    def review_screen(self):
+        return ReviewScreen(self)
+
+    # Schedule Columns of a flashcard, so an answer can be taken back
+    def saved(self, fc_index):
+        return (cards.ease[fc_index], cards.interval[fc_index], cards.repetitions[fc_index],
+                cards.due_date[fc_index], cards.first_date[fc_index])
+
+    def restore(self, fc_index, saved):
+        if cards.first_date[fc_index] != saved[4]:
+            self.new_today -= 1
+        (cards.ease[fc_index], cards.interval[fc_index], cards.repetitions[fc_index],
+         cards.due_date[fc_index], cards.first_date[fc_index]) = saved
+        self.requeue(fc_index)
+
+    # Puts a flashcard back in the heap (or the new flashcards) after it changes
+    def requeue(self, fc_index):
+        if cards.due_date[fc_index] == no_date:
+            self.new_queue.appendleft(fc_index)
+        else:
+            heapq.heappush(self.due_heap, (int(cards.due_date[fc_index]), fc_index))
+
+    # SM-2 - correct is graded 4, incorrect 1
+    #   Correct - interval is 1 day, then 6 days, then the last interval times ease
+    #   Incorrect - starts again from 1 day
+    def answer(self, fc_index, is_correct):
+        if cards.first_date[fc_index] == no_date:
+            cards.first_date[fc_index] = today_day
+            self.new_today += 1
+        quality = 4 if is_correct else 1
+        if not is_correct:
+            interval = 1
+            cards.repetitions[fc_index] = 0
+        elif cards.repetitions[fc_index] == 0:
+            interval = 1
+        elif cards.repetitions[fc_index] == 1:
+            interval = 6
+        else:
+            interval = round(cards.interval[fc_index] * cards.ease[fc_index])
+        if is_correct:
+            cards.repetitions[fc_index] += 1
+        ease = cards.ease[fc_index] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+        cards.ease[fc_index] = max(sm2_min_ease, ease)
+        cards.interval[fc_index] = interval
+        cards.due_date[fc_index] = today_day + interval
+        self.requeue(fc_index)
+
+# Creates the scheduler named by scheduler_name
+def make_scheduler():
+    if scheduler_name == 'sm2':
+        return SM2Scheduler()
+    return ThresholdScheduler()
+
+# Session Queue - flashcards a Test Screen tests, chosen by filters & put in order
+#   session_block at a time as the session reaches them, so starting a session never
+#   builds a list of the whole deck
+#   session_filters - '<column> <op> <value>', a flashcard is tested if all match
+#     column - a side name (side5 = verb, ignoring case, several texts split by '|'),
+#     a score name, or accuracy (correct percentage, flashcards never answered have none)
+#     op - =, !=, <, <=, >, >=
+#   session_order - 'file' (row order), 'random', or 'weighted' (random, flashcards
+#   answered incorrectly more often are more likely to come first)
+#   session_seed - the same seed gives the same order (None - a new order every session)
+session_filters = []
+session_order = 'file'
+session_seed = None
+session_block = 1024
+session_orders = ('file', 'random', 'weighted')
+filter_spec = re.compile(r'\s*(\w+)\s*(!=|<=|>=|==|=|<|>)\s*(.*?)\s*$')
+filter_ops = {'=': np.equal, '==': np.equal, '!=': np.not_equal, '<': np.less,
+              '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
+score_arrays = ('correct', 'incorrect', 'prev_corr', 'last_date')
+
+# Splits a filter into (column, op, value)
+def parse_filter(spec):
+    match = filter_spec.match(spec)
+    if match is None or match.group(3) == '':
+        raise ValueError(f"Session filter '{spec}' should be '<column> <op> <value>'")
+    return match.groups()
+
+# Flashcards matching one filter, as a mask over the row ids
+def filter_mask(spec, store):
+    column, op, value = parse_filter(spec)
+    compare = filter_ops[op]
+    size = store.size
+    if column == 'accuracy':
+        if not re.fullmatch(r'-?\d+(\.\d*)?', value):
+            raise ValueError(f"Session filter '{spec}' - {value} is not a number")
+        answered = store.correct[:size] + store.incorrect[:size]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return compare(100 * store.correct[:size] / answered, float(value))
+    if column in store.score_names:
+        name = score_arrays[store.score_names.index(column)]
+        if name == 'prev_corr':
+            value = value in ('True', 'true', '1')
+        elif name == 'last_date':
+            value = parse_day(value)
+        elif re.fullmatch(r'-?\d+(\.\d*)?', value):
+            value = float(value)
+        else:
+            raise ValueError(f"Session filter '{spec}' - {value} is not a number")
+        return compare(getattr(store, name)[:size], value)
+    if column in store.side_names:
+        if op not in ('=', '==', '!='):
+            raise ValueError(f"Session filter '{spec}' - sides can only be = or !=")
+        mask = store.side_mask(store.side_names.index(column), value.split('|'))
+        return ~mask if op == '!=' else mask
+    raise ValueError(f"Session filter '{spec}' - there is no column named {column}")
+
+# Flashcards matching every filter (and not removed)
+def session_mask(filters, store):
+    mask = store.alive[:store.size].copy()
+    for spec in filters:
+        mask &= filter_mask(spec, store)
+    return mask
+
+# Session Queue of the flashcards matching session_filters, in session_order
+#   due - row ids of the Daily Review (None for every flashcard)
+def session_queue(due=None):
+    mask = session_mask(session_filters, cards)
+    if due is not None:
+        due_rows = np.zeros(cards.size, dtype=bool)
+        due_rows[due] = True
+        mask &= due_rows
+    weights = None
+    if session_order == 'weighted':
+        size = cards.size
+        weights = ((cards.incorrect[:size] + 1) /
+                   (cards.correct[:size] + cards.incorrect[:size] + 2))
+    return SessionQueue(mask, session_order, session_seed, weights)
+
+# Session Queue Class - row ids in mask, taken in order as they are asked for
+#   file - mask is scanned session_block rows at a time
+#   random - a seeded Feistel permutation of the row ids (padded to a power of 4)
+#   is walked session_block at a time, ids past the deck or not in mask are skipped
+#   weighted - each flashcard gets a random key (exponential / weight) and the
+#   smallest keys are taken session_block at a time (Efraimidis-Spirakis sampling)
+#   Supports len(), queue[i] & queue[start:end] like the lists it replaces
+class SessionQueue:
+    feistel_rounds = 4
+    feistel_mult = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, mask, order='file', seed=None, weights=None):
+        if order not in session_orders:
+            raise ValueError(f"Session order '{order}' should be one of {session_orders}")
+        self.mask = mask
+        self.order = order
+        self.count = int(np.count_nonzero(mask))
+        self.taken = np.zeros(min(self.count, session_block), dtype=np.intp)
+        self.filled = 0
+        self.position = 0       # Next row (file) or permutation index (random)
+        rng = np.random.default_rng(seed)
+        if order == 'random':
+            self.half_bits = max(1, (max(len(mask) - 1, 1).bit_length() + 1) // 2)
+            self.keys = rng.integers(0, 2**63, self.feistel_rounds, dtype=np.uint64)
+        elif order == 'weighted':
+            self.ids = np.flatnonzero(mask)
+            self.keys = rng.exponential(size=self.count) / weights[self.ids]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.count)
+            self.fill(stop)
+            return self.taken[start:stop:step]
+        if key < 0:
+            key += self.count
+        if not 0 <= key < self.count:
+            raise IndexError('Session Queue index out of range')
+        self.fill(key + 1)
+        return int(self.taken[key])
+
+    # Takes blocks until there are end row ids
+    def fill(self, end):
+        while self.filled < min(end, self.count):
+            block = self.next_block()
+            if self.filled + len(block) > len(self.taken):
+                self.taken = np.resize(self.taken, max(2 * len(self.taken),
+                                                       self.filled + len(block)))
+            self.taken[self.filled:self.filled + len(block)] = block
+            self.filled += len(block)
+
+    def next_block(self):
+        start = self.position
+        if self.order == 'file':
+            self.position += session_block
+            return start + np.flatnonzero(self.mask[start:self.position])
+        if self.order == 'random':
+            self.position += session_block
+            ids = self.permute(np.arange(start, self.position, dtype=np.uint64))
+            ids = ids[ids < len(self.mask)].astype(np.intp)
+            return ids[self.mask[ids]]
+        take = min(session_block, self.count - self.filled)
+        best = np.argpartition(self.keys, take - 1)[:take]
+        best = best[np.argsort(self.keys[best])]
+        self.keys[best] = np.inf
+        return self.ids[best]
+
+    # Feistel network - a bijection of [0, 4 ** half_bits)
+    def permute(self, values):
+        half = np.uint64(self.half_bits)
+        half_mask = np.uint64((1 << self.half_bits) - 1)
+        left, right = values >> half, values & half_mask
+        for key in self.keys:
+            mixed = (right ^ key) * self.feistel_mult
+            left, right = right, left ^ ((mixed >> np.uint64(32)) & half_mask)
+        return (left << half) | right
+
+# Screens - each screen is an object holding its own state
+#   update(events) - handles a frame of events, returns the screen to show next
+#   (itself to stay on this screen)
+#   draw() - draws the screen and waits for the next frame
+# Screens are swapped by run_screens(), never called from each other, so the
+# stack stays the same depth however many rounds or flashcards a session covers
+
+# Test Screen - tests a list of flashcard indexes (or a Session Queue)
+#   daily - flashcards get today as their last_date when guessed correctly
+#   Continue starts a new Test Screen with the flashcards guessed incorrectly
+class TestScreen:
+    def __init__(self, to_test=None, daily=False):
+        if to_test is None:
+            to_test = session_queue()
+        self.to_test = to_test
+        self.daily = daily
+        self.test_ind = 0
+        self.test_more = []
+        self.empty = len(to_test) == 0
+        self.renderer = Renderer()
+        self.played = None
+        self.shown()
+
+    def update(self, events):
+        if self.empty:
+            return HomeScreen()
+        state = self.state()
+        for event in events:
+            self.renderer.handle(event)
+            next_screen = self.handle(event)
+            if next_screen is not self:
+                return next_screen
+        # Redraws everything if the flashcard or buttons changed (or an image is ready)
+        if media_cache.poll() or state != self.state():
+            self.renderer.redraw()
+        return self
+
+    # Everything which changes what is drawn
+    def state(self):
+        return (self.test_ind, len(self.test_more), show_front)
+
+    # Flashcard being tested (None once all have been tested)
+    def current(self):
+        if self.test_ind < len(self.to_test):
+            return self.to_test[self.test_ind]
+        return None
+
+    def can_go_back(self):
+        return self.test_ind > 0
+
+    # A new flashcard is shown - starts timing it for the Review History
+    def shown(self):
+        self.shown_at = time.perf_counter()
+        self.flipped_at = None
+
+    # Flips the flashcard - the first flip is timed for the Review History
+    def flip(self):
+        if self.flipped_at is None:
+            self.flipped_at = time.perf_counter()
+        flip()
+
+    # Adds an answer to the Review History and starts timing the next flashcard
+    def record(self, fc_index, is_correct):
+        now = time.perf_counter()
+        flip_time = np.nan if self.flipped_at is None else self.flipped_at - self.shown_at
+        history.record(fc_index, int(is_correct), flip_time, now - self.shown_at)
+        self.shown()
+
+    # Flashcards to be tested next, for the Prefetcher
+    def upcoming(self):
+        return self.to_test[self.test_ind + 1:self.test_ind + 1 + prefetch_count]
+
+    def handle(self, event):
+        testing = self.current() is not None
+        # Hot Key Options
+        if event.type == KEYDOWN:
+            # There are still Flashcards to test
+            if testing:
+                if event.key == K_SPACE:
+                    self.flip()
+                elif event.key == K_f:
+                    self.answer(False)
+                elif event.key == K_j:
+                    self.answer(True)
+            # There are no more Flashcards to test
             else:
-                end_screen()
-                home_b.interact(pygame.mouse.get_pos())
-                if len(test_more) != 0:
-                    cont_b.interact(pygame.mouse.get_pos())
-            if test_ind > 0:
-                back_b.interact(pygame.mouse.get_pos())
-            # Update the display using flip
-            pygame.display.flip()
-    return 1
+                if event.key == K_f:
+                    save()
+                    return HomeScreen()
+                elif event.key == K_j:
+                    save()
+                    return TestScreen(self.test_more, self.daily)
+            # If there are flashcards to go back to
+            if self.can_go_back() and event.key == K_b:
+                self.back()
+        # Mouse Click Options
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            # There are still Flashcards to test
+            if testing:
+                if fc_rect.collidepoint(event.pos):
+                    self.flip()
+                elif incorr_b.rect.collidepoint(event.pos):
+                    self.answer(False)
+                elif corr_b.rect.collidepoint(event.pos):
+                    self.answer(True)
+            # Complete testing flashcards & save data
+            else:
+                if home_b.rect.collidepoint(event.pos):
+                    save()
+                    return HomeScreen()
+                if cont_b.rect.collidepoint(event.pos) and len(self.test_more) != 0:
+                    save()
+                    return TestScreen(self.test_more, self.daily)
+            # If there are flashcards to go back to
+            if self.can_go_back() and back_b.rect.collidepoint(event.pos):
+                self.back()
+        return self
 
-# Remove Flashcard
-def remove():
-    global gameOn
-    remove_tb.on = True
-    while gameOn:
-        events = pygame.event.get()
+    # Scores the current flashcard and moves on to the next one
+    def answer(self, is_correct):
+        fc_index = self.current()
+        prefetcher.drop(fc_index)
+        self.record(fc_index, is_correct)
+        if is_correct:
+            correct(fc_index, reviewed=self.daily)
+        else:
+            incorrect(fc_index)
+            self.test_more.append(fc_index)
+        self.test_ind += 1
+
+    # Goes back to the previous flashcard
+    def back(self):
+        self.test_ind -= 1
+        history.record(self.to_test[self.test_ind], -1)
+        self.test_more = previous(self.to_test[self.test_ind], self.test_more)
+        self.shown()
+
+    # Buttons & flashcard which can be hovered on the Test Screen
+    def hover_rects(self):
+        if self.current() is not None:
+            rects = [fc_rect, corr_b.rect, incorr_b.rect]
+        else:
+            rects = [home_b.rect]
+            if len(self.test_more) != 0:
+                rects.append(cont_b.rect)
+        if self.can_go_back():
+            rects.append(back_b.rect)
+        return rects
+
+    def draw(self):
+        # Nothing to test - update() goes straight back to the Home Screen
+        if self.empty:
+            return
+        self.renderer.hover_check(self.hover_rects(), pygame.mouse.get_pos())
+        idle = not self.renderer.full and not self.renderer.dirty_rects
+        self.renderer.present(self.draw_test)
+        self.play_sounds()
+        if idle:
+            prefetcher.fill(list(self.upcoming()))
+
+    # Plays the sounds of a side once, when it is first shown (or once they are decoded)
+    def play_sounds(self):
+        shown = (self.current(), show_front)
+        if shown == self.played or shown[0] is None:
+            return
+        if media_cache.play(shown[0], fc_front_ind if show_front else fc_back_ind):
+            self.played = shown
+
+    # Test Screen - Displays Flashcard and appropriate buttons
+    def draw_test(self):
         screen.fill(bg_color)
+        show_fc()
+        if self.current() is not None:
+            blit_text(screen, self.current())
+            corr_b.interact(pygame.mouse.get_pos())
+            incorr_b.interact(pygame.mouse.get_pos())
+        else:
+            end_screen()
+            home_b.interact(pygame.mouse.get_pos())
+            if len(self.test_more) != 0:
+                cont_b.interact(pygame.mouse.get_pos())
+        if self.can_go_back():
+            back_b.interact(pygame.mouse.get_pos())
+
+# Review Screen - Daily Review with the SM-2 Scheduler
+#   Flashcards are asked for one at a time, due flashcards first, then new ones
+#   Failed flashcards are shown again after sm2_relearn_gap other flashcards
+#   (or sooner if there is nothing else left), so there is no Continue round
+#   Go Back takes back the last answer only
+class ReviewScreen(TestScreen):
+    def __init__(self, sm2):
+        self.sm2 = sm2
+        self.answered = 0
+        self.relearn = []       # Heap of (answered count to show it at, row id)
+        self.undo = None
+        self.test_more = []
+        self.daily = True
+        self.renderer = Renderer()
+        self.played = None
+        self.shown()
+        self.pick()
+        self.empty = self.fc_index is None
+
+    # Once every flashcard is done - F, J or Go Home saves & goes home, as there is
+    # no Continue round
+    def handle(self, event):
+        if self.current() is None:
+            home_key = event.type == KEYDOWN and event.key in (K_f, K_j)
+            home_click = (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and
+                          home_b.rect.collidepoint(event.pos))
+            if home_key or home_click:
+                save()
+                return HomeScreen()
+        return super().handle(event)
+
+    # Chooses the next flashcard - failed flashcards whose gap has passed come first
+    def pick(self):
+        self.from_relearn = bool(self.relearn) and self.relearn[0][0] <= self.answered
+        if self.from_relearn:
+            self.fc_index = self.relearn[0][1]
+            return
+        self.fc_index = self.sm2.peek_due()
+        if self.fc_index is None:
+            self.fc_index = self.sm2.peek_new()
+        if self.fc_index is None and self.relearn:
+            self.from_relearn = True
+            self.fc_index = self.relearn[0][1]
+
+    def state(self):
+        return (self.answered, self.undo is None, show_front)
+
+    def current(self):
+        return self.fc_index
+
+    def can_go_back(self):
+        return self.undo is not None
+
+    # Failed flashcards come back first, then those near the top of the heap
+    def upcoming(self):
+        return [entry[1] for entry in sorted(self.relearn)] + self.sm2.upcoming()
+
+    def answer(self, is_correct):
+        fc_index = self.fc_index
+        prefetcher.drop(fc_index)
+        self.record(fc_index, is_correct)
+        relearn = list(self.relearn)
+        if self.from_relearn:
+            self.relearn = [entry for entry in self.relearn if entry[1] != fc_index]
+            heapq.heapify(self.relearn)
+        self.undo = (fc_index, self.sm2.saved(fc_index), relearn,
+                     (cards.correct[fc_index], cards.incorrect[fc_index],
+                      cards.prev_corr[fc_index], cards.last_date[fc_index]))
+        # Schedule changes first, so the journal record has the new due_date
+        self.sm2.answer(fc_index, is_correct)
+        if is_correct:
+            correct(fc_index, reviewed=True)
+        else:
+            incorrect(fc_index)
+            heapq.heappush(self.relearn, (self.answered + sm2_relearn_gap + 1, fc_index))
+        self.answered += 1
+        self.pick()
+
+    def back(self):
+        global show_front
+        fc_index, saved, self.relearn, scores = self.undo
+        self.undo = None
+        history.record(fc_index, -1)
+        self.shown()
+        (cards.correct[fc_index], cards.incorrect[fc_index],
+         cards.prev_corr[fc_index], cards.last_date[fc_index]) = scores
+        self.sm2.restore(fc_index, saved)
+        update_due(fc_index)
+        deck_stats.update(fc_index)
+        journal_card(fc_index)
+        show_front = True
+        self.answered -= 1
+        self.pick()
+        # The flashcard which was taken back is shown again, even if another is due first
+        self.fc_index = fc_index
+        self.from_relearn = any(entry[1] == fc_index for entry in self.relearn)
+
+# Prints lines of small text below a Textbox
+def below_textbox(textbox, lines, color=text_color):
+    line_y = textbox.y_pos + tb_height + spacing / 8
+    for line in lines:
+        line_surf = render_text(line, color, small_font)
+        screen.blit(line_surf, (tb_font_x_pos, line_y))
+        line_y += line_surf.get_height()
+
+# Remove Screen - user inputs side1 of the Flashcard to Remove
+class RemoveScreen:
+    def __init__(self):
+        remove_tb.on = True
+        search_index.start()
+        self.query = None
+        self.results = []       # Row ids of the flashcards found, best first
+        self.selected = 0
+
+    def update(self, events):
         # User Inputs
         remove_tb.textinput.update(events)
+        self.refresh()
         for event in events:
-            screen.fill(bg_color)
-            # Check to Quit Game      
-            if event.type == QUIT:
-                gameOn = False
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if cont_b.rect.collidepoint(event.pos):
-                    return search(remove_tb.textinput.value)
+                    return self.search()
                 if home_b.rect.collidepoint(event.pos):
                     remove_tb.clear()
-                    return 2
+                    return HomeScreen()
+                for fc_index, rect in zip(self.results, self.result_rects()):
+                    if rect.collidepoint(event.pos):
+                        return SearchScreen(fc_index=fc_index)
                 remove_tb.tb_click(event.pos)
             # Hot Key Options
-            if event.type == KEYDOWN and event.key == K_RETURN:
-                return search(remove_tb.textinput.value)
+            if event.type == KEYDOWN:
+                if event.key == K_RETURN:
+                    return self.search()
+                if event.key == K_DOWN and self.results:
+                    self.selected = (self.selected + 1) % len(self.results)
+                if event.key == K_UP and self.results:
+                    self.selected = (self.selected - 1) % len(self.results)
+        return self
+
+    # Searches again when what has been typed changes (or the Search Index is ready)
+    #   An exact side1 match always comes first
+    def refresh(self):
+        query = (remove_tb.textinput.value, search_index.built.is_set(), side1_built)
+        if query == self.query:
+            return
+        self.query = query
+        self.selected = 0
+        self.results = []
+        if search_index.built.is_set():
+            self.results = search_index.search(query[0])
+            exact = find_side1(query[0], wait=False) if query[0] != '' else None
+            if exact is not None:
+                self.results = [exact] + [fc_index for fc_index in self.results
+                                          if fc_index != exact][:suggestion_count - 1]
+
+    # Selected flashcard - or the exact side1 typed, as before the Search Index
+    def search(self):
+        if self.results:
+            return SearchScreen(fc_index=self.results[self.selected])
+        return SearchScreen(remove_tb.textinput.value)
+
+    # Rows of the results below the Textbox
+    def result_rects(self):
+        row_height = small_font.get_linesize() + spacing / 8
+        top = remove_tb.y_pos + tb_height + spacing / 8
+        return [pygame.Rect(tb_x_pos, top + num * row_height, tb_width, row_height - 2)
+                for num in range(len(self.results))]
+
+    # Sides of a flashcard on one line, cut short to fit below the Textbox
+    def result_line(self, fc_index):
+        fc_sides = [str(side) for side in cards.side_rows(np.array([fc_index]))[0]
+                    if not pd.isna(side) and str(side) != '']
+        lines = wrap_text(' - '.join(fc_sides), small_font, tb_width - 2*tb_spacing)
+        return lines[0] if len(lines) == 1 else lines[0] + '...'
+
+    def draw(self):
+        screen.fill(bg_color)
         # Shows Relavent Textboxes
         remove_tb.tb_box_show()
         # Shows Relavent Buttons
@@ -450,37 +3619,46 @@ def remove():
         # Blit its surface onto the screen
         remove_tb.tb_text_show()
         # Shows Text Above Textbox
-        top_text("Input side1 of Flashcard to Remove")
-        pygame.display.update()
-        clock.tick(30)
-    return 0
-
-
-# Search for flashcard to Remove
-# Takes in string and searches flashcards for side1
-#   Assumes all side1 are unique
-def search(search_for):
-    global gameOn, fc_set, rows
-    found_ind = rows
-    # Flashcards are searched to find a match for user_input on side1
-    for ind in range(rows):
-        if fc_set.iloc[ind, 0].lower() == search_for.lower():
-            found_ind = ind
-    while gameOn:
-        screen.fill(bg_color)
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                gameOn = False
+        top_text("Search for a Flashcard to Remove")
+        # Shows the flashcards found, the selected one highlighted
+        if self.results:
+            mouse_pos = pygame.mouse.get_pos()
+            for num, rect in enumerate(self.result_rects()):
+                if num == self.selected:
+                    pygame.draw.rect(screen, light_color, rect, border_radius=fc_radius)
+                elif rect.collidepoint(mouse_pos):
+                    pygame.draw.rect(screen, light_color, rect, 2, border_radius=fc_radius)
+                line_surf = render_text(self.result_line(self.results[num]), text_color,
+                                        small_font)
+                screen.blit(line_surf, (tb_font_x_pos,
+                                        rect.y + (rect.height - line_surf.get_height()) / 2))
+        # Shows side1 of Flashcards which start with what has been typed, until the
+        # Search Index is ready
+        elif remove_tb.textinput.value != '' and not search_index.built.is_set():
+            below_textbox(remove_tb, side1_prefix(remove_tb.textinput.value, wait=False))
+        show_frame()
+        wait_frame(menu_fps_cap)
+
+# Search Screen - shows the flashcard to Remove and asks for confirmation
+# Takes in the flashcard chosen from the search results, or a string and looks up
+# side1 in the Side1 Index
+#   If side1 is not unique, the first flashcard is found
+class SearchScreen:
+    def __init__(self, search_for=None, fc_index=None):
+        self.found_ind = fc_index
+        if fc_index is None:
+            self.found_ind = find_side1(search_for)
+        self.message = "The Flashcard does not Exist"
+
+    def update(self, events):
+        for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if cont_b.rect.collidepoint(event.pos):
-                    fc_set = fc_set.drop(ind)
-                    rows = fc_set.shape[0]
-                    end_screen(text="The Flashcard has been Removed")
-                    save()
+                    self.confirm()
                 if home_b.rect.collidepoint(event.pos):
-                    return 1
+                    return HomeScreen()
                 if back_b.rect.collidepoint(event.pos):
-                    return remove()
+                    return RemoveScreen()
                 if fc_rect.collidepoint(event.pos):
                     flip()
             # Hot Key Options
@@ -488,55 +3666,57 @@ def search(search_for):
                 if event.key == K_SPACE:
                     flip()
                 if event.key == K_RETURN:
-                    fc_set = fc_set.drop(ind)
-                    rows = fc_set.shape[0]
-                    end_screen(text="The Flashcard has been Removed")
-                    save()
-            # Displays Flashcard and appropriate buttons
-            show_fc()
-            # If Flashcard is Found
-            if found_ind < rows:
-                blit_text(screen, found_ind)
-                conf_b.interact(pygame.mouse.get_pos())
-            # If Flashcard does not exist
-            else:
-                end_screen(text="The Flashcard does not Exist")
-            back_b.interact(pygame.mouse.get_pos())
-            home_b.interact(pygame.mouse.get_pos())
-            # Update the display using flip
-            pygame.display.flip()
-    return 0
+                    self.confirm()
+        return self
 
-# Add Flashcard
-def add(side=0, new_fc=[]):
-    global gameOn, fc_set
-    add_tb.on = True
-    add_tb.textinput.manager = tb_manager
-    while gameOn:
+    # Removes the flashcard which was found
+    def confirm(self):
+        if self.found_ind is not None:
+            remove_card(self.found_ind)
+            self.found_ind = None
+            self.message = "The Flashcard has been Removed"
+            save()
+
+    def draw(self):
         screen.fill(bg_color)
-        events = pygame.event.get()
+        # Displays Flashcard and appropriate buttons
+        show_fc()
+        # If Flashcard is Found
+        if self.found_ind is not None:
+            blit_text(screen, self.found_ind)
+            conf_b.interact(pygame.mouse.get_pos())
+        # If Flashcard does not exist (or has just been removed)
+        else:
+            end_screen(text=self.message)
+        back_b.interact(pygame.mouse.get_pos())
+        home_b.interact(pygame.mouse.get_pos())
+        show_frame()
+        wait_frame(menu_fps_cap)
+
+# Add Screen - user inputs each side, then confirms the new Flashcard
+#   new_fc - sides input so far, a new list for every Add Screen
+class AddScreen:
+    def __init__(self):
+        self.side = 0
+        self.new_fc = []
+        add_tb.on = True
+        add_tb.textinput.manager = tb_manager
+
+    def update(self, events):
         # User Inputs
         add_tb.textinput.update(events)
-
         for event in events:
-            if event.type == QUIT:
-                    gameOn = False
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 # Return to Home Screen
                 if home_b.rect.collidepoint(event.pos):
                     add_tb.clear()
                     add_tb.on = False
-                    return 1
+                    return HomeScreen()
                 # All Sides have been Input - Show flashcard for confirmation
-                if side >= columns - 4:
+                if self.side >= columns - 4:
                     # User Confirms & Adds Flashcard
                     if conf_b.rect.collidepoint(event.pos):
-                        add_tb.clear()
-                        new_fc.extend([0, 0, False, today.strftime(date_format)])
-                        fc_set.iloc[len(fc_set)] = new_fc
-                        end_screen(text="The Flashcard has been Added")
-                        save()
-                        return 1
+                        return self.confirm()
                     # Flip to see other side of Flashcard
                     if fc_rect.collidepoint(event.pos):
                         flip()
@@ -544,129 +3724,1034 @@ def add(side=0, new_fc=[]):
                 else:
                     # User Confirms Side
                     if conf_b.rect.collidepoint(event.pos):
-                        new_fc.extend([add_tb.textinput.value])
-                        add_tb.clear()
-                        side += 1
-                        return add(side, new_fc)
+                        self.next_side()
+                        return self
                     add_tb.tb_click(event.pos)
-                # If not on first side
-                if side > 0:
-                    # Goes back one side
-                    if back_b.rect.collidepoint(event.pos):
-                        side -= 1
-                        new_fc.pop()
-                        return add(side, new_fc)
+                # If not on first side - Goes back one side
+                if self.side > 0 and back_b.rect.collidepoint(event.pos):
+                    self.side -= 1
+                    self.new_fc.pop()
+                    return self
             # Hot Key Options
             if event.type == KEYDOWN:
-                if (event.key == K_SPACE) and (side >= columns - 4):
+                if (event.key == K_SPACE) and (self.side >= columns - 4):
                     flip()
                 if event.key == K_RETURN:
                     # User Confirms to Add new Flashcard
-                    if side >= columns - 4:
-                        add_tb.clear()
-                        new_fc.extend([0, 0, False, today.strftime(date_format)])
-                        fc_set.iloc[len(fc_set)] = new_fc
-                        end_screen(text="The Flashcard has been Added")
-                        save()
-                        return 1
+                    if self.side >= columns - 4:
+                        return self.confirm()
                     # User Confirms Side
                     else:
-                        new_fc.extend([add_tb.textinput.value])
-                        add_tb.clear()
-                        side += 1
-                        return add(side, new_fc)
+                        self.next_side()
+                        return self
+        return self
+
+    # Keeps the side which has been input and moves on to the next one
+    def next_side(self):
+        self.new_fc.append(add_tb.textinput.value)
+        add_tb.clear()
+        self.side += 1
+
+    # Adds the new Flashcard and returns to the Home Screen
+    def confirm(self):
+        add_tb.clear()
+        add_card(self.new_fc + [0, 0, False, today.strftime(date_format)])
+        save()
+        return HomeScreen()
+
+    def draw(self):
+        screen.fill(bg_color)
         # Shows Appropriate Buttons
-        if side > 0:
+        if self.side > 0:
             back_b.interact(pygame.mouse.get_pos())
         home_b.interact(pygame.mouse.get_pos())
         conf_b.interact(pygame.mouse.get_pos())
 
         # Flashcard if all Sides Input
-        if side >= columns - 4:
+        if self.side >= columns - 4:
             show_fc()
-            blit_text(screen, 0, fc_set=pd.DataFrame(new_fc).T)
+            blit_text(screen, 0, card_sides=self.new_fc)
         # Tells User which side to Input
         else:
-            top_text("This is Side" + str(side + 1))
+            top_text("This is Side" + str(self.side + 1))
             add_tb.tb_box_show()
             add_tb.tb_text_show()
-        
-        pygame.display.update()
-        clock.tick(30)
-        
+            # Warns if side1 is already used by another flashcard
+            if (self.side == 0 and add_tb.textinput.value != '' and
+                    find_side1(add_tb.textinput.value, wait=False) is not None):
+                below_textbox(add_tb, ["A Flashcard with this side1 already exists"],
+                              comp_2)
 
-# Saves data as CSV - Overrides current CSV
-def save(updated_fc_set = fc_set):
-    updated_fc_set.to_csv(fc_csv_name, index=False)
+        show_frame()
+        wait_frame(menu_fps_cap)
 
- 
-# Define the dimensions of screen object
-screen = pygame.display.set_mode((s_width, s_height))
-pygame.display.set_caption('Flashcard Test')
-
-# Initialize Flashcard Testing Buttons
-corr_b = Button("Correct", comp_1, bg_color, xr_pos, yd_pos)
-incorr_b = Button("Incorrect", comp_2, bg_color, xl_pos, yd_pos)
-back_b = Button("Go Back", light_color, text_color, xc_pos, yd_pos)
-
-# Initialize End Screen Buttons
-home_b = Button("Go Home", comp_2, bg_color, xl_pos, yd_pos)
-cont_b = Button("Continue", comp_1, bg_color, xr_pos, yd_pos)
-conf_b = Button("Confirm", comp_1, bg_color, xr_pos, yd_pos)
-
-# Initialize Start/Home Screen Buttons
-test_all_b = Button("Test All", light_color, text_color, xc_pos, y1_pos)
-daily_b = Button("Daily", comp_1, bg_color, xc_pos, y4_pos)
-add_b = Button("Add", light_color, text_color, xc_pos, y2_pos)
-remove_b = Button("Remove", light_color, text_color, xc_pos, y3_pos)
-
-# Remove Textboxes
-remove_tb = Textbox("Remove", fc_y_mid)
-add_tb = Textbox("Add", fc_y_mid)
-
-# Game loop - Start Screen
-while gameOn:
-    # for loop through the event queue
-    for event in pygame.event.get():
-        screen.fill(bg_color)
-        # Check to Quit Game      
-        if event.type == QUIT:
-            gameOn = False
+# Home Screen - Shows Buttons
+class HomeScreen:
+    def __init__(self):
+        self.renderer = Renderer()
 
-        # Hot Key Options
-        if event.type == KEYDOWN:
-            # Pressing 1 - Tests all Flashcards
-            if event.key == K_1:
-                test_all()
-            # Pressing 2 - Add Flashcard
-            if event.key == K_2:
-                add()
-            # Pressing 3 - Remove Flashcard
-            if event.key == K_3:
-                remove()
-            # Pressing 4 - Tests Daily Review
-            if event.key == K_4:
-                test_all(to_test=daily_review(), daily=True)
-        # Mouse Click Options
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            if test_all_b.rect.collidepoint(event.pos):
-                test_all()
-            if daily_b.rect.collidepoint(event.pos):
-                test_all(to_test=daily_review(), daily=True)
-            if add_b.rect.collidepoint(event.pos):
-                add_tb.textinput.value = ''
-                add()
-            if remove_b.rect.collidepoint(event.pos):
-                remove_tb.textinput.value = ''
-                remove()
-
-        # Shows Buttons
+    def update(self, events):
+        daily_shown = scheduler.has_due()
+        for event in events:
+            self.renderer.handle(event)
+            # Hot Key Options
+            if event.type == KEYDOWN:
+                # Pressing 1 - Tests all Flashcards
+                if event.key == K_1:
+                    return TestScreen()
+                # Pressing 2 - Add Flashcard
+                if event.key == K_2:
+                    add_tb.textinput.value = ''
+                    return AddScreen()
+                # Pressing 3 - Remove Flashcard
+                if event.key == K_3:
+                    remove_tb.textinput.value = ''
+                    return RemoveScreen()
+                # Pressing 4 - Tests Daily Review
+                if event.key == K_4:
+                    return scheduler.review_screen()
+                # Pressing 5 - Deck Library
+                if event.key == K_5 and library_dir is not None:
+                    return LibraryScreen()
+                # Pressing 6 - Bulk Import
+                if event.key == K_6:
+                    import_tb.textinput.value = ''
+                    return ImportScreen()
+                # Pressing 7 - Stats
+                if event.key == K_7:
+                    return StatsScreen()
+            # Mouse Click Options
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if test_all_b.rect.collidepoint(event.pos):
+                    return TestScreen()
+                if daily_b.rect.collidepoint(event.pos) and daily_shown:
+                    return scheduler.review_screen()
+                if add_b.rect.collidepoint(event.pos):
+                    add_tb.textinput.value = ''
+                    return AddScreen()
+                if remove_b.rect.collidepoint(event.pos):
+                    remove_tb.textinput.value = ''
+                    return RemoveScreen()
+                if decks_b.rect.collidepoint(event.pos) and library_dir is not None:
+                    return LibraryScreen()
+                if import_b.rect.collidepoint(event.pos):
+                    import_tb.textinput.value = ''
+                    return ImportScreen()
+                if stats_b.rect.collidepoint(event.pos):
+                    return StatsScreen()
+        # Redraws everything if the Daily Review button appears or disappears
+        check_today()
+        if daily_shown != scheduler.has_due():
+            self.renderer.redraw()
+        return self
+
+    # Buttons which can be hovered on the Home Screen
+    def hover_rects(self):
+        rects = [test_all_b.rect, add_b.rect, remove_b.rect, import_b.rect, stats_b.rect]
+        if scheduler.has_due():
+            rects.append(daily_b.rect)
+        if library_dir is not None:
+            rects.append(decks_b.rect)
+        return rects
+
+    def draw(self):
+        self.renderer.hover_check(self.hover_rects(), pygame.mouse.get_pos())
+        self.renderer.present(self.draw_home)
+
+    def draw_home(self):
+        screen.fill(bg_color)
         # Only shows Daily Review if not done yet
-        if len(daily_review()) > 0:
+        if scheduler.has_due():
             daily_b.interact(pygame.mouse.get_pos())
         test_all_b.interact(pygame.mouse.get_pos())
         add_b.interact(pygame.mouse.get_pos())
         remove_b.interact(pygame.mouse.get_pos())
+        import_b.interact(pygame.mouse.get_pos())
+        stats_b.interact(pygame.mouse.get_pos())
+        if library_dir is not None:
+            decks_b.interact(pygame.mouse.get_pos())
+
+# Import Screen - user inputs the file to Bulk Import, which is imported in the
+# background while a progress bar is shown, then the result is shown
+class ImportScreen:
+    def __init__(self):
+        import_tb.on = True
+        self.thread = None
+        self.message = None
+
+    def update(self, events):
+        # Importing - events are ignored until it is done
+        if self.thread is not None:
+            if not self.thread.is_alive():
+                self.thread = None
+            return self
+        import_tb.textinput.update(events)
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if home_b.rect.collidepoint(event.pos):
+                    import_tb.clear()
+                    return HomeScreen()
+                if conf_b.rect.collidepoint(event.pos):
+                    self.start()
+                import_tb.tb_click(event.pos)
+            # Hot Key Options
+            if event.type == KEYDOWN and event.key == K_RETURN:
+                self.start()
+        return self
+
+    # Starts importing the file which has been input
+    def start(self):
+        path = import_tb.textinput.value.strip()
+        if path != '':
+            self.thread = threading.Thread(target=self.run, args=(path,), daemon=True)
+            self.thread.start()
+
+    def run(self, path):
+        try:
+            self.message = bulk_report(bulk_import(path))
+        # Any error (from the file or the worker pool) is shown, not lost with the thread
+        except Exception as error:
+            self.message = "Could not import: " + (str(error) or type(error).__name__)
+
+    def draw(self):
+        if self.thread is not None:
+            draw_loading("Importing Flashcards")
+        else:
+            screen.fill(bg_color)
+            import_tb.tb_box_show()
+            conf_b.interact(pygame.mouse.get_pos())
+            home_b.interact(pygame.mouse.get_pos())
+            import_tb.tb_text_show()
+            top_text("Input the File to Import (CSV, TSV or Anki text)")
+            if self.message is not None:
+                below_textbox(import_tb, [self.message])
+        show_frame()
+        wait_frame(menu_fps_cap)
+
+# Stats Screen - accuracy, tags, due backlog & answers per day of the open deck
+#   The charts are drawn onto one surface, which is only drawn again when the Deck
+#   Stats (or the day) change - every other frame only blits it
+class StatsScreen:
+    def __init__(self):
+        if not deck_stats.built:
+            deck_stats.build()
+
+    def update(self, events):
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if home_b.rect.collidepoint(event.pos):
+                    return HomeScreen()
+            if event.type == KEYDOWN and event.key in (K_f, K_ESCAPE):
+                return HomeScreen()
+        return self
+
+    def draw(self):
+        screen.fill(bg_color)
+        screen.blit(stats_chart(), (0, 0))
+        home_b.interact(pygame.mouse.get_pos())
+        show_frame()
+        wait_frame(menu_fps_cap)
+
+# Charts of the Deck Stats, cached until they change
+def stats_chart():
+    with deck_stats.lock:
+        key = (deck_stats.version, int(today_day))
+        if deck_stats.chart_key != key:
+            deck_stats.chart = draw_stats()
+            deck_stats.chart_key = key
+    return deck_stats.chart
+
+def draw_stats():
+    surface = pygame.Surface((s_width, yd_pos), pygame.SRCALPHA)
+    answers = deck_stats.correct_sum + deck_stats.incorrect_sum
+    summary = (f"{cards.count} flashcards, {deck_stats.tested} tested, "
+               f"{deck_stats.correct_sum / max(answers, 1):.0%} correct, "
+               f"{len(due_set)} due")
+    title = render_text("Deck Stats", text_color)
+    line = render_text(summary, text_color, small_font)
+    surface.blit(title, ((s_width - title.get_width()) / 2, spacing / 4))
+    top = spacing / 4 + title.get_height()
+    surface.blit(line, ((s_width - line.get_width()) / 2, top))
+    top += line.get_height() + spacing / 8
+    # 2 x 2 panels between the summary & the Go Home button
+    width = (s_width - 3 * spacing / 2) / 2
+    height = (yd_pos - spacing / 4 - top - spacing / 4) / 2
+    panels = [pygame.Rect(spacing / 2 + col * (width + spacing / 2),
+                          top + row * (height + spacing / 4), width, height)
+              for row in range(2) for col in range(2)]
+    labels = [str(num * 100 // stats_buckets) for num in range(stats_buckets)]
+    draw_bars(surface, panels[0], "Accuracy (%)", labels, deck_stats.accuracy.tolist(),
+              comp_1)
+    tags = deck_stats.tags.most_common()
+    shown = [(tag or '-', count) for tag, count in tags[:stats_tag_count] if count > 0]
+    other = sum(count for _, count in tags[stats_tag_count:])
+    if other > 0:
+        shown.append(("other", other))
+    side_name = (cards.side_names[stats_tag_side]
+                 if stats_tag_side < len(cards.side_names) else "Tags")
+    draw_bars(surface, panels[1], f"Flashcards by {side_name}",
+              [tag for tag, _ in shown], [count for _, count in shown], text_color)
+    names, counts = deck_stats.backlog()
+    draw_bars(surface, panels[2], "Due (days overdue)", names, counts, comp_2)
+    days = range(int(today_day) - stats_trend_days + 1, int(today_day) + 1)
+    trend = [deck_stats.trend.get(day, [0, 0]) for day in days]
+    draw_bars(surface, panels[3], "Answers (% correct)",
+              [format_day(day)[3:5] for day in days], [total for total, _ in trend],
+              light_color, [correct / total if total else None for total, correct in trend])
+    return surface
+
+# Bar chart in rect - title above, labels below the bars
+#   rates - optional fractions (0 to 1) drawn as a line over the bars
+def draw_bars(surface, rect, title, labels, values, color, rates=None):
+    pygame.draw.rect(surface, light_color, rect, 2, border_radius=fc_radius)
+    title_surf = render_text(title, text_color, small_font)
+    surface.blit(title_surf, (rect.x + spacing / 8, rect.y + spacing / 16))
+    label_height = small_font.get_linesize()
+    chart = pygame.Rect(rect.x + spacing / 8, rect.y + spacing / 8 + label_height,
+                        rect.width - spacing / 4, rect.height - spacing / 4 - 2 * label_height)
+    if not values:
+        return
+    slot = chart.width / len(values)
+    most = max(max(values), 1)
+    points = []
+    for num, (label, value) in enumerate(zip(labels, values)):
+        bar_height = chart.height * value / most
+        bar = pygame.Rect(chart.x + num * slot + slot / 8, chart.bottom - bar_height,
+                          slot * 3 / 4, bar_height)
+        pygame.draw.rect(surface, color, bar)
+        label_surf = render_text(label, text_color, small_font)
+        # Labels are left out when they would overlap
+        step = max(1, int(np.ceil(label_surf.get_width() / slot)))
+        if num % step == 0:
+            surface.blit(label_surf, (chart.x + (num + 0.5) * slot - label_surf.get_width() / 2,
+                                      chart.bottom + 2))
+        if rates is not None and rates[num] is not None:
+            points.append((chart.x + (num + 0.5) * slot, chart.bottom - chart.height * rates[num]))
+    if len(points) > 1:
+        pygame.draw.lines(surface, comp_1, False, points, 2)
+    for point in points:
+        pygame.draw.circle(surface, comp_1, point, 3)
+
+# Library Screen - lists the decks in the Deck Library with their flashcards due today
+#   Up & Down (or the mouse wheel) choose a deck, Enter or a click opens it
+#   Decks still in memory open straight away, others are loaded first
+class LibraryScreen:
+    def __init__(self):
+        stash_deck()
+        self.names = sorted(library)
+        self.selected = 0
+        self.top = 0
+        if open_deck_name in library:
+            self.selected = self.names.index(open_deck_name)
+        self.row_height = small_font.get_linesize() + spacing / 8
+        self.list_y = spacing / 2 + font.get_linesize()
+        self.row_count = int((yd_pos - spacing / 4 - self.list_y) // self.row_height)
+        self.scroll(0)
+
+    # Moves the selection, keeping it in the rows shown
+    def scroll(self, step):
+        self.selected = min(max(self.selected + step, 0), max(len(self.names) - 1, 0))
+        self.top = min(max(self.top, self.selected - self.row_count + 1), self.selected)
+
+    def row_rects(self):
+        return [pygame.Rect(tb_x_pos, self.list_y + num * self.row_height, tb_width,
+                            self.row_height - 2)
+                for num in range(min(self.row_count, len(self.names) - self.top))]
+
+    # Opens a deck - straight to the Home Screen if it is still in memory
+    def open(self, name):
+        if name in open_decks:
+            restore_deck(name)
+            return HomeScreen()
+        return LoadingScreen(name)
+
+    def update(self, events):
+        for event in events:
+            if event.type == KEYDOWN:
+                if event.key == K_UP:
+                    self.scroll(-1)
+                elif event.key == K_DOWN:
+                    self.scroll(1)
+                elif event.key == K_RETURN and self.names:
+                    return self.open(self.names[self.selected])
+            if event.type == pygame.MOUSEWHEEL:
+                self.scroll(-event.y)
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if home_b.rect.collidepoint(event.pos) and open_deck_name is not None:
+                    return HomeScreen()
+                for num, rect in enumerate(self.row_rects()):
+                    if rect.collidepoint(event.pos):
+                        return self.open(self.names[self.top + num])
+        return self
+
+    def draw(self):
+        screen.fill(bg_color)
+        title = render_text("Decks" if self.names else "No Decks in " + library_dir,
+                            text_color)
+        screen.blit(title, ((s_width - title.get_width()) / 2, spacing / 4))
+        mouse_pos = pygame.mouse.get_pos()
+        for num, rect in enumerate(self.row_rects()):
+            name = self.names[self.top + num]
+            entry = library[name]
+            if self.top + num == self.selected:
+                pygame.draw.rect(screen, light_color, rect, border_radius=fc_radius)
+            elif rect.collidepoint(mouse_pos):
+                pygame.draw.rect(screen, light_color, rect, 2, border_radius=fc_radius)
+            info = render_text(f"{entry['cards']} flashcards, {due_count(entry)} due",
+                               text_color, small_font)
+            screen.blit(render_text(name, text_color, small_font),
+                        (tb_font_x_pos, rect.y + spacing / 16))
+            screen.blit(info, (rect.right - tb_spacing - info.get_width(),
+                               rect.y + spacing / 16))
+        if open_deck_name is not None:
+            home_b.interact(mouse_pos)
+        show_frame()
+        wait_frame(menu_fps_cap)
 
-    # Update the display using flip
+# Loading Screen - progress bar while a deck from the Deck Library is loaded
+class LoadingScreen:
+    def __init__(self, name):
+        global load_progress
+        load_progress = 0.0
+        deck_loaded.clear()
+        threading.Thread(target=load_deck_thread, args=(lambda: load_library_deck(name),),
+                         daemon=True).start()
+
+    def update(self, events):
+        if deck_loaded.is_set():
+            if load_error is not None:
+                raise load_error
+            return HomeScreen()
+        return self
+
+    def draw(self):
+        draw_loading()
+        show_frame()
+        wait_frame(fps_cap)
+
+# Runs the screens, starting with first, until the game is closed
+def run_screens(first):
+    global gameOn
+    current = first
+    while gameOn:
+        profiler.start_frame()
+        with profiler.phase('events'):
+            events = pygame.event.get()
+        # Check to Quit Game
+        for event in events:
+            if event.type == QUIT:
+                gameOn = False
+        events = profiler.handle(events)
+        with profiler.phase('update'):
+            current = current.update(events)
+        with profiler.phase('draw'):
+            current.draw()
+        profiler.end_frame(current, len(events))
+    return current
+
+# Saves data - queued journal records are synced to disk by the Save Worker,
+# the CSV is only rewritten once the journal grows past journal_max_bytes
+#   Binary Deck - changed records are flushed to disk, nothing is rewritten
+#   Review History - the buffered answers are queued for the Save Worker to append
+#   Never waits for the disk - errors from earlier saves are raised here
+def save():
+    if save_worker.error is not None:
+        raise save_worker.error
+    with profiler.phase('save'):
+        history.flush()
+        save_worker.save(cards.snapshot() if save_worker.compact_wanted else None)
+
+# Stops the Save Worker - all changes are written back into the CSV first
+def close_deck():
+    save_worker.close()
+
+ 
+# Screen, Buttons & Textboxes - created by init_screen()
+screen = None
+
+# Opens the window and creates the Buttons & Textboxes
+def init_screen():
+    global screen, corr_b, incorr_b, back_b, home_b, cont_b, conf_b
+    global test_all_b, daily_b, add_b, remove_b, decks_b, import_b, stats_b, remove_tb, add_tb
+    global import_tb
+    start = time.perf_counter()
+    pygame.display.init()
+    # Define the dimensions of screen object
+    screen = pygame.display.set_mode((s_width, s_height))
+    pygame.display.set_caption('Flashcard Test')
+    # Enable key repeat:
+    pygame.key.set_repeat(200, 25)
+
+    # Initialize Flashcard Testing Buttons
+    corr_b = Button("Correct", comp_1, bg_color, xr_pos, yd_pos)
+    incorr_b = Button("Incorrect", comp_2, bg_color, xl_pos, yd_pos)
+    back_b = Button("Go Back", light_color, text_color, xc_pos, yd_pos)
+
+    # Initialize End Screen Buttons
+    home_b = Button("Go Home", comp_2, bg_color, xl_pos, yd_pos)
+    cont_b = Button("Continue", comp_1, bg_color, xr_pos, yd_pos)
+    conf_b = Button("Confirm", comp_1, bg_color, xr_pos, yd_pos)
+
+    # Initialize Start/Home Screen Buttons
+    test_all_b = Button("Test All", light_color, text_color, xc_pos, y1_pos)
+    daily_b = Button("Daily", comp_1, bg_color, xc_pos, y4_pos)
+    add_b = Button("Add", light_color, text_color, xc_pos, y2_pos)
+    remove_b = Button("Remove", light_color, text_color, xc_pos, y3_pos)
+    decks_b = Button("Decks", light_color, text_color, xl_pos, y1_pos)
+    import_b = Button("Import", light_color, text_color, xr_pos, y1_pos)
+    stats_b = Button("Stats", light_color, text_color, xr_pos, y2_pos)
+
+    # Remove Textboxes
+    remove_tb = Textbox("Remove", fc_y_mid)
+    add_tb = Textbox("Add", fc_y_mid)
+    import_tb = Textbox("File", fc_y_mid)
+    startup_times['window'] = time.perf_counter() - start
+
+# Reads the CSV in chunks of load_chunk_rows, updating load_progress
+#   usecols - only these columns are kept (None for all of them)
+def read_csv_chunks(usecols=None, progress=0.8):
+    global load_progress
+    csv_size = max(os.path.getsize(fc_csv_name), 1)
+    chunks = []
+    with open(fc_csv_name, 'rb') as csv_file:
+        for chunk in pd.read_csv(csv_file, usecols=usecols, chunksize=load_chunk_rows):
+            chunks.append(chunk)
+            load_progress = progress * csv_file.tell() / csv_size
+    if chunks:
+        return pd.concat(chunks, ignore_index=True)
+    return pd.read_csv(fc_csv_name, usecols=usecols)
+
+# Loads the flashcards - Binary Deck or CSV, then the indexes
+#   Run in the background while the Loading Screen is shown
+def load_deck():
+    global cards, deck, rows, columns, load_progress, save_worker, scheduler, side1_built
+    global side1_thread, history, search_index, deck_stats
+    start = time.perf_counter()
+    side1_built = False
+    side1_thread = None
+    prefetcher.clear()
+    media_cache.card_keys.clear()
+    layout_cache.clear()
+    if os.path.exists(fc_db_name):
+        deck = SqliteDeck(fc_db_name)
+        cards = deck.load_store()
+        startup_times['database open'] = time.perf_counter() - start
+    elif os.path.exists(fc_deck_name):
+        deck = DeckFile(fc_deck_name)
+        cards = deck.load_store()
+        startup_times['deck open'] = time.perf_counter() - start
+    else:
+        deck = None
+        cards = load_csv()
+        startup_times['CSV parse'] = time.perf_counter() - start
+    rows = cards.count
+    columns = len(cards.side_names) + 4
+    load_progress = 0.8
+    # Due Cache is built once - the Home Screen only checks its size
+    start = time.perf_counter()
+    build_due_cache()
+    if cards.text_source is None:
+        build_side1_index()
+    else:
+        start_side1_index()
+    scheduler = make_scheduler()
+    search_index = SearchIndex(cards)
+    deck_stats = DeckStats()
+    startup_times['indexes'] = time.perf_counter() - start
+    history = ReviewHistory(fc_history_name)
+    save_worker = SaveWorker()
+    load_progress = 1.0
+
+# Loads the CSV into a Card Store, then replays the Review Journal
+#   CSVs of lazy_side_bytes or more only keep the 4 score columns in memory,
+#   sides are read from the file when they are shown
+#   lazy - always leave the sides in the file
+def load_csv(lazy=False):
+    global load_progress
+    records = read_journal()
+    gaps = []
+    if records and records[0][0] == 'gaps':
+        gaps = [int(ind) for ind in records.pop(0)[1:]]
+    text_source = None
+    if lazy or os.path.getsize(fc_csv_name) >= lazy_side_bytes:
+        with open(fc_csv_name, newline='', encoding='utf-8') as csv_file:
+            header = next(csv.reader(csv_file))
+        offsets = scan_rows(fc_csv_name)
+        load_progress = 0.2
+        score_count = 9 if header[-5:] == schedule_names else 4
+        fc_set = read_csv_chunks(usecols=header[-score_count:])
+        # Rows pandas & the scan disagree on - keep everything in memory instead
+        if len(fc_set) == len(offsets) - 1:
+            text_source = CsvSides(fc_csv_name, header[:-score_count], offsets)
+        else:
+            fc_set = read_csv_chunks()
+    else:
+        fc_set = read_csv_chunks()
+    # Row ids skip the gaps, so journal records point at the same flashcards
+    size = len(fc_set) + len(gaps)
+    if gaps:
+        fc_set.index = np.setdiff1d(np.arange(size), gaps)
+        if text_source is not None:
+            text_source.ids = fc_set.index.to_numpy(dtype=np.int64)
+    store = CardStore.from_frame(fc_set, size, text_source)
+    apply_journal(store, records)
+    return store
+
+# Import - writes the CSV (and its Review Journal) into a new Binary Deck
+#   sqlite - into a new SQLite Deck instead
+def import_deck(sqlite=False):
+    deck_class, deck_name = (SqliteDeck, fc_db_name) if sqlite else (DeckFile, fc_deck_name)
+    start = time.perf_counter()
+    store = load_csv()
+    deck_class.create(deck_name, store)
+    print(f"Imported {store.count} flashcards from {fc_csv_name} into {deck_name} "
+          f"in {time.perf_counter() - start:.2f} s")
+
+# Export - writes the Binary Deck (or SQLite Deck) back into the CSV layout
+#   Any Review Journal belonged to the old CSV, so it is removed
+def export_deck(sqlite=False):
+    deck_class, deck_name = (SqliteDeck, fc_db_name) if sqlite else (DeckFile, fc_deck_name)
+    start = time.perf_counter()
+    deck_file = deck_class(deck_name)
+    store = deck_file.load_store()
+    temp_name = fc_csv_name + ".tmp"
+    store.write_csv(temp_name)
+    deck_file.close()
+    os.replace(temp_name, fc_csv_name)
+    # Removed flashcards are left out of the CSV - the Review History gets the new row ids
+    if store.count < store.size:
+        ReviewHistory(fc_history_name).close(store.alive[:store.size])
+    if os.path.exists(fc_journal_name):
+        os.remove(fc_journal_name)
+    print(f"Exported {store.count} flashcards from {deck_name} into {fc_csv_name} "
+          f"in {time.perf_counter() - start:.2f} s")
+
+# Bulk Import - adds every flashcard in a CSV, TSV or Anki text export at once
+#   Rows are read in chunks of bulk_chunk_rows and normalized in a process pool:
+#   Unicode NFC, repeated & surrounding whitespace removed, HTML removed (Anki)
+#   Rows without side1 & side2 are skipped, as are side1 already in the deck or
+#   earlier in the file - extra fields (i.e. Anki tags) are dropped, missing sides empty
+#   Flashcards are added to the Card Store in one go, then saved with a single write:
+#   the CSV is compacted (no journal record for each), the Binary Deck is rewritten
+bulk_chunk_rows = 20000
+bulk_workers = None             # Processes normalizing rows (None - one per CPU)
+bulk_pool_bytes = 1 << 20       # Smaller files are normalized without the process pool
+anki_separators = {'tab': '\t', 'comma': ',', 'semicolon': ';', 'space': ' ',
+                   'pipe': '|', 'colon': ':'}
+html_tag = re.compile(r'<[^>]*>')
+html_image = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+
+# Format of a file to import - from its name, and the header lines of Anki exports
+#   Returns delimiter, whether fields are HTML, columns which are not sides (Anki's
+#   notetype, deck, tags & guid columns) and the lines after the header
+def bulk_format(path, lines):
+    delimiter = ',' if path.lower().endswith('.csv') else '\t'
+    is_html = False
+    skip_cols = set()
+    line = next(lines, '')
+    while line.startswith('#') and ':' in line:
+        key, value = line[1:].rstrip('\r\n').split(':', 1)
+        key, value = key.strip().lower(), value.strip()
+        if key == 'separator':
+            delimiter = anki_separators.get(value.lower(), value[:1] or delimiter)
+        elif key == 'html':
+            is_html = value.lower() == 'true'
+        elif key.endswith(' column'):
+            skip_cols.add(int(value) - 1)
+        line = next(lines, '')
+    return delimiter, is_html, skip_cols, itertools.chain([line], lines)
+
+# Normalizes the text of one side
+def normalize_side(text, is_html):
+    if is_html:
+        # Anki images become Media Sides
+        text = html_image.sub(r'[image:\1]', text)
+        text = html.unescape(html_tag.sub('', text))
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+# Normalizes a chunk of rows - run in the process pool
+#   Returns the sides of the valid rows & the number of invalid rows
+def normalize_rows(fc_rows, side_count, is_html, skip_cols):
+    normalized = []
+    invalid = 0
+    for fields in fc_rows:
+        if not fields:
+            continue
+        sides = [normalize_side(field, is_html) for col, field in enumerate(fields)
+                 if col not in skip_cols][:side_count]
+        sides += [''] * (side_count - len(sides))
+        if sides[0] == '' or sides[min(1, side_count - 1)] == '':
+            invalid += 1
+        else:
+            normalized.append(sides)
+    return normalized, invalid
+
+# Normalized chunks in the order they were read
+#   pool - up to twice as many chunks as workers are normalized at once
+def normalize_chunks(chunks, args, pool=None, workers=1):
+    if pool is None:
+        for chunk in chunks:
+            yield normalize_rows(chunk, *args)
+        return
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(normalize_rows, chunk, *args))
+        if len(pending) > 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# Splits rows into chunks of bulk_chunk_rows
+def bulk_chunks(fc_rows):
+    while True:
+        chunk = list(itertools.islice(fc_rows, bulk_chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+# Imports a file into the open deck, updating load_progress
+#   Returns the number of flashcards added, duplicates, invalid rows & seconds taken
+def bulk_import(path):
+    global rows, load_progress
+    start = time.perf_counter()
+    side1_ready()
+    seen = set(side1_index)
+    side_count = len(cards.side_names)
+    new_rows = []
+    new_keys = []
+    duplicates = invalid = 0
+    file_size = max(os.path.getsize(path), 1)
+    workers = bulk_workers or os.cpu_count() or 1
+    pool = None
+    if file_size >= bulk_pool_bytes and workers > 1:
+        # Spawned, not forked - the game has other threads running
+        pool = ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'))
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as bulk_file:
+            delimiter, is_html, skip_cols, lines = bulk_format(path, bulk_file)
+            fc_rows = csv.reader(lines, delimiter=delimiter)
+            first = next(fc_rows, [])
+            # Header row - side1 in the first column
+            if first and side1_key(first[0]) != side1_key(cards.side_names[0]):
+                fc_rows = itertools.chain([first], fc_rows)
+            for normalized, bad in normalize_chunks(bulk_chunks(fc_rows),
+                                                    (side_count, is_html, skip_cols),
+                                                    pool, workers):
+                invalid += bad
+                for sides in normalized:
+                    key = sides[0].casefold()
+                    if key in seen:
+                        duplicates += 1
+                    else:
+                        seen.add(key)
+                        new_rows.append(sides)
+                        new_keys.append(key)
+                load_progress = 0.8 * bulk_file.buffer.tell() / file_size
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    ids = cards.extend(new_rows, today_format)
+    index_side1_keys(new_keys, ids.tolist())
+    search_index.add(ids)
+    deck_stats.add(ids)
+    for fc_index in ids.tolist():
+        scheduler.added(fc_index)
+    # Flashcards which have never been tested are always due
+    due_set.update(ids.tolist())
+    rows = cards.count
+    load_progress = 0.9
+    if len(ids):
+        if deck is not None:
+            deck.extend(cards)
+        else:
+            save_worker.save(cards.snapshot())
+    load_progress = 1.0
+    return len(ids), duplicates, invalid, time.perf_counter() - start
+
+# Bulk Import result as text
+def bulk_report(result):
+    added, duplicates, invalid, seconds = result
+    return (f"Imported {added} flashcards ({duplicates} duplicates, {invalid} invalid) "
+            f"in {seconds:.2f} s - {added / max(seconds, 1e-9):.0f} cards/sec")
+
+# Bulk Export - writes the sides of every flashcard (without scores) as a CSV, or as
+# tab separated text (.tsv / .txt) which Anki can import
+def bulk_export(path):
+    start = time.perf_counter()
+    ids = cards.ids()
+    with open(path, 'w', newline='', encoding='utf-8') as bulk_file:
+        if path.lower().endswith('.csv'):
+            writer = csv.writer(bulk_file)
+            writer.writerow(cards.side_names)
+        else:
+            writer = csv.writer(bulk_file, delimiter='\t')
+        for chunk in range(0, len(ids), bulk_chunk_rows):
+            writer.writerows(cards.side_rows(ids[chunk:chunk + bulk_chunk_rows]))
+    seconds = time.perf_counter() - start
+    print(f"Exported {len(ids)} flashcards to {path} in {seconds:.2f} s - "
+          f"{len(ids) / max(seconds, 1e-9):.0f} cards/sec")
+
+# Deck Library - every deck in library_dir, listed without loading them
+#   A deck is name.csv (with its Review Journal) and/or name.deck (Binary Deck)
+#   Manifest - library_manifest_name in library_dir keeps the number of flashcards
+#   in each deck & the days they become due, with the size & modified time of the
+#   deck's files - only new or changed decks are read when the library is scanned
+#   Opened decks stay in memory (their globals are saved in open_decks) until they
+#   use more than library_max_bytes, then the least recently opened are closed
+library_dir = None              # None - only fc_csv_name is used, without a library
+library_manifest_name = "library.json"
+library_max_bytes = 256 << 20   # 256 MB
+library = {}                    # Deck name to its manifest entry
+open_decks = OrderedDict()      # Deck name to its saved globals, most recently opened last
+open_deck_name = None           # Deck the globals currently belong to
+deck_globals = ['fc_csv_name', 'fc_journal_name', 'fc_history_name', 'fc_deck_name',
+                'fc_db_name', 'cards',
+                'deck', 'rows', 'columns', 'due_set', 'due_day', 'side1_index', 'side1_keys',
+                'side1_built', 'side1_thread', 'search_index', 'deck_stats', 'scheduler',
+                'history', 'save_worker']
+
+# Points the file names at a deck in the library
+def use_deck_files(name):
+    global fc_csv_name, fc_journal_name, fc_history_name, fc_deck_name, fc_db_name
+    fc_csv_name = os.path.join(library_dir, name + ".csv")
+    fc_journal_name = fc_csv_name + ".journal"
+    fc_history_name = fc_csv_name + ".history"
+    fc_deck_name = os.path.join(library_dir, name + ".deck")
+    fc_db_name = os.path.join(library_dir, name + ".db")
+
+# Size & modified time of each of a deck's files (0 if the file does not exist)
+def deck_stamp(name):
+    stamp = []
+    for ext in (".csv", ".csv.journal", ".deck", ".db"):
+        path = os.path.join(library_dir, name + ext)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamp += [stat.st_size, stat.st_mtime_ns]
+        else:
+            stamp += [0, 0]
+    return stamp
+
+# Manifest entry for a deck - number of flashcards & how many become due on each day
+#   SM-2 - new flashcards are counted on their own
+def deck_entry(name, store):
+    ids = store.ids()
+    due = due_cache_days(store, ids)
+    new = 0
+    if scheduler_name == 'sm2':
+        new = int(np.count_nonzero(store.due_date[ids] == no_date))
+    due = due[due != never_due]
+    days, counts = np.unique(due, return_counts=True)
+    return {'stamp': deck_stamp(name), 'scheduler': scheduler_name, 'cards': store.count,
+            'due': [days.tolist(), counts.tolist()], 'new': new}
+
+# Flashcards due today in a deck, from its manifest entry
+#   SM-2 - at most sm2_new_per_day of the new flashcards are counted
+def due_count(entry):
+    days, counts = entry['due']
+    due = sum(counts[:bisect.bisect_right(days, today_day)])
+    return due + min(entry['new'], sm2_new_per_day)
+
+# Reads a deck which is not in the manifest (or has changed) to make its entry
+#   CSV sides are left in the file, only the scores are needed
+def read_deck_entry(name):
+    use_deck_files(name)
+    if os.path.exists(fc_db_name):
+        # Closed first - the WAL is written back into the database when it closes
+        deck_file = SqliteDeck(fc_db_name)
+        store = deck_file.load_store()
+        deck_file.close()
+        entry = deck_entry(name, store)
+    elif os.path.exists(fc_deck_name):
+        deck_file = DeckFile(fc_deck_name)
+        entry = deck_entry(name, deck_file.load_store())
+        deck_file.close()
+    else:
+        store = load_csv(lazy=True)
+        if store.text_source is not None:
+            store.text_source.close()
+        entry = deck_entry(name, store)
+    return entry
+
+# Finds every deck in library_dir, reading only those the manifest doesn't match
+def scan_library():
+    global load_progress
+    manifest_name = os.path.join(library_dir, library_manifest_name)
+    manifest = {}
+    if os.path.exists(manifest_name):
+        with open(manifest_name, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    names = sorted({os.path.splitext(file_name)[0] for file_name in os.listdir(library_dir)
+                    if file_name.endswith((".csv", ".deck", ".db"))})
+    for num, name in enumerate(names):
+        entry = manifest.get(name)
+        if (entry is None or entry['stamp'] != deck_stamp(name) or
+                entry['scheduler'] != scheduler_name):
+            entry = read_deck_entry(name)
+        library[name] = entry
+        load_progress = (num + 1) / len(names)
+    write_manifest()
+
+# Writes the manifest - to a temporary file first, then renamed over the old one
+def write_manifest():
+    manifest_name = os.path.join(library_dir, library_manifest_name)
+    with open(manifest_name + ".tmp", 'w', encoding='utf-8') as manifest_file:
+        json.dump(library, manifest_file)
+    os.replace(manifest_name + ".tmp", manifest_name)
+
+# Saves the globals of the open deck (so another deck can be opened) & updates its entry
+def stash_deck():
+    if open_deck_name is not None:
+        open_decks[open_deck_name] = {name: globals()[name] for name in deck_globals}
+        library[open_deck_name] = deck_entry(open_deck_name, cards)
+
+# Switches the globals over to a deck which is still in memory
+def restore_deck(name):
+    global open_deck_name
+    globals().update(open_decks[name])
+    open_decks.move_to_end(name)
+    prefetcher.clear()
+    media_cache.card_keys.clear()
+    layout_cache.clear()
+    open_deck_name = name
+
+# Loads a deck from the library - run in the background by the Loading Screen
+def load_library_deck(name):
+    global open_deck_name
+    use_deck_files(name)
+    load_deck()
+    search_index.start()
+    open_deck_name = name
+    stash_deck()
+    evict_decks()
+
+# Closes the least recently opened decks until the rest fit in library_max_bytes
+#   The open deck is always kept
+def evict_decks():
+    sizes = {name: saved['cards'].nbytes() for name, saved in open_decks.items()}
+    total = sum(sizes.values())
+    while total > library_max_bytes and len(open_decks) > 1:
+        name, saved = open_decks.popitem(last=False)
+        close_library_deck(name, saved)
+        total -= sizes[name]
+
+# Writes back & closes a deck which is no longer in memory, then updates its entry
+def close_library_deck(name, saved):
+    saved['save_worker'].close()
+    library[name] = deck_entry(name, saved['cards'])
+
+# Closes every deck in memory & writes the manifest - when the game closes
+def close_library():
+    stash_deck()
+    while open_decks:
+        close_library_deck(*open_decks.popitem(last=False))
+    write_manifest()
+
+# Runs load_deck() (or load) in the background - errors are passed back to the
+# Loading Screen
+def load_deck_thread(load=load_deck):
+    global load_error
+    try:
+        load()
+    except Exception as error:
+        load_error = error
+    deck_loaded.set()
+
+# Loading Screen - progress bar while load_deck() (or a Bulk Import) runs
+def draw_loading(text="Loading Flashcards"):
+    screen.fill(bg_color)
+    top_text(text)
+    bar = pygame.Rect(tb_x_pos, fc_y_mid, tb_width, tb_height / 2)
+    pygame.draw.rect(screen, light_color, bar, border_radius=fc_radius)
+    bar.width = max(1, int(tb_width * load_progress))
+    pygame.draw.rect(screen, comp_1, bar, border_radius=fc_radius)
+
+# Startup Report - time taken by each startup phase as text
+def startup_report():
+    return "Startup: " + ", ".join(f"{phase} {seconds * 1000:.0f} ms"
+                                   for phase, seconds in startup_times.items())
+
+# Opens the window, loads the flashcards and runs the Start Screen
+def main():
+    global gameOn
+    main_start = time.perf_counter()
+    init_fonts()
+    init_screen()
+    draw_loading()
     pygame.display.flip()
+    startup_times['first frame'] = time.perf_counter() - main_start
+    # Deck Library - only the manifest is read until a deck is opened
+    load = load_deck if library_dir is None else scan_library
+    threading.Thread(target=load_deck_thread, args=(load,), daemon=True).start()
+    # Loading Screen
+    while gameOn and not deck_loaded.is_set():
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                gameOn = False
+        draw_loading()
+        pygame.display.flip()
+        clock.tick(fps_cap)
+    if load_error is not None:
+        raise load_error
+    if not gameOn:
+        return
+    print(startup_report())
+
+    # Game loop - Start Screen
+    if library_dir is None:
+        search_index.start()
+        run_screens(HomeScreen())
+    else:
+        run_screens(LibraryScreen())
+
+    # Writes all changes back into the CSV on exit
+    profiler.close()
+    if library_dir is None:
+        close_deck()
+    else:
+        # A deck may still be loading
+        deck_loaded.wait()
+        close_library()
+    media_cache.close()
+
+
+startup_times['import'] = time.perf_counter() - import_start
+
+# python flashcards_pygame.py [import [sqlite] | export [sqlite] | library [directory] |
+#                               bulk file | bulk-export file | history |
+#                               study [filter ...] [file | random | weighted]]
+#   import - flashcards.csv into flashcards.deck (flashcards.db with sqlite)
+#   export - flashcards.deck (flashcards.db with sqlite) into flashcards.csv
+#   library - Deck Library of the decks in directory (the current directory by default)
+#   bulk - Bulk Import of a CSV, TSV or Anki text file into the deck
+#   bulk-export - sides of every flashcard into a CSV, or tab separated text
+#   history - accuracy of the last days & slowest flashcards from the Review History
+#   study - plays with session_filters & session_order, e.g. study "side5 = verb" random
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['import'] and sys.argv[2:] in ([], ['sqlite']):
+        import_deck(sys.argv[2:] == ['sqlite'])
+    elif sys.argv[1:2] == ['export'] and sys.argv[2:] in ([], ['sqlite']):
+        export_deck(sys.argv[2:] == ['sqlite'])
+    elif len(sys.argv) == 3 and sys.argv[1] in ('bulk', 'bulk-export'):
+        load_deck()
+        if sys.argv[1] == 'bulk':
+            print(bulk_report(bulk_import(sys.argv[2])))
+        else:
+            bulk_export(sys.argv[2])
+        close_deck()
+    elif sys.argv[1:] == ['history']:
+        load_deck()
+        print(history_report(history.events()))
+        close_deck()
+    elif sys.argv[1:2] == ['study']:
+        for arg in sys.argv[2:]:
+            if arg in session_orders:
+                session_order = arg
+            else:
+                parse_filter(arg)
+                session_filters.append(arg)
+        main()
+    elif sys.argv[1:2] == ['library']:
+        library_dir = sys.argv[2] if len(sys.argv) > 2 else '.'
+        main()
+    else:
+        main()
@@ -0,0 +1,208 @@
+# Tests for the ways the Flashcard Tester saves flashcards - run with pytest
+#   python -m pytest test_persistence.py
+# Notes:
+#   Every test works on a copy of flashcards.csv in a temporary directory,
+#   the real deck is never written to
+#   Uses SDL's dummy video driver so no window is needed
+
+import os
+import shutil
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pandas as pd
+import pytest
+import flashcards_pygame as fcp
+
+example_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flashcards.csv")
+
+
+# Points the deck's file names at a copy of the example deck in tmp_path
+@pytest.fixture
+def deck_files(tmp_path, monkeypatch):
+    csv_name = str(tmp_path / "flashcards.csv")
+    shutil.copy(example_csv, csv_name)
+    monkeypatch.setattr(fcp, "fc_csv_name", csv_name)
+    monkeypatch.setattr(fcp, "fc_journal_name", csv_name + ".journal")
+    monkeypatch.setattr(fcp, "fc_history_name", csv_name + ".history")
+    monkeypatch.setattr(fcp, "fc_deck_name", str(tmp_path / "flashcards.deck"))
+    monkeypatch.setattr(fcp, "fc_db_name", str(tmp_path / "flashcards.db"))
+    monkeypatch.setattr(fcp, "scheduler_name", "threshold")
+    return tmp_path
+
+
+# Save Worker for a Card Store, as load_deck() starts it
+def start_worker(monkeypatch, store):
+    monkeypatch.setattr(fcp, "deck", None)
+    monkeypatch.setattr(fcp, "cards", store)
+    monkeypatch.setattr(fcp, "history", fcp.ReviewHistory(fcp.fc_history_name))
+    return fcp.SaveWorker()
+
+
+# Journal record for the scores of a flashcard, as journal_card() writes it
+def set_record(fc_index, correct, incorrect):
+    return ["set", fc_index, correct, incorrect, True, fcp.today_format]
+
+
+def test_journal_replay_ignores_truncated_last_record(deck_files, monkeypatch):
+    worker = start_worker(monkeypatch, fcp.load_csv())
+    worker.write(set_record(1, 7, 1))
+    worker.write(["add", "bird", "とり", "tori", "鳥", "noun", 0, 0, False, fcp.today_format])
+    worker.write(set_record(2, 9, 9))
+    worker.stop()
+    # Crash partway through writing the last record
+    with open(fcp.fc_journal_name, "rb+") as journal:
+        journal.truncate(os.path.getsize(fcp.fc_journal_name) - 8)
+
+    store = fcp.load_csv()
+    assert (store.correct[1], store.incorrect[1]) == (7, 1)
+    assert store.count == 11
+    assert store.side(10, 0) == "bird"
+    # The truncated record is dropped, the flashcard keeps its CSV scores
+    assert (store.correct[2], store.incorrect[2]) == (4, 1)
+
+    # Records written after the crash start on a line of their own
+    worker = start_worker(monkeypatch, store)
+    worker.write(set_record(5, 6, 2))
+    worker.stop()
+    store = fcp.load_csv()
+    assert (store.correct[5], store.incorrect[5]) == (6, 2)
+    assert store.count == 11
+
+
+def test_journal_is_ignored_once_compacted(deck_files, monkeypatch):
+    store = fcp.load_csv()
+    worker = start_worker(monkeypatch, store)
+    store.set_scores(3, [5, 5, False, fcp.today_format])
+    worker.write(set_record(3, 5, 5))
+    worker.stop(store.snapshot())
+
+    assert not os.path.exists(fcp.fc_journal_name)
+    assert pd.read_csv(fcp.fc_csv_name)["correct"][3] == 5
+    assert fcp.load_csv().correct[3] == 5
+
+
+def test_gaps_record_keeps_row_ids_after_compaction(deck_files, monkeypatch):
+    store = fcp.load_csv()
+    worker = start_worker(monkeypatch, store)
+    store.remove(3)
+    worker.write(["del", 3])
+    # Compacted while the game is still running - the CSV no longer has row 3
+    worker.save(store.snapshot())
+    worker.write(set_record(7, 11, 2))
+    worker.stop()
+
+    assert len(pd.read_csv(fcp.fc_csv_name)) == 9
+    store = fcp.load_csv()
+    assert store.size == 10 and store.count == 9
+    assert not store.alive[3]
+    # Row ids after the removed flashcard still point at the same flashcards
+    assert store.side(7, 0) == "great"
+    assert (store.correct[7], store.incorrect[7]) == (11, 2)
+    assert store.side(9, 0) == "delicious"
+
+
+def test_history_close_remaps_row_ids(deck_files):
+    history = fcp.ReviewHistory(fcp.fc_history_name)
+    for fc_index in range(5):
+        history.record(fc_index, 1, 0.5, 1.0)
+    history.flush()
+    history.record(4, 0, 0.5, 1.0)
+    # Row ids 1 & 3 were removed, so 2 becomes 1 and 4 becomes 2
+    alive = np.array([True, False, True, False, True])
+    history.close(alive)
+
+    events = fcp.read_history(fcp.fc_history_name)
+    assert events["card"].tolist() == [0, -1, 1, -1, 2, 2]
+    assert events["outcome"].tolist() == [1, 1, 1, 1, 1, 0]
+
+
+def test_history_blocks_queued_on_save_worker(deck_files, monkeypatch):
+    worker = start_worker(monkeypatch, fcp.load_csv())
+    history = fcp.history
+    for fc_index in range(fcp.history_batch + 3):
+        history.record(fc_index % 10, 1)
+    assert len(history.events()["card"]) == fcp.history_batch + 3
+    worker.close()
+
+    events = fcp.read_history(fcp.fc_history_name)
+    assert len(events["card"]) == fcp.history_batch + 3
+
+
+# Scores, schedule & sides of every flashcard which has not been removed
+def deck_values(store):
+    return store.to_frame().astype(str).values.tolist()
+
+
+def test_deck_file_round_trip(deck_files):
+    store = fcp.load_csv()
+    fcp.DeckFile.create(fcp.fc_deck_name, store)
+    deck_file = fcp.DeckFile(fcp.fc_deck_name)
+    loaded = deck_file.load_store()
+    assert deck_values(loaded) == deck_values(store)
+
+    loaded.correct[2] = 42
+    deck_file.write_card(loaded, 2)
+    loaded.remove(5)
+    deck_file.write_card(loaded, 5)
+    expected = deck_values(loaded)
+    deck_file.close()
+
+    reopened = fcp.DeckFile(fcp.fc_deck_name)
+    assert deck_values(reopened.load_store()) == expected
+    reopened.close()
+
+
+def test_deck_file_append_past_capacity(deck_files):
+    fcp.DeckFile.create(fcp.fc_deck_name, fcp.load_csv())
+    deck_file = fcp.DeckFile(fcp.fc_deck_name)
+    store = deck_file.load_store()
+    capacity = deck_file.capacity
+    for num in range(capacity * 2):
+        fc_index = store.append(["side" + str(num), "two", "", "", "", num, 1, True,
+                                 fcp.today_format])
+        deck_file.append(store, fc_index)
+    # Many at once, as the Bulk Import adds them
+    store.extend([["bulk" + str(num), "two", "", "", ""] for num in range(100)])
+    deck_file.extend(store)
+    assert deck_file.capacity > capacity
+    expected = deck_values(store)
+    deck_file.close()
+
+    reopened = fcp.DeckFile(fcp.fc_deck_name)
+    loaded = reopened.load_store()
+    assert loaded.size == store.size
+    assert deck_values(loaded) == expected
+    assert loaded.side(10 + capacity, 0) == "side" + str(capacity)
+    reopened.close()
+
+
+def test_csv_to_sqlite_migration(deck_files, monkeypatch):
+    worker = start_worker(monkeypatch, fcp.load_csv())
+    worker.write(set_record(0, 3, 1))
+    worker.write(["del", 4])
+    worker.stop()
+    store = fcp.load_csv()
+    # Databases always have the Schedule Columns
+    store.init_schedule()
+
+    fcp.import_deck(sqlite=True)
+    db = fcp.SqliteDeck(fcp.fc_db_name)
+    loaded = db.load_store()
+    assert loaded.size == store.size and loaded.count == 9
+    assert deck_values(loaded) == deck_values(store)
+    assert db.find_side1("chair") == 2
+    assert db.find_side1("to eat") is None
+    # next_due finds the same flashcards as the Daily Review rules
+    ids = store.ids()
+    due = fcp.due_mask(store.correct[ids], store.incorrect[ids], store.dates(ids),
+                       np.datetime64(fcp.today.date(), "D"))
+    assert sorted(db.due_ids(fcp.today_day).tolist()) == ids[due].tolist()
+    db.close()
+
+    # Back into the CSV, without the removed flashcard
+    fcp.export_deck(sqlite=True)
+    exported = fcp.load_csv()
+    assert exported.count == 9
+    assert deck_values(exported) == deck_values(store)